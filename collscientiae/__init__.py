@@ -2,4 +2,12 @@ from __future__ import absolute_import
 
 __version__ = "0.0.1"
 
-from .collscientiae import CollScientiae
+
+def __getattr__(name):
+    # the main class is imported on first access, such that quick commands
+    # (see :mod:`.cli`) do not import Jinja2, Markdown and PyYAML
+    if name == "CollScientiae":
+        from .collscientiae import CollScientiae
+        globals()[name] = CollScientiae
+        return CollScientiae
+    raise AttributeError("module '%s' has no attribute '%s'" % (__name__, name))
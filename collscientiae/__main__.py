@@ -0,0 +1,6 @@
+from __future__ import absolute_import
+import sys
+
+from .cli import main
+
+sys.exit(main())
@@ -0,0 +1,150 @@
+# -*- coding: utf8 -*-
+"""
+Packed output: all pages and files of a build are stored in one SQLite file,
+instead of a directory tree, see :meth:`.CollScientiae.pack`.
+
+The :class:`.PageStore` is updated incrementally, i.e. only changed entries are written
+and entries which are not part of the build anymore are removed.
+:class:`.PageStoreApp` is a small WSGI application serving the pages from such a file.
+"""
+from __future__ import absolute_import, unicode_literals
+import hashlib
+import sqlite3
+from os.path import relpath, sep
+from .render import OutputRenderer
+
+SCHEMA = "CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, hash TEXT, data BLOB)"
+
+
+class PageStore(object):
+
+    """
+    Maps urls (relative to the root of the site, e.g. "alpha/intro.html")
+    to the content of the page or file and its hash.
+    """
+
+    def __init__(self, fn):
+        self.fn = fn
+        # the build happens in another thread than the setup
+        self.conn = sqlite3.connect(fn, check_same_thread=False)
+        self.conn.execute(SCHEMA)
+        self.hashes = None
+        self.seen = None
+        self.prefixes = None
+        self.written = self.unchanged = 0
+
+    def begin(self, prefixes=None):
+        """
+        Starts an update. Afterwards, :meth:`.finish` removes all entries,
+        which were not put in the meantime.
+
+        :param prefixes: if given, only the entries with these prefixes are removed,
+                         e.g. "alpha" for "alpha/intro.html" or "index.html".
+        """
+        self.hashes = dict(self.conn.execute("SELECT url, hash FROM pages"))
+        self.seen = set()
+        self.prefixes = prefixes
+        self.written = self.unchanged = 0
+
+    def put(self, url, data):
+        h = hashlib.sha1(data).hexdigest()
+        self.seen.add(url)
+        if self.hashes.get(url) == h:
+            self.unchanged += 1
+            return
+        self.conn.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?)",
+                          (url, h, sqlite3.Binary(data)))
+        self.hashes[url] = h
+        self.written += 1
+
+    def get(self, url):
+        """
+        Returns the content and the hash of the page or None, if it does not exist.
+        """
+        row = self.conn.execute("SELECT data, hash FROM pages WHERE url = ?", (url,)).fetchone()
+        return None if row is None else (bytes(row[0]), row[1])
+
+    def stale(self, url):
+        if url in self.seen:
+            return False
+        if self.prefixes is None:
+            return True
+        return any(url == p or url.startswith(p + "/") for p in self.prefixes)
+
+    def finish(self):
+        """
+        Removes the stale entries, commits the update and returns its statistics.
+        """
+        removed = [url for url in self.hashes if self.stale(url)]
+        self.conn.executemany("DELETE FROM pages WHERE url = ?", ((_,) for _ in removed))
+        self.conn.commit()
+        return {"written": self.written, "unchanged": self.unchanged, "removed": len(removed)}
+
+    def close(self):
+        self.conn.close()
+
+
+class PackedRenderer(OutputRenderer):
+
+    """
+    Renders into the :class:`.PageStore` of the :class:`.CollScientiae` instance.
+    The target directory only serves as the root for computing the urls.
+    """
+
+    # the pages are rendered and stored in the same thread
+    writer_threads = 0
+
+    def url(self, target_fn):
+        return relpath(target_fn, self.cs.targ).replace(sep, "/")
+
+    def make_dirs(self, path):
+        pass
+
+    def copy_file(self, src_fn, target_fn):
+        self.cs.store.put(self.url(target_fn), self.cs.source.read_bytes(src_fn))
+
+    def write_data(self, target_fn, data):
+        self.cs.store.put(self.url(target_fn), data)
+
+    def render_template(self, template_fn, target_fn, **data):
+        html = self.render_page(template_fn, **data).encode("utf-8") + b"\n"
+        self.cs.store.put(self.url(target_fn), html)
+        self.cs.events.count(pages=1, bytes=len(html))
+
+
+class PageStoreApp(object):
+
+    """
+    WSGI application, serving the pages of the :class:`.PageStore` in the file `fn`.
+    """
+
+    def __init__(self, fn):
+        self.store = PageStore(fn)
+
+    def __call__(self, environ, start_response):
+        from mimetypes import guess_type
+        url = environ.get("PATH_INFO", "").lstrip("/")
+        if url == "" or url.endswith("/"):
+            url += "index.html"
+        page = self.store.get(url)
+        if page is None:
+            start_response("404 Not Found", [("Content-Type", "text/plain")])
+            return [b"not found"]
+        data, h = page
+        etag = '"%s"' % h
+        if environ.get("HTTP_IF_NONE_MATCH") == etag:
+            start_response("304 Not Modified", [("ETag", etag)])
+            return []
+        start_response("200 OK", [("Content-Type", guess_type(url)[0] or "application/octet-stream"),
+                                  ("Content-Length", str(len(data))),
+                                  ("ETag", etag)])
+        return [data]
+
+
+if __name__ == "__main__":
+    import sys
+    from wsgiref.simple_server import make_server
+
+    assert 2 <= len(sys.argv) <= 3, "Need the page store file and optionally the port number."
+    port = int(sys.argv[2]) if len(sys.argv) == 3 else 8000
+    make_server("localhost", port, PageStoreApp(sys.argv[1])).serve_forever()
@@ -0,0 +1,43 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+from .archive import PageStore, PageStoreApp
+
+
+def test_page_store_incremental(tmpdir):
+    fn = str(tmpdir.join("site.db"))
+    store = PageStore(fn)
+    store.begin()
+    for url in ["index.html", "alpha/a.html", "beta/b.html"]:
+        store.put(url, url.encode("utf-8"))
+    assert store.finish() == {"written": 3, "unchanged": 0, "removed": 0}
+
+    # partial update of "alpha": "beta" is kept, although it is not put again
+    store.begin(["alpha", "index.html"])
+    store.put("index.html", b"index.html")
+    store.put("alpha/c.html", b"c")
+    assert store.finish() == {"written": 1, "unchanged": 1, "removed": 1}
+    assert store.get("alpha/a.html") is None
+    assert store.get("beta/b.html")[0] == b"beta/b.html"
+    store.close()
+
+
+def test_page_store_app(tmpdir):
+    fn = str(tmpdir.join("site.db"))
+    store = PageStore(fn)
+    store.begin()
+    store.put("index.html", b"<html/>")
+    store.finish()
+    store.close()
+
+    app = PageStoreApp(fn)
+    responses = []
+    body = app({"PATH_INFO": "/"}, lambda status, headers: responses.append((status, dict(headers))))
+    assert body == [b"<html/>"]
+    status, headers = responses[-1]
+    assert status == "200 OK" and headers["Content-Type"] == "text/html"
+    app({"PATH_INFO": "/", "HTTP_IF_NONE_MATCH": headers["ETag"]},
+        lambda status, headers: responses.append((status, dict(headers))))
+    assert responses[-1][0] == "304 Not Modified"
+    app({"PATH_INFO": "/x.html"}, lambda status, headers: responses.append((status, dict(headers))))
+    assert responses[-1][0] == "404 Not Found"
@@ -0,0 +1,135 @@
+# -*- coding: utf8 -*-
+"""
+Bundling of the CSS and JS files in the `static` directories of the theme and of each module.
+
+All CSS (JS) files of one `static` directory are concatenated in the order of their paths,
+minified and written as `bundle.<hash>.css` (`bundle.<hash>.js`) into that directory.
+Minifying JS needs the optional `rjsmin` package, which tokenizes the code (e.g. strings,
+template literals and regular expressions), otherwise the JS files are only concatenated.
+The hash is computed from the contents of the bundled files, hence the bundles can be
+cached by browsers for a long time. The templates get the names via the `assets` global,
+e.g. ``{{ assets["static/bundle.css"]|prefix }}`` or ``assets["alpha/static/bundle.js"]``.
+"""
+from __future__ import absolute_import, unicode_literals
+import codecs
+import hashlib
+import re
+from os import rename
+from os.path import join, relpath, sep, exists, splitext, dirname
+from .utils import ensure_dir, get_markdown
+
+try:
+    from rjsmin import jsmin, __version__ as jsmin_version
+except ImportError:
+    jsmin = jsmin_version = None
+
+# changes of the minifiers must change the hashes
+VERSION = "2"
+
+_css_tokens = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|/\*.*?\*/', re.S)
+# the colon of a declaration, but not of a selector like "a :hover"
+_css_colon = re.compile(r" ?: ?(?=[^{};]*[;}])")
+_css_url = re.compile(r'url\(\s*([\'"]?)(?![\'"]?(?:[a-z]+:|/|#))([^\'")]+)\1\s*\)')
+
+
+def _minify_css_text(text):
+    text = re.sub(r"\s+", " ", text)
+    text = re.sub(r" ?([{};,>]) ?", r"\1", text)
+    text = _css_colon.sub(":", text)
+    text = text.replace(": ", ":")
+    return text.replace(";}", "}")
+
+
+def minify_css(source):
+    """
+    Removes comments and superfluous whitespace, strings are kept as they are.
+    """
+    strings = []
+
+    def placeholder(m):
+        if m.group().startswith("/*"):
+            return ""
+        strings.append(m.group())
+        return "\0%d\0" % (len(strings) - 1)
+
+    text = _minify_css_text(_css_tokens.sub(placeholder, source))
+    return re.sub(r"\0(\d+)\0", lambda m: strings[int(m.group(1))], text).strip()
+
+
+def rebase_css_urls(source, directory):
+    """
+    Relative urls in a CSS file from a subdirectory must be prefixed with its
+    `directory`, because the bundle is in the `static` directory.
+    """
+    if directory == ".":
+        return source
+    prefix = directory.replace(sep, "/") + "/"
+    return _css_url.sub(lambda m: "url(%s%s%s%s)" % (m.group(1), prefix, m.group(2), m.group(1)),
+                        source)
+
+
+class AssetBundler(object):
+
+    """
+    Builds the bundles of `static` directories. The minified bundles are cached in
+    `cache_dir` by the hash of their sources, i.e. unchanged bundles are not built again.
+    """
+
+    # None, if the files are only concatenated
+    minifiers = {".css": minify_css, ".js": jsmin}
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.built = 0
+        self.cached = 0
+
+    @staticmethod
+    def sources(static_dir, filenames, ext):
+        """
+        The paths of the files with the extension `ext`, relative to the `static_dir`.
+        `filenames` are pairs of the directory and the name of the files.
+        """
+        return sorted(relpath(join(path, fn), static_dir) for path, fn in filenames
+                      if splitext(fn)[1] == ext)
+
+    def bundle(self, static_dir, filenames, read=None):
+        """
+        Returns a list of (name, hashed name, cached file) for the CSS and JS bundles
+        of the given files in `static_dir`, e.g. ("bundle.css", "bundle.0a1b2c3d4e.css", ...).
+
+        :param read: reads a file and returns its content, see :meth:`.FileSource.read`
+        """
+        read = read or get_markdown
+        bundles = []
+        for ext in sorted(self.minifiers):
+            sources = self.sources(static_dir, filenames, ext)
+            if len(sources) == 0:
+                continue
+            contents = []
+            h = hashlib.sha1(VERSION.encode("utf-8"))
+            if ext == ".js":
+                # installing or upgrading rjsmin changes the JS bundles
+                h.update(str(jsmin_version).encode("utf-8"))
+            for fn in sources:
+                content = read(join(static_dir, fn))
+                if ext == ".css":
+                    content = rebase_css_urls(content, dirname(fn) or ".")
+                h.update(fn.encode("utf-8"))
+                h.update(content.encode("utf-8"))
+                contents.append(content)
+            key = h.hexdigest()
+            cache_fn = join(self.cache_dir, key + ext)
+            if exists(cache_fn):
+                self.cached += 1
+            else:
+                # JS files are separated by ';' in case one does not end with a semicolon
+                joined = (";\n" if ext == ".js" else "\n").join(contents)
+                tmp_fn = cache_fn + ".tmp"
+                ensure_dir(self.cache_dir)
+                minify = self.minifiers[ext]
+                with codecs.open(tmp_fn, "w", "utf8") as f:
+                    f.write(joined if minify is None else minify(joined))
+                rename(tmp_fn, cache_fn)
+                self.built += 1
+            bundles.append(("bundle" + ext, "bundle.%s%s" % (key[:10], ext), cache_fn))
+        return bundles
@@ -0,0 +1,50 @@
+# coding=utf-8
+from __future__ import absolute_import
+import pytest
+
+from .assets import AssetBundler, minify_css, rebase_css_urls
+
+
+def test_minify_css():
+    css = "/* comment */\na > b ,  c {\n  color : red;\n  content: \" /* ; */ \";\n}\n"
+    assert minify_css(css) == 'a>b,c{color:red;content:" /* ; */ "}'
+    assert minify_css("a :hover { color : red }") == "a :hover{color:red}"
+
+
+def test_rebase_css_urls():
+    css = "a{background:url('x.png')} b{background:url(/y.png)} c{background:url(data:abc)}"
+    assert rebase_css_urls(css, "sub") == \
+        "a{background:url('sub/x.png')} b{background:url(/y.png)} c{background:url(data:abc)}"
+
+
+def test_bundle_cached(tmpdir):
+    static = tmpdir.mkdir("static")
+    static.join("b.css").write("b { color: red; }")
+    static.join("a.css").write("a { color: blue; }")
+    files = [(str(static), "a.css"), (str(static), "b.css")]
+    bundler = AssetBundler(str(tmpdir.join("cache")))
+    [(name, hashed_name, cache_fn)] = bundler.bundle(str(static), files)
+    assert name == "bundle.css" and hashed_name.startswith("bundle.")
+    with open(cache_fn) as f:
+        assert f.read() == "a{color:blue}b{color:red}"
+    assert bundler.bundle(str(static), files)[0][1] == hashed_name
+    assert (bundler.built, bundler.cached) == (1, 1)
+    static.join("b.css").write("b { color: green; }")
+    assert bundler.bundle(str(static), files)[0][1] != hashed_name
+
+
+def test_bundle_js(tmpdir):
+    static = tmpdir.mkdir("static")
+    static.join("a.js").write("var a = 1")
+    static.join("b.js").write("function f() {\n    // comment\n    return `x\n    // y`;\n}\n")
+    files = [(str(static), "a.js"), (str(static), "b.js")]
+    bundler = AssetBundler(str(tmpdir.join("cache")))
+    bundler.minifiers = dict(bundler.minifiers, **{".js": None})
+    [(_, _, cache_fn)] = bundler.bundle(str(static), files)
+    with open(cache_fn) as f:
+        assert f.read() == "var a = 1;\n" + static.join("b.js").read()
+    pytest.importorskip("rjsmin")
+    bundler = AssetBundler(str(tmpdir.join("minified")))
+    [(_, _, cache_fn)] = bundler.bundle(str(static), files)
+    with open(cache_fn) as f:
+        assert f.read() == "var a=1;function f(){return`x\n    // y`;}"
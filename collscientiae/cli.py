@@ -0,0 +1,268 @@
+# -*- coding: utf8 -*-
+"""
+The `collscientiae` command and its subcommands.
+
+Only the standard library is imported upfront, each subcommand imports
+the heavy modules (Jinja2, Markdown, PyYAML, ...) only if it needs them.
+Hence, quick commands like `manifest` or `check --manifest` start fast.
+"""
+from __future__ import absolute_import, print_function
+import argparse
+import sys
+
+
+def placeholder_targ():
+    """
+    Target directory for the commands, which never write into it.
+    """
+    from os.path import join
+    from tempfile import gettempdir
+    return join(gettempdir(), "collscientiae-unused")
+
+
+def log_level(args):
+    import logging
+    return logging.WARNING if args.quiet else logging.DEBUG
+
+
+def cmd_build(args):
+    from .collscientiae import CollScientiae, render_revisions
+    from .diagnostics import BuildError
+    from .events import EventStream
+    if args.revision:
+        render_revisions(args.src, args.theme, args.targ, args.revision, log_level(args),
+                         reproducible=args.reproducible)
+        return
+    cs = CollScientiae(args.src, args.theme, args.targ, log_level(args),
+                       reproducible=args.reproducible,
+                       keep_going=args.keep_going or bool(args.diagnostics))
+    if args.events == "-":
+        cs.events = EventStream(sys.stdout)
+    elif args.events:
+        cs.events = EventStream(open(args.events, "w"))
+    if args.memory_profile:
+        from .memprofile import MemoryProfiler
+        cs.memory = MemoryProfiler(top=args.memory_top)
+        cs.memory.start()
+    cs.warm_start = args.warm_start
+    if args.profile_markdown:
+        cs.processor.profile_markdown()
+    if args.pack:
+        cs.pack(args.pack)
+    try:
+        cs.render(args.only, args.variant)
+    except BuildError:
+        # the diagnostics are already logged
+        return 1
+    finally:
+        if args.diagnostics:
+            save_diagnostics(cs.diagnostics, args.diagnostics)
+        if cs.events.stream not in [None, sys.stdout]:
+            cs.events.stream.close()
+        if cs.memory is not None:
+            cs.memory.stop()
+            cs.memory.report(cs.log)
+            cs.memory.save(args.memory_profile)
+        if cs.processor.profiler is not None:
+            cs.processor.profiler.report(cs.log)
+            cs.processor.profiler.save(args.profile_markdown)
+    if args.save_db:
+        cs.save_db(args.save_db)
+
+
+def cmd_check(args):
+    if args.manifest:
+        return check_manifest(read_manifest(args.src))
+    from .collscientiae import CollScientiae
+    from .diagnostics import BuildError
+    cs = CollScientiae(args.src, args.theme, placeholder_targ(), log_level(args),
+                       keep_going=args.keep_going or bool(args.diagnostics))
+    try:
+        cs.process()
+        cs.read_node_config()
+        cs.db.check_consistency()
+        cs.diagnostics.report(cs.log)
+    except BuildError:
+        return 1
+    finally:
+        if args.diagnostics:
+            save_diagnostics(cs.diagnostics, args.diagnostics)
+
+
+def save_diagnostics(diagnostics, fn):
+    """
+    Writes the collected diagnostics as a JSON list into the file `fn`, '-' for stdout.
+    """
+    import json
+    data = json.dumps(diagnostics.to_json(), indent=1)
+    if fn == "-":
+        print(data)
+        return
+    with open(fn, "w") as f:
+        f.write(data)
+
+
+def cmd_serve(args):
+    from .collscientiae import CollScientiae
+    from .serve import DevServer
+    cs = CollScientiae(args.src, args.theme, placeholder_targ(), log_level(args))
+    DevServer(cs, cache_size=args.cache_size * 1024 * 1024).serve(args.host, args.port)
+
+
+def cmd_serve_pack(args):
+    from wsgiref.simple_server import make_server
+    from .archive import PageStoreApp
+    print("serving on http://%s:%d/" % (args.host, args.port))
+    make_server(args.host, args.port, PageStoreApp(args.pack)).serve_forever()
+
+
+def cmd_precompile(args):
+    from .collscientiae import precompile_theme
+    for name in precompile_theme(args.theme):
+        print("compiled %s" % name)
+
+
+def cmd_manifest(args):
+    manifest = read_manifest(args.targ)
+    modules = manifest["modules"]
+    if args.id is None:
+        for ns, docs in modules.items():
+            print("%s: %d documents" % (ns, len(docs)))
+        return
+    ns, _, docid = args.id.partition("/")
+    if not docid:
+        for docid, doc in sorted(modules[ns].items()):
+            print("%s/%s: %s" % (ns, docid, doc["title"]))
+        return
+    doc = modules[ns][docid]
+    print("%s/%s: %s" % (ns, docid, doc["title"]))
+    if doc["subtitle"]:
+        print(doc["subtitle"])
+    for src_ns, src_docid, target_ns, target_docid in manifest["links"]:
+        if (target_ns, target_docid) == (ns, docid):
+            print("  <- %s/%s" % (src_ns, src_docid))
+        elif (src_ns, src_docid) == (ns, docid):
+            print("  -> %s/%s" % (target_ns, target_docid))
+
+
+def read_manifest(targ):
+    import json
+    from os.path import join, isdir
+    fn = join(targ, "manifest.json") if isdir(targ) else targ
+    with open(fn, "r") as f:
+        return json.load(f)
+
+
+def check_manifest(manifest):
+    """
+    Checks, that all cross-module links in the manifest point to existing documents.
+    """
+    modules = manifest["modules"]
+    errors = 0
+    for src_ns, src_docid, ns, docid in manifest["links"]:
+        if docid not in modules.get(ns, {}):
+            print("%s/%s: unknown link target '%s/%s'" % (src_ns, src_docid, ns, docid))
+            errors += 1
+    return 1 if errors > 0 else 0
+
+
+def parser():
+    p = argparse.ArgumentParser(prog="collscientiae",
+                                description="Collection of Knowledge: "
+                                            "building modularized documentations")
+    p.add_argument("-q", "--quiet", action="store_true", help="only log warnings and errors")
+    sub = p.add_subparsers(dest="command")
+    sub.required = True
+
+    build = sub.add_parser("build", help="build the documentation")
+    build.add_argument("src", help="source directory with a 'config.yaml'")
+    build.add_argument("theme", help="theme directory with the 'src' directory of templates")
+    build.add_argument("targ", help="target directory, will be cleaned")
+    build.add_argument("--only", metavar="NS", action="append",
+                       help="only build this module, against the manifest of a full build")
+    build.add_argument("--variant", metavar=("THEME", "TARG"), nargs=2, action="append",
+                       help="additionally render with this theme into this target directory")
+    build.add_argument("--revision", metavar="REV", action="append",
+                       help="build this git revision of the sources into TARG/REV, "
+                            "without checking it out (repeatable)")
+    build.add_argument("--reproducible", action="store_true",
+                       help="the output only depends on the sources, e.g. the creation date "
+                            "is the time of the latest source file or SOURCE_DATE_EPOCH")
+    build.add_argument("-k", "--keep-going", action="store_true",
+                       help="collect all validation errors and report them together")
+    build.add_argument("--diagnostics", metavar="FN",
+                       help="write the collected errors as JSON into this file, '-' for stdout "
+                            "(implies --keep-going)")
+    build.add_argument("--pack", metavar="FN",
+                       help="write all pages into this SQLite page store, TARG is not written")
+    build.add_argument("--warm-start", action="store_true",
+                       help="load the processed sources from a snapshot in the theme's cache, "
+                            "if no source changed, e.g. after editing the templates")
+    build.add_argument("--save-db", metavar="FN", help="save the processed database to SQLite")
+    build.add_argument("--events", metavar="FN",
+                       help="write the progress as JSON lines into this file, '-' for stdout")
+    build.add_argument("--memory-profile", metavar="FN",
+                       help="trace the memory of each phase and write a JSON report into this file")
+    build.add_argument("--memory-top", metavar="N", type=int, default=0,
+                       help="also report the top N allocation sites of each phase")
+    build.add_argument("--profile-markdown", metavar="FN",
+                       help="record the time of each markdown pattern and block processor "
+                            "and write a JSON report into this file")
+    build.set_defaults(func=cmd_build)
+
+    check = sub.add_parser("check", help="check the sources for errors")
+    check.add_argument("src", help="source directory, or target directory with --manifest")
+    check.add_argument("theme", nargs="?")
+    check.add_argument("--manifest", action="store_true",
+                       help="quickly check the links in the manifest of a build")
+    check.add_argument("-k", "--keep-going", action="store_true",
+                       help="collect all validation errors and report them together")
+    check.add_argument("--diagnostics", metavar="FN",
+                       help="write the collected errors as JSON into this file, '-' for stdout "
+                            "(implies --keep-going)")
+    check.set_defaults(func=cmd_check)
+
+    serve = sub.add_parser("serve", help="serve the documentation, rendered on demand")
+    serve.add_argument("src")
+    serve.add_argument("theme")
+    serve.add_argument("--host", default="localhost")
+    serve.add_argument("--port", type=int, default=8000)
+    serve.add_argument("--cache-size", type=int, default=64, help="page cache size in MiB")
+    serve.set_defaults(func=cmd_serve)
+
+    serve_pack = sub.add_parser("serve-pack", help="serve the pages of a page store")
+    serve_pack.add_argument("pack", help="page store file of 'build --pack'")
+    serve_pack.add_argument("--host", default="localhost")
+    serve_pack.add_argument("--port", type=int, default=8000)
+    serve_pack.set_defaults(func=cmd_serve_pack)
+
+    precompile = sub.add_parser("precompile", help="compile the theme's templates ahead of time")
+    precompile.add_argument("theme")
+    precompile.set_defaults(func=cmd_precompile)
+
+    manifest = sub.add_parser("manifest", help="query the manifest of a build")
+    manifest.add_argument("targ", help="target directory of a build or a manifest file")
+    manifest.add_argument("id", nargs="?", help="namespace or namespace/docid")
+    manifest.set_defaults(func=cmd_manifest)
+    return p
+
+
+# the options of 'build', which do not apply to building git revisions
+revision_conflicts = ["only", "variant", "pack", "keep_going", "diagnostics", "warm_start",
+                      "save_db", "events", "memory_profile", "profile_markdown"]
+
+
+def main(argv=None):
+    p = parser()
+    args = p.parse_args(argv)
+    if args.command == "build" and args.revision:
+        conflicts = ["--" + _.replace("_", "-") for _ in revision_conflicts if getattr(args, _)]
+        if conflicts:
+            p.error("argument --revision: not allowed with %s" % ", ".join(conflicts))
+    if args.command == "check" and not args.manifest and not args.theme:
+        p.error("the theme is needed for checking the sources")
+    return args.func(args) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
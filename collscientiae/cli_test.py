@@ -0,0 +1,57 @@
+# coding=utf-8
+from __future__ import absolute_import
+import subprocess
+import sys
+
+# budget for importing the command line interface, in microseconds
+IMPORT_BUDGET = 30000
+
+
+def import_times(module):
+    """
+    Runs `python -X importtime` and returns the cumulative import time of each module.
+    """
+    out = subprocess.check_output([sys.executable, "-X", "importtime", "-c", "import " + module],
+                                  stderr=subprocess.STDOUT, universal_newlines=True)
+    times = {}
+    for line in out.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_cli_imports_no_heavy_modules():
+    times = import_times("collscientiae.cli")
+    for heavy in ["jinja2", "markdown", "yaml", "dateutil", "sqlite3"]:
+        assert heavy not in times, "'%s' is imported" % heavy
+    assert times["collscientiae.cli"] < IMPORT_BUDGET, \
+        "importing the cli took %dus" % times["collscientiae.cli"]
+
+
+def test_manifest_query(tmpdir):
+    from .cli import main, check_manifest
+    import json
+    manifest = {"modules": {"a": {"x": {"title": "X", "subtitle": None}}},
+                "links": [["a", "x", "b", "y"]],
+                "hashtags": {}}
+    tmpdir.join("manifest.json").write(json.dumps(manifest))
+    assert main(["manifest", str(tmpdir), "a/x"]) == 0
+    assert check_manifest(manifest) == 1
+
+
+def test_revision_conflicts(capsys):
+    import pytest
+    from .cli import main
+    with pytest.raises(SystemExit):
+        main(["build", "src", "theme", "targ", "--revision", "v1", "--pack", "pages.db", "-k"])
+    assert "not allowed with --pack, --keep-going" in capsys.readouterr().err
+
+
+def test_check_needs_theme(capsys):
+    import pytest
+    from .cli import main
+    with pytest.raises(SystemExit):
+        main(["check", "src"])
+    assert "the theme is needed" in capsys.readouterr().err
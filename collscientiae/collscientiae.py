@@ -1,12 +1,21 @@
 # -*- coding: utf8 -*-
 from __future__ import absolute_import
+import json
+import logging
 
 from .models import DocumentationModule
-from .utils import get_yaml, get_markdown, create_logger, mytitle, indexsort, get_creation_date
+from .utils import get_yaml, create_logger, mytitle, indexsort, get_creation_date, \
+    yaml_stats, ensure_dir
 from .db import CollScientiaeDB, DuplicateDocumentError
 from .models import Document
 from .process import ContentProcessor
 from .render import OutputRenderer
+from .pipeline import ReadAhead
+from .events import EventStream
+from .sources import FileSource, GitSource
+from .highlight import stylesheet
+from .layout import get_layout
+from .diagnostics import Diagnostics
 
 import jinja2 as j2
 
@@ -27,23 +36,116 @@ def filter_prefix(ctx, link):
     return '/'.join(path)
 
 
+def theme_environment(theme):
+    """
+    The Jinja2 environment for the templates in the theme's `src` directory.
+    Compiled templates are kept in a persistent bytecode cache in the theme's
+    `.cache` directory, which is invalidated when the template's source changes.
+    """
+    from os.path import join
+    j2loader = j2.FileSystemLoader(join(theme, "src"))
+    j2bcc = j2.FileSystemBytecodeCache(ensure_dir(join(theme, ".cache", "jinja2")))
+    j2env = j2.Environment(loader=j2loader, undefined=j2.StrictUndefined, bytecode_cache=j2bcc)
+    j2env.filters["prefix"] = filter_prefix
+    j2env.filters["title"] = mytitle
+    j2env.filters["indexsort"] = indexsort
+    return j2env
+
+
+def precompile_theme(theme):
+    """
+    Compiles all html templates of the theme ahead of time into its bytecode cache.
+    """
+    from os.path import abspath, normpath
+    j2env = theme_environment(abspath(normpath(theme)))
+    names = j2env.list_templates(filter_func=lambda fn: fn.endswith(".html")
+                                 and not fn.startswith(("static/", "img/")))
+    for name in names:
+        j2env.get_template(name)
+    return names
+
+
+def render_revisions(src, theme, targ, revisions, log_level=logging.DEBUG, reproducible=False):
+    """
+    Builds several git revisions of the source tree `src` in one run,
+    each into the subdirectory of `targ` named after the revision ("/" replaced by "_").
+    Documents, which did not change between the revisions, are converted only once.
+
+    :return: the target directories
+    """
+    from os.path import join
+    conversion_cache = {}
+    targets = []
+    for revision in revisions:
+        rev_targ = join(targ, revision.replace("/", "_"))
+        cs = CollScientiae(src, theme, rev_targ, log_level=log_level, revision=revision,
+                           reproducible=reproducible)
+        cs.log.info("building revision '%s'" % revision)
+        cs.processor.conversion_cache = conversion_cache
+        try:
+            cs.render()
+        finally:
+            cs.source.close()
+        targets.append(rev_targ)
+        cs.log.info("conversion cache: %d documents" % len(conversion_cache))
+    return targets
+
+
 class CollScientiae(object):
 
     """
     This is the main class, holding everything together.
     The `render()` method is starting the who process.
 
+    The progress of the build is reported to the :class:`.EventStream` in `events`,
+    which records nothing by default. If `memory` is set to a :class:`.MemoryProfiler`,
+    the memory is recorded after each phase of :meth:`.render`.
+
+    If a git `revision` is given, the source tree is read at this revision
+    from the repository it belongs to, see :class:`.GitSource`.
+    After :meth:`.pack`, the output is written into a single file instead.
+
+    If `reproducible` is True (or the environment variable `SOURCE_DATE_EPOCH` is set),
+    the output only depends on the sources, see :meth:`.source_date`.
+
+    If `warm_start` is set, a full build saves a snapshot of the processed state and
+    later builds load it instead of processing, if nothing changed, see :meth:`.snapshot_key`.
+
+    If `keep_going` is True, all validation failures are collected in `diagnostics`
+    and reported together after the consistency checks, see :mod:`.diagnostics`.
     """
 
-    def __init__(self, src, theme, targ):
+    def __init__(self, src, theme, targ, log_level=logging.DEBUG, revision=None,
+                 reproducible=False, keep_going=False):
+        from os import environ
         from os.path import abspath, normpath, isdir, join
 
-        self._log = create_logger()
+        self._log = create_logger(log_level)
         self._src = abspath(normpath(src))
         self._theme = abspath(normpath(theme))
         self._targ = abspath(normpath(targ))
         self.tmpl_dir = join(self.theme, "src")
+        # summary of a full build, used for building only some of the modules
+        self.manifest_fn = join(self.targ, "manifest.json")
+        # the module configurations, which are added to the Jinja2 globals
+        self.module_globals = {}
+        # for variants (see :meth:`.variant`), the output of each document in this theme
+        self.outputs = None
+        # reads the source files ahead of their conversion, depth 0 disables it
+        self.source = GitSource(self._src, revision) if revision else FileSource()
+        self.read_ahead = ReadAhead(self.source.read, depth=32)
+        self.events = EventStream()
+        self.memory = None
+        # the :class:`.PageStore` for packed output, see :meth:`.pack`
+        self.store = None
+        # maps documents to their related documents, see :meth:`.find_related`
+        self.related = {}
+        self.reproducible = reproducible or "SOURCE_DATE_EPOCH" in environ
+        self.diagnostics = Diagnostics(keep_going)
+        self.warm_start = False
         self.config = self.read_config()
+        # where the pages of the documents are written, see :mod:`.layout`
+        self.layout = get_layout(self.config.get("layout"))
 
         if not isdir(self.src):
             raise ValueError("src must be a directory")
@@ -77,19 +179,67 @@ class CollScientiae(object):
 
     def init_jinja2(self):
         from os.path import join
-        j2loader = j2.FileSystemLoader(self.tmpl_dir)
-        j2env = j2.Environment(loader=j2loader, undefined=j2.StrictUndefined)
+        j2env = theme_environment(self.theme)
         config_theme = get_yaml(join(self.theme, "config.yaml"))
         if config_theme is not None:
             j2env.globals.update(config_theme)
         j2env.globals["footer"] = self.config["footer"]
         j2env.globals["creation_date"] = get_creation_date()
         j2env.globals['google_analytics'] = self.config.get('google_analytics', None)
-        j2env.filters["prefix"] = filter_prefix
-        j2env.filters["title"] = mytitle
-        j2env.filters["indexsort"] = indexsort
+        # names of the bundled CSS and JS files, see :meth:`.OutputRenderer.copy_static_files`
+        j2env.globals["assets"] = {}
+        # responsive variants of the optimized images, see :meth:`.OutputRenderer.optimize_images`
+        j2env.globals["images"] = {}
+        # stylesheet for the code highlighted at build time, see :mod:`.highlight`
+        j2env.globals["highlight_css"] = stylesheet(self.config.get("highlight"))
+        # path of a document's page below the target directory, e.g. for links to backlinks
+        j2env.filters["docpath"] = lambda doc: "%s/%s" % (doc.namespace.lower(),
+                                                          self.layout.path(doc.docid))
         return j2env
 
+    def variant(self, theme, targ):
+        """
+        Returns a copy of this instance for rendering the processed documents
+        with another theme into another target directory.
+        It shares the configuration, database and processor,
+        but has its own Jinja2 environment and :class:`.OutputRenderer`.
+        A variant is always written into its target directory, even if this
+        instance renders into a page store (see :meth:`.pack`).
+        """
+        from copy import copy
+        from os.path import abspath, normpath, isdir, join
+        cs = copy(self)
+        cs._theme = abspath(normpath(theme))
+        cs._targ = abspath(normpath(targ))
+        cs.tmpl_dir = join(cs.theme, "src")
+        cs.manifest_fn = join(cs.targ, "manifest.json")
+        if not isdir(cs.theme):
+            raise ValueError("theme must be a directory")
+        cs.j2env = cs.init_jinja2()
+        cs.store = None
+        cs.renderer = OutputRenderer(cs)
+        cs.outputs = {}
+        return cs
+
+    def render_macros(self, namespaces=None):
+        """
+        For a variant, this applies the theme's macros to the markdown output of
+        all documents (i.e. the theme dependent part of :meth:`.ContentProcessor.convert`).
+        """
+        import hashlib
+        self.log.info("applying macros of theme '%s'" % self.theme)
+        self.j2env.globals.update(self.module_globals)
+        hashes = {}
+        for ns, module in self.db.modules.items():
+            if namespaces is not None and ns not in namespaces:
+                continue
+            for key, doc in module.items():
+                html = self.processor.render_macros(doc, doc.md_output, self.j2env)
+                # the document's hash already covers the metadata
+                hashes[doc] = hashlib.sha1((doc.hash + html).encode("utf8")).hexdigest()
+                self.outputs[doc] = html
+        self.set_root_hash(hashes)
+
     def remap_module(self, origin, target):
         """
         Uses the dictionary in the documentation configuration's
@@ -111,56 +261,84 @@ class CollScientiae(object):
     def read_config(self):
         from os.path import join
         config_fn = join(self.src, "config.yaml")
-        return get_yaml(config_fn)
+        return self.source.yaml(config_fn)
 
-    def get_documents(self):
+    def get_documents(self, namespaces=None):
         """
         This helper iterates through all the documentation modules' files,
         sets the names and paths properly, reads the markdown contents,
         and then yields the full package of module, path, ID and content.
 
         It's used in :func:`process`.
+
+        :param namespaces: if given, all modules are registered,
+                           but only the documents of these namespaces are read.
         """
-        from os.path import join, isdir, splitext, relpath, sep
-        from os import walk, listdir
+        from os.path import join
 
-        # ordering is important, added to an OrderedDict
+        # first, collect all modules and files, such that the files can be read ahead
+        modules = []
         for doc_dir in [join(self.src, _) for _ in self.config["modules"]]:
-
-            mod_config = get_yaml(join(doc_dir, "config.yaml"))
+            mod_config = self.source.yaml(join(doc_dir, "config.yaml"))
             module = DocumentationModule(doc_dir, **mod_config)
+            files = []
+            if namespaces is None or module.namespace in namespaces:
+                files = list(self.module_files(doc_dir))
+            modules.append((mod_config, module, files))
+
+        self.events.emit("sources", files=sum(len(files) for _, _, files in modules))
+        contents = self.read_ahead(fp for _, _, files in modules for fp, _ in files)
+
+        # ordering is important, added to an OrderedDict
+        for mod_config, module, files in modules:
             self.j2env.globals.update(mod_config)
+            self.module_globals.update(mod_config)
             self.db.register_module(module)
 
-            self.log.debug("processing: {}".format(module))
-
-            for path, _, filenames in sorted(walk(doc_dir)):
-                # self.log.debug("DOCID: %s" % docid)
-                for fn in sorted(filenames):
-                    if fn in ["config.yaml", ".git", "README.md"]:
-                        continue
-                    filepath = join(path, fn)
-                    basename, ext = splitext(fn)
-                    if ext != ".md":
-                        continue
-                    assert ext == ".md", \
-                        'fn: {0} (splitext: {1})'.format(fn, ext)
-                    # self.log.debug("RELPATH: %s" % relpath(path, doc_dir))
-                    id_path = relpath(path, doc_dir).split(sep)
-                    if id_path[0] == ".":
-                        id_path.pop(0)
-                    id_path.append(basename)
-                    docid = '.'.join(id_path)
-                    yield module, filepath, docid, get_markdown(filepath)
-
-    def process(self):
+            if namespaces is not None and module.namespace not in namespaces:
+                continue
+            self.log.debug("processing: %s", module)
+
+            for filepath, docid in files:
+                yield module, filepath, docid, next(contents)
+
+    def module_files(self, doc_dir):
+        """
+        Yields the path and document ID of all markdown files of the module in `doc_dir`.
+        """
+        from os.path import join, splitext, relpath, sep
+
+        for path, _, filenames in sorted(self.source.walk(doc_dir)):
+            # self.log.debug("DOCID: %s" % docid)
+            for fn in sorted(filenames):
+                if fn in ["config.yaml", ".git", "README.md"]:
+                    continue
+                filepath = join(path, fn)
+                basename, ext = splitext(fn)
+                if ext != ".md":
+                    continue
+                assert ext == ".md", \
+                    'fn: {0} (splitext: {1})'.format(fn, ext)
+                # self.log.debug("RELPATH: %s" % relpath(path, doc_dir))
+                id_path = relpath(path, doc_dir).split(sep)
+                if id_path[0] == ".":
+                    id_path.pop(0)
+                id_path.append(basename)
+                docid = '.'.join(id_path)
+                yield filepath, docid
+
+    def process(self, namespaces=None, manifest=None):
         """
         This step iterates through all documents, calls the conversion operation,
         and registers the generated document in the database.
+
+        :param namespaces: if given, only these modules are processed and
+                           all others are taken from the `manifest`.
         """
         self.log.info("building db from '%s'" % self.src)
+        self.events.phase("process")
 
-        for module, filepath, docid, md_raw in self.get_documents():
+        for module, filepath, docid, md_raw in self.get_documents(namespaces):
             # self.log.debug("processing: {} / {}".format(module, docid))
             try:
                 ns = module.namespace
@@ -171,24 +349,84 @@ class CollScientiae(object):
                 html, meta = self.processor.convert(doc)
                 doc.update(output=html, **meta)
                 self.db.register(doc)
+                self.events.count(documents=1)
 
             except DuplicateDocumentError as dde:
                 # add filepath and document index to error message
-                m = "{:s} in {:s}".format(dde.message, filepath)
-                raise DuplicateDocumentError(m)
-
-        self.db.resolve_forwardlinks()
+                m = "{:s} in {:s}".format(str(dde), filepath)
+                self.diagnostics.error("duplicate", m, filepath, exception=DuplicateDocumentError)
+
+            except (AssertionError, ValueError) as ex:
+                if not self.diagnostics.keep_going:
+                    raise
+                self.diagnostics.error("document", str(ex), filepath)
+
+        if namespaces is not None:
+            self.db.load_manifest(manifest, namespaces)
+
+        self.log.info("read ahead {files} files: {ready_mean:.1f} ready on average, "
+                      "max. {ready_max}, stalled {stall_time:.3f}s"
+                      .format(**self.read_ahead.stats()))
+        # links to unknown documents are reported by :meth:`.CollScientiaeDB.check_consistency`
+        self.db.resolve_forwardlinks(strict=not self.diagnostics.keep_going)
+        if self.processor.math is not None:
+            self.processor.math.save()
+            self.log.info("math ({backend}): {snippets} snippets, {rendered} rendered, "
+                          "{fallbacks} left for MathJax".format(**self.processor.math.stats()))
+        if self.processor.examples is not None:
+            self.processor.examples.save()
+            self.processor.examples.close()
+            self.log.info("examples: {blocks} blocks, {executed} executed, {failed} failed"
+                          .format(**self.processor.examples.stats()))
+        if self.processor.highlighter is not None:
+            self.processor.highlighter.save()
+            self.log.info("highlight: {blocks} code blocks, {highlighted} highlighted"
+                          .format(**self.processor.highlighter.stats()))
 
         # after we know all the output, this hash contains everything
-        self.j2env.globals["doc_root_hash"] = self.processor.get_root_hash()
+        self.set_root_hash()
+
+    def set_root_hash(self, hashes=None):
+        """
+        Sets the root hash and the hashes of all modules as globals for the templates,
+        e.g. for cache busting. See :meth:`.ContentProcessor.get_root_hash`.
+        """
+        root_hash, module_hashes = self.processor.get_root_hash(hashes)
+        self.j2env.globals["doc_root_hash"] = root_hash
+        self.j2env.globals["module_hashes"] = module_hashes
+
+    def find_related(self):
+        """
+        Finds the related documents of all processed documents, if this is configured,
+        see :mod:`.related`.
+        """
+        from os.path import join
+        config = self.config.get("related")
+        if not config:
+            return
+        from .related import np, RelatedDocuments
+        if np is None:
+            self.log.warning("no related documents, because NumPy is not installed")
+            return
+        self.log.info("related documents")
+        self.events.phase("related")
+        cache_fn = join(self.theme, ".cache", "related", self.cache_name() + ".json")
+        finder = RelatedDocuments(cache_fn=cache_fn, **config)
+        documents = [doc for module in self.db.modules.values() for _, doc in module.items()
+                     if doc.md_raw is not None]
+        # updated in place, because the variants share it
+        self.related.update(finder.find(documents))
+        self.log.info("related documents: {} documents, {} counted".format(len(documents),
+                                                                          finder.counted))
 
     def read_node_config(self):
         """
         This goes through the nodes and reads the optionally existing config.yaml
         to set title and sort priority.
         """
-        from os.path import sep, exists
+        from os.path import sep
         self.log.info("node configurations")
+        self.events.phase("config")
         # This is very similar to .render.document_indices/walk, but for another purpose
         # TODO unify this and make it non-recursive
 
@@ -196,8 +434,8 @@ class CollScientiae(object):
             for key, node2 in node.items():
                 if len(node2) > 0:
                     config_fn = sep.join([self.src] + parents + [key, "config.yaml"])
-                    if exists(config_fn):
-                        node2.update(get_yaml(config_fn))
+                    if self.source.exists(config_fn):
+                        node2.update(self.source.yaml(config_fn))
                 p = parents[:]
                 p.append(key)
                 walk(node2, p)
@@ -205,19 +443,223 @@ class CollScientiae(object):
         for ns, module in self.db.modules.items():
             walk(module.tree, [ns])
 
-    def check_dirs(self):
+    def pack(self, fn):
+        """
+        Renders into the :class:`.PageStore` in the SQLite file `fn`, instead of the target
+        directory. An existing store is updated, i.e. only changed pages are written.
+        """
+        from .archive import PageStore, PackedRenderer
+        self.store = PageStore(fn)
+        self.renderer = PackedRenderer(self)
+
+    def read_manifest(self):
+        from os.path import exists
+        if self.store is not None:
+            page = self.store.get("manifest.json")
+            if page is None:
+                raise ValueError("building only some modules needs the manifest of a full build "
+                                 "in '%s'" % self.store.fn)
+            return json.loads(page[0].decode("utf-8"))
+        if not exists(self.manifest_fn):
+            raise ValueError("building only some modules needs the manifest '%s' of a full build"
+                             % self.manifest_fn)
+        with open(self.manifest_fn, "r") as f:
+            return json.load(f)
+
+    def write_manifest(self):
+        self.log.info("writing manifest")
+        self.events.phase("manifest", target=self.targ)
+        if self.store is not None:
+            manifest = json.dumps(self.db.manifest(), indent=1, sort_keys=True)
+            self.store.put("manifest.json", manifest.encode("utf-8"))
+            return
+        with open(self.manifest_fn, "w") as f:
+            json.dump(self.db.manifest(), f, indent=1, sort_keys=True)
+
+    def save_db(self, fn, **info):
+        """
+        Persists the processed database in the SQLite file `fn`, see :mod:`.store`.
+
+        :param info: additional key/value pairs, see :meth:`.SQLiteStore.save`
+        """
+        from .store import SQLiteStore
+        SQLiteStore(fn).save(self.db,
+                             doc_root_hash=self.j2env.globals["doc_root_hash"],
+                             module_hashes=json.dumps(self.j2env.globals["module_hashes"]),
+                             **info)
+
+    def load_db(self, fn):
+        """
+        Replaces the database by the one persisted in the SQLite file `fn`.
+        Afterwards, the documents can be rendered without processing them again.
+        """
+        from .store import SQLiteStore
+        store = SQLiteStore(fn)
+        self.db = self.processor.db = store.load(self)
+        info = store.info()
+        self.j2env.globals["doc_root_hash"] = info["doc_root_hash"]
+        self.j2env.globals["module_hashes"] = json.loads(info["module_hashes"])
+
+    def snapshot_fn(self):
+        """
+        The file of the warm-start snapshot for this source directory, in the theme's cache.
+        """
+        from os.path import join
+        return join(self.theme, ".cache", "snapshot", self.cache_name() + ".db")
+
+    def cache_name(self):
+        """
+        The name of the files in the theme's cache, which belong to this source directory
+        and revision, such that several sources can be built with the same theme.
+        """
+        import hashlib
+        name = self.src
+        if getattr(self.source, "revision", None) is not None:
+            name += "@" + self.source.revision
+        return hashlib.sha1(name.encode("utf8")).hexdigest()[:12]
+
+    def snapshot_key(self):
+        """
+        The key of the processed state, which changes if any markdown or configuration file
+        of the sources or the theme's `config.yaml` or `macros.html` changes.
+        Source files are compared by their modification time and size (or the git blob).
+        """
+        import hashlib
+        from os import stat
+        from os.path import join, exists
+        from . import __version__
+        h = hashlib.sha1(__version__.encode("utf8"))
+        for fn in [join(self.theme, "config.yaml"), join(self.tmpl_dir, "macros.html")]:
+            if exists(fn):
+                with open(fn, "rb") as f:
+                    h.update(f.read())
+        paths = [join(self.src, "config.yaml")]
+        for doc_dir in [join(self.src, _) for _ in self.config["modules"]]:
+            for path, _, filenames in sorted(self.source.walk(doc_dir)):
+                paths.extend(join(path, fn) for fn in sorted(filenames)
+                             if fn.endswith(".md") or fn == "config.yaml")
+        for path in paths:
+            key = self.source.key(path)
+            if key is None:
+                st = stat(path)
+                key = "%d %d" % (st.st_mtime_ns, st.st_size)
+            h.update(("%s %s\n" % (path, key)).encode("utf8"))
+        return h.hexdigest()
+
+    def load_snapshot(self, key):
+        """
+        Loads the warm-start snapshot, if it exists and its key is `key`.
+
+        :return: True, if it was loaded
+        """
+        from os.path import join
+        from .store import SQLiteStore
+        fn = self.snapshot_fn()
+        if SQLiteStore.read_info(fn).get("snapshot_key") != key:
+            return False
+        self.log.info("warm start from snapshot '%s'" % fn)
+        self.load_db(fn)
+        # the module configurations are globals for the templates, see :meth:`.get_documents`
+        for doc_dir in [join(self.src, _) for _ in self.config["modules"]]:
+            mod_config = self.source.yaml(join(doc_dir, "config.yaml"))
+            self.j2env.globals.update(mod_config)
+            self.module_globals.update(mod_config)
+        return True
+
+    def save_snapshot(self, key):
+        from os.path import dirname
+        fn = self.snapshot_fn()
+        ensure_dir(dirname(fn))
+        self.save_db(fn, snapshot_key=key)
+
+    def check_dirs(self, namespaces=None):
         """
         Cleans the target directory. This gets rid of the `.git`, too!
         (Hence, for publishing, the `makefile` re-initializes the GIT repository)
+
+        :param namespaces: if given, only the output of these modules and the
+                           output shared by all modules is removed.
         """
-        from os import makedirs
-        from os.path import exists
+        from os import makedirs, remove
+        from os.path import exists, isdir, join
         from shutil import rmtree
-        if exists(self.targ):
-            rmtree(self.targ)
-        makedirs(self.targ)
+        if self.store is not None:
+            # stale entries are removed after rendering, see :meth:`.PageStore.finish`
+            self.store.begin(None if namespaces is None else self.shared_outputs(namespaces))
+            return
+        if namespaces is None:
+            if exists(self.targ):
+                rmtree(self.targ)
+            makedirs(self.targ)
+            return
+
+        for name in self.shared_outputs(namespaces):
+            path = join(self.targ, name)
+            if isdir(path):
+                rmtree(path)
+            elif exists(path):
+                remove(path)
+
+    @staticmethod
+    def shared_outputs(namespaces):
+        """
+        The names of the outputs of the given modules and of those shared by all modules.
+        """
+        names = ["index.html", "hashtag", "static", "img"]
+        for ns in namespaces:
+            names.extend([ns, ns.lower()])
+        return sorted(set(names))
 
-    def render(self):
+    def output(self, namespaces=None):
+        """
+        Renders the processed documents with this instance's theme into its target directory.
+        """
+        if self.outputs is not None:
+            self.render_macros(namespaces)
+        self.renderer.output(namespaces)
+        self.write_manifest()
+        if self.store is not None:
+            self.log.info("page store '{}': {written} written, {unchanged} unchanged, "
+                          "{removed} removed".format(self.store.fn, **self.store.finish()))
+
+    def source_date(self, paths=None):
+        """
+        The time of the sources in seconds since the epoch, for reproducible builds:
+        `SOURCE_DATE_EPOCH` if it is set, otherwise the latest time of the source files
+        (their modification time or the commit time, see :meth:`.FileSource.time`).
+
+        :param paths: the source files, defaults to all of them
+        """
+        from os import environ
+        from os.path import join
+        if "SOURCE_DATE_EPOCH" in environ:
+            return int(environ["SOURCE_DATE_EPOCH"])
+        if paths is None:
+            paths = [join(self.src, "config.yaml")]
+            for doc_dir in [join(self.src, _) for _ in self.config["modules"]]:
+                paths.append(join(doc_dir, "config.yaml"))
+                paths.extend(fp for fp, _ in self.module_files(doc_dir))
+        return max(self.source.time(_) for _ in paths)
+
+    def document_date(self, doc):
+        """
+        The `creation_date` of a document's page in reproducible builds: its `date`, if it has one,
+        otherwise the time of its source file. Hence, changing one document does not change
+        the pages of the others, only the index pages get the time of all sources.
+        """
+        date = doc.date
+        if date is None:
+            return get_creation_date(self.source_date([doc.src_fn]))
+        if date.tzinfo is not None:
+            from dateutil.tz import tzutc
+            date = date.astimezone(tzutc()).replace(tzinfo=None)
+        return date.replace(microsecond=0).isoformat()
+
+    def phase_done(self, name):
+        if self.memory is not None:
+            self.memory.phase(name, self.db)
+
+    def render(self, namespaces=None, variants=None):
         """
         This is the most high-level routine.
         It is a bit like a compiler, in such a sense that it has several passes:
@@ -226,21 +668,76 @@ class CollScientiae(object):
         2. build internally data structures (in :class:`CollScientiaeDB` a list of trees, etc.)
         3. check consistency (cross-references, etc.)
         4. render output (static files, documents, index pages, source files, etc.)
+
+        If `namespaces` is given, only those modules are built and the links into
+        all other modules are resolved against the manifest of an earlier full build.
+
+        `variants` is a list of additional (theme, target) directory pairs:
+        the documents are processed only once and then rendered with each theme
+        (concurrently, see :meth:`.variant`).
         """
-        self.check_dirs()
-        self.process()
-        self.read_node_config()
-        self.db.check_consistency()
-        self.renderer.output()
+        from concurrent.futures import ThreadPoolExecutor
+        manifest = None
+        if namespaces is not None:
+            for ns in namespaces:
+                if ns not in self.config["modules"]:
+                    raise ValueError("unknown module '%s'" % ns)
+            manifest = self.read_manifest()
+        variants = [self.variant(theme, targ) for theme, targ in variants or []]
+        self.processor.keep_md_output = len(variants) > 0
+        if self.reproducible:
+            # before processing, because the macros might show it,
+            # the pages of the documents have their own date, see :meth:`.document_date`
+            creation_date = get_creation_date(self.source_date())
+            for cs in [self] + variants:
+                cs.j2env.globals["creation_date"] = creation_date
+        for cs in [self] + variants:
+            cs.check_dirs(namespaces)
+        self.phase_done("init")
+        # the snapshot only covers full builds, variants need the markdown output
+        snapshot_key = None
+        if self.warm_start and namespaces is None and not variants:
+            snapshot_key = self.snapshot_key()
+        if snapshot_key is not None and self.load_snapshot(snapshot_key):
+            self.phase_done("process")
+            self.find_related()
+            self.phase_done("related")
+        else:
+            self.process(namespaces, manifest)
+            self.phase_done("process")
+            self.find_related()
+            self.phase_done("related")
+            self.read_node_config()
+            self.log.info("config parsing: {time:.3f}s for {files} files ({hits} cached)"
+                          .format(**yaml_stats()))
+            self.phase_done("config")
+            self.events.phase("check")
+            self.db.check_consistency()
+            self.diagnostics.report(self.log)
+            self.phase_done("check")
+            if snapshot_key is not None:
+                self.save_snapshot(snapshot_key)
+        # the variants share the documents, hence they are only modified before rendering
+        self.renderer.link_documents(namespaces)
+        with ThreadPoolExecutor(len(variants) + 1) as pool:
+            list(pool.map(lambda cs: cs.output(namespaces), [self] + variants))
+        self.phase_done("output")
+        self.events.done()
 
 
 if __name__ == "__main__":
     import sys
 
-    assert len(sys.argv) == 4, \
+    if len(sys.argv) == 3 and sys.argv[1] == "precompile":
+        for name in precompile_theme(sys.argv[2]):
+            print("compiled %s" % name)
+        sys.exit(0)
+
+    assert len(sys.argv) >= 4, \
         "Need three arguments, first ist the source directory," \
         "the second the theme directory (containing an 'src' directory with" \
         "'static' files and the html templates) and" \
-        "third is the empty target directory where everything is rendered into."
-    cs = CollScientiae(*sys.argv[1:])
-    cs.render()
+        "third is the empty target directory where everything is rendered into." \
+        "Any further arguments are namespaces, the build is then restricted to."
+    cs = CollScientiae(*sys.argv[1:4])
+    cs.render(sys.argv[4:] or None)
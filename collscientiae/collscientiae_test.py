@@ -0,0 +1,219 @@
+# coding=utf-8
+from __future__ import absolute_import
+import logging
+import os
+import pytest
+
+SOURCES = {
+    "config.yaml": "title: Test\nfooter: x\nmodules: [alpha, beta]\n",
+    "alpha/config.yaml": "name: Alpha\ndescription: first\n",
+    "alpha/aa.md": "title: A\n\nsee link[beta/bb] and #tag\n",
+    "alpha/cc.md": "title: C\n\nsee link[beta/bb] and link[aa] and #tag\n",
+    "beta/config.yaml": "name: Beta\ndescription: second\n",
+    "beta/bb.md": "title: B\n\nsee link[alpha/aa], link[alpha/cc] and #tag\n",
+}
+
+THEME = {
+    "config.yaml": "",
+    "src/macros.html": "",
+    "src/index.html": "{% for e in index %}{{ e.href }} {% endfor %}{{ creation_date }}",
+    "src/index_modules.html": "{% for m in modules %}{{ m.namespace }} {% endfor %}",
+    "src/document.html": "{{ doc.output }}"
+                         "{% for d in backlinks %}{{ d.docid }} {% endfor %}"
+                         "{% for d in forwardlinks %}{{ d.docid }} {% endfor %}"
+                         "{{ creation_date }}",
+}
+
+
+def write_files(root, files):
+    for fn, content in files.items():
+        root.join(fn).write(content, ensure=True)
+
+
+def read_output(targ):
+    output = {}
+    for path, _, filenames in os.walk(targ):
+        for fn in filenames:
+            filepath = os.path.join(path, fn)
+            with open(filepath, "rb") as f:
+                output[os.path.relpath(filepath, targ)] = f.read()
+    return output
+
+
+def test_reproducible_build(tmpdir):
+    from .collscientiae import CollScientiae
+    src, theme = tmpdir.join("src"), tmpdir.join("theme")
+    write_files(src, SOURCES)
+    write_files(theme, THEME)
+    for fn in SOURCES:
+        os.utime(str(src.join(fn)), (1000000000, 1000000000))
+
+    def build(targ):
+        cs = CollScientiae(str(src), str(theme), str(tmpdir.join(targ)),
+                           log_level=logging.WARNING, reproducible=True)
+        cs.render()
+        return read_output(str(tmpdir.join(targ)))
+
+    outputs = [build("out1"), build("out2")]
+    assert "alpha/aa.html" in outputs[0]
+    assert b"2001-09-09T01:46:40" in outputs[0]["alpha/index.html"]
+    assert outputs[0] == outputs[1]
+
+    # only the touched document and the index pages change
+    os.utime(str(src.join("alpha/cc.md")), (1100000000, 1100000000))
+    touched = build("out3")
+    assert b"2004-11-09T11:33:20" in touched["alpha/cc.html"]
+    assert b"2004-11-09T11:33:20" in touched["alpha/index.html"]
+    for fn in ["alpha/aa.html", "beta/bb.html"]:
+        assert touched[fn] == outputs[0][fn]
+
+
+def test_keep_going(tmpdir):
+    from .collscientiae import CollScientiae
+    from .diagnostics import BuildError
+    src, theme = tmpdir.join("src"), tmpdir.join("theme")
+    write_files(src, SOURCES)
+    write_files(theme, THEME)
+    src.join("alpha/bad.md").write("title: Bad\ncolor: red\n\nsee link[beta/missing]\n")
+
+    cs = CollScientiae(str(src), str(theme), str(tmpdir.join("out")),
+                       log_level=logging.WARNING, keep_going=True)
+    with pytest.raises(BuildError) as ex:
+        cs.render()
+    bad_fn = str(src.join("alpha/bad.md"))
+    assert [(d.file, d.line, d.kind) for d in ex.value.diagnostics] == \
+        [(bad_fn, 2, "metadata"), (bad_fn, 4, "link")]
+
+
+def test_externalized_links(tmpdir):
+    import json
+    from .collscientiae import CollScientiae
+    src, theme = tmpdir.join("src"), tmpdir.join("theme")
+    write_files(src, SOURCES)
+    write_files(theme, THEME)
+    src.join("config.yaml").write(SOURCES["config.yaml"] + "links: {inline: 1, shards: 1}\n")
+
+    cs = CollScientiae(str(src), str(theme), str(tmpdir.join("out")), log_level=logging.WARNING)
+    cs.render()
+    output = read_output(str(tmpdir.join("out")))
+    # "bb" has the backlinks "aa" and "cc", only the first one is in the page
+    assert b"aa cc" not in output[os.path.join("beta", "bb.html")]
+    links = json.loads(output[os.path.join("beta", "_links", "0.json")].decode("utf-8"))
+    assert [_["href"] for _ in links["bb"]["backlinks"]] == ["alpha/aa.html", "alpha/cc.html"]
+
+
+def test_warm_start(tmpdir):
+    from .collscientiae import CollScientiae
+    src, theme = tmpdir.join("src"), tmpdir.join("theme")
+    write_files(src, SOURCES)
+    write_files(theme, THEME)
+
+    def build(targ):
+        cs = CollScientiae(str(src), str(theme), str(tmpdir.join(targ)),
+                           log_level=logging.WARNING, reproducible=True)
+        cs.warm_start = True
+        processed = []
+        cs.process = lambda *args: processed.append(CollScientiae.process(cs, *args))
+        cs.render()
+        return len(processed) > 0, read_output(str(tmpdir.join(targ)))
+
+    processed, output = build("out1")
+    assert processed
+    assert build("out2") == (False, output)
+    theme.join("src/macros.html").write("<!-- changed -->")
+    assert build("out3")[0]
+
+
+def test_pack_with_variant(tmpdir):
+    from .archive import PageStore
+    from .collscientiae import CollScientiae
+    src, theme, theme2 = tmpdir.join("src"), tmpdir.join("theme"), tmpdir.join("theme2")
+    write_files(src, SOURCES)
+    write_files(theme, THEME)
+    write_files(theme2, THEME)
+    fn = str(tmpdir.join("pages.db"))
+    variant = tmpdir.join("variant")
+    variant.join("stale.html").write("", ensure=True)
+
+    cs = CollScientiae(str(src), str(theme), str(tmpdir.join("out")), log_level=logging.WARNING)
+    cs.pack(fn)
+    cs.render(variants=[(str(theme2), str(variant))])
+    assert PageStore(fn).get("alpha/aa.html") is not None
+    output = read_output(str(variant))
+    assert "stale.html" not in output
+    assert os.path.join("alpha", "aa.html") in output
+
+
+def test_revisions_moved_document(tmpdir):
+    from .collscientiae import CollScientiae, render_revisions
+    from .sources_test import git
+    src, theme = tmpdir.join("src"), tmpdir.join("theme")
+    write_files(src, SOURCES)
+    write_files(theme, THEME)
+    src.join("config.yaml").write(SOURCES["config.yaml"] + "layout: nested\n")
+    src.join("alpha/dd.md").write("title: D\n\nsee link[beta/bb] and #tag\n")
+    try:
+        git(str(src), "init", "-q")
+    except OSError:
+        pytest.skip("git is not available")
+    git(str(src), "add", "-A")
+    git(str(src), "commit", "-q", "-m", "v1")
+    git(str(src), "tag", "v1")
+    # the same content one level deeper, hence with other relative links
+    src.join("alpha/sub/dd.md").write(src.join("alpha/dd.md").read(), ensure=True)
+    git(str(src), "rm", "-q", "alpha/dd.md")
+    git(str(src), "add", "-A")
+    git(str(src), "commit", "-q", "-m", "v2")
+    git(str(src), "tag", "v2")
+
+    render_revisions(str(src), str(theme), str(tmpdir.join("out")), ["v1", "v2"],
+                     log_level=logging.WARNING)
+    cs = CollScientiae(str(src), str(theme), str(tmpdir.join("v2")),
+                       log_level=logging.WARNING, revision="v2")
+    try:
+        cs.render()
+    finally:
+        cs.source.close()
+    page = os.path.join("alpha", "sub", "dd.html")
+    assert b"../../beta/bb.html" in read_output(str(tmpdir.join("v2")))[page]
+    assert read_output(str(tmpdir.join("out", "v2")))[page] == \
+        read_output(str(tmpdir.join("v2")))[page]
+
+
+def test_variants_share_prev_next(tmpdir):
+    from .collscientiae import CollScientiae
+    src, theme = tmpdir.join("src"), tmpdir.join("theme")
+    write_files(src, SOURCES)
+    themed = dict(THEME)
+    themed["src/document.html"] = "{{ doc.prev.docid }} {{ doc.next.docid }}"
+    write_files(theme, themed)
+
+    cs = CollScientiae(str(src), str(theme), str(tmpdir.join("out")), log_level=logging.WARNING)
+    cs.render(variants=[(str(theme), str(tmpdir.join("variant")))])
+    for targ in ["out", "variant"]:
+        output = read_output(str(tmpdir.join(targ)))
+        assert output[os.path.join("alpha", "aa.html")] == b"cc cc\n"
+        assert output[os.path.join("beta", "bb.html")] == b"bb bb\n"
+
+    # only :meth:`.OutputRenderer.link_documents` modifies the shared documents
+    aa = cs.db.modules["alpha"]["aa"]
+    aa.prev = aa.next = None
+    cs.renderer.document_indices()
+    assert aa.prev is None and aa.next is None
+    cs.renderer.link_documents()
+    assert aa.prev.docid == aa.next.docid == "cc"
+
+
+def test_related_cache_per_source(tmpdir):
+    pytest.importorskip("numpy")
+    from .collscientiae import CollScientiae
+    theme = tmpdir.join("theme")
+    write_files(theme, THEME)
+    for name in ["src1", "src2"]:
+        src = tmpdir.join(name)
+        write_files(src, SOURCES)
+        src.join("config.yaml").write(SOURCES["config.yaml"] + "related: {top: 1}\n")
+        cs = CollScientiae(str(src), str(theme), str(tmpdir.join("out")),
+                           log_level=logging.WARNING)
+        cs.render()
+    assert len(theme.join(".cache", "related").listdir()) == 2
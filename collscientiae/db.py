@@ -1,6 +1,7 @@
 # coding=utf-8
 from __future__ import absolute_import, unicode_literals
 from collections import defaultdict, OrderedDict
+from .diagnostics import Diagnostics, line_of
 
 
 class DuplicateDocumentError(Exception):
@@ -13,6 +14,10 @@ class CollScientiaeDB(object):
 
     def __init__(self, collscientiae):
         self.log = collscientiae.log
+        # validation failures stop at the first one, unless the instance collects them
+        self.diagnostics = getattr(collscientiae, "diagnostics", None)
+        if self.diagnostics is None:
+            self.diagnostics = Diagnostics()
 
         # would be cooler if these three are in DocumentationModule, but
         # it can happen that the link exists before the module exists - TODO
@@ -50,20 +55,30 @@ class CollScientiaeDB(object):
                 node = module.tree
                 for level in doc.docid.split("."):
                     node = node[level]
-                if len(node) == 0:
-                    assert level != "index",\
-                        "There is the document {}/{} with the docid ending in '{}'!"\
-                        .format(key, doc, level)
+                if len(node) == 0 and level == "index":
+                    self.diagnostics.error(
+                        "docid", "There is the document {}/{} with the docid ending in '{}'!"
+                        .format(key, doc, level), doc.src_fn)
+                for sa in doc.seealso or []:
+                    if sa not in module:
+                        self.diagnostics.error("seealso", "unknown ID '{}' in 'seealso'".format(sa),
+                                               doc.src_fn, line_of(doc.md_raw, sa))
 
         # for ht, ids in self.hashtags.items():
         # self.log.debug("  #%s -> %s" % (ht, ids))
 
-        for links in [self.backlinks, self.knowls]:
-            for (ns, docid), docs in links.items():
-                assert ns in self.modules,\
-                    "illegal namespace '{}' in a knowl or link to {}".format(ns, docs)
-                assert docid in self.modules[ns],\
-                    "unkown ID '{}' in a knowl or link to {}".format(docid, docs)
+        # the knowls are registered as links, too
+        for (ns, docid), docs in self.backlinks.items():
+            if ns not in self.modules:
+                msg = "illegal namespace '{}' in a knowl or link to '{}'".format(ns, docid)
+            elif docid not in self.modules[ns]:
+                msg = "unkown ID '{}' in a knowl or link to '{}/{}'".format(docid, ns, docid)
+            else:
+                continue
+            for doc in docs:
+                line = line_of(doc.md_raw, "%s/%s" % (ns, docid)) or \
+                    line_of(doc.md_raw, "[" + docid)
+                self.diagnostics.error("link", msg, doc.src_fn, line)
 
     def register_module(self, module):
         from .models import DocumentationModule
@@ -86,14 +101,84 @@ class CollScientiaeDB(object):
             return
         self.backlinks[(ns, link_id)].add(document)
 
-    def resolve_forwardlinks(self):
+    def manifest(self):
+        """
+        A summary of all modules, which is sufficient to resolve links into them:
+        the title, subtitle, etc. of each document, the cross-module links and the hashtags.
+        See :meth:`.load_manifest`.
+        """
+        modules = OrderedDict()
+        for ns, module in self.modules.items():
+            modules[ns] = dict((docid, {"title": doc.title,
+                                        "subtitle": doc.subtitle,
+                                        "type": doc.type,
+                                        "group": doc.group,
+                                        "sort": doc.sort,
+                                        "hash": doc.hash})
+                               for docid, doc in module.items())
+        links = sorted([d.namespace, d.docid, ns, docid]
+                       for (ns, docid), docs in self.backlinks.items()
+                       for d in docs if d.namespace != ns)
+        hashtags = dict((ht, sorted([d.namespace, d.docid] for d in docs))
+                        for ht, docs in self.hashtags.items())
+        return {"modules": modules, "links": links, "hashtags": hashtags}
+
+    def load_manifest(self, manifest, namespaces):
+        """
+        Registers placeholder documents for all the modules in the manifest,
+        which are not among the given `namespaces`, along with their
+        cross-module links and hashtags.
+        Their modules must be registered already.
+        """
+        from .models import Document
+        stubs = {}
+        for ns, documents in manifest["modules"].items():
+            if ns in namespaces or ns not in self.modules:
+                continue
+            for docid, meta in documents.items():
+                meta = dict(meta)
+                doc = Document(docid=docid, md_raw=None, ns=ns, src_fn=None)
+                doc.hash = meta.pop("hash", None)
+                doc.update(output=None, **meta)
+                self.register(doc)
+                stubs[(ns, docid)] = doc
+
+        for src_ns, src_docid, ns, docid in manifest["links"]:
+            if (src_ns, src_docid) in stubs:
+                self.backlinks[(ns, docid)].add(stubs[(src_ns, src_docid)])
+
+        for hashtag, entries in manifest["hashtags"].items():
+            for ns, docid in entries:
+                if (ns, docid) in stubs:
+                    self.register_hashtag(hashtag, stubs[(ns, docid)])
+
+    def unregister_links(self, document):
+        """
+        Removes all hashtags, knowls and links registered by the given document,
+        e.g. before it is processed again.
+        """
+        for table in [self.hashtags, self.backlinks, self.knowls]:
+            for key, docs in list(table.items()):
+                docs.discard(document)
+                if len(docs) == 0:
+                    del table[key]
+        self.forwardlinks.pop(document, None)
+
+    def resolve_forwardlinks(self, documents=None, strict=True):
         """
         This must be only called once, after processing all documents.
         All forwardlinks are resolved to the actual documents.
+
+        :param documents: if given, only the forwardlinks of these (unresolved) documents
+                          are resolved.
+        :param strict: if False, links to unknown documents are silently dropped.
         """
-        fwl = defaultdict(set)
-        for doc, entries in self.forwardlinks.items():
-            for (ns, link_id) in entries:
-                target_doc = self.modules[ns][link_id]
-                fwl[doc].add(target_doc)
+        fwl = defaultdict(set) if documents is None else self.forwardlinks
+        for doc in list(self.forwardlinks) if documents is None else documents:
+            targets = set()
+            for (ns, link_id) in self.forwardlinks[doc]:
+                if not strict and (ns not in self.modules or link_id not in self.modules[ns]):
+                    continue
+                targets.add(self.modules[ns][link_id])
+            fwl[doc] = targets
         self.forwardlinks = fwl
@@ -0,0 +1,45 @@
+# coding=utf-8
+from __future__ import absolute_import
+import logging
+
+from .db import CollScientiaeDB
+from .models import Document, DocumentationModule
+
+
+class FakeCollScientiae(object):
+    log = logging.getLogger("TEST")
+
+
+def make_db(namespaces):
+    db = CollScientiaeDB(FakeCollScientiae())
+    for ns in namespaces:
+        db.register_module(DocumentationModule("/src/" + ns, name=ns, description=""))
+    return db
+
+
+def make_doc(db, ns, docid, title):
+    doc = Document(docid=docid, md_raw="", ns=ns, src_fn=None)
+    doc.update(output="", title=title, type="document")
+    db.register(doc)
+    return doc
+
+
+def test_manifest_roundtrip():
+    db = make_db(["alpha", "beta"])
+    a = make_doc(db, "alpha", "a", "A")
+    make_doc(db, "beta", "b.c", "BC")
+    db.register_link("beta", "b.c", a)
+    db.register_link("alpha", "a", a)
+    db.register_hashtag("tag", a)
+    manifest = db.manifest()
+    assert manifest["links"] == [["alpha", "a", "beta", "b.c"]]
+
+    # only "beta" is processed, "alpha" comes from the manifest
+    db2 = make_db(["alpha", "beta"])
+    b2 = make_doc(db2, "beta", "b.c", "BC")
+    db2.load_manifest(manifest, ["beta"])
+    assert db2.modules["alpha"]["a"].title == "A"
+    assert [d.docid for d in db2.backlinks[("beta", "b.c")]] == ["a"]
+    assert [d.docid for d in db2.hashtags["tag"]] == ["a"]
+    assert db2.modules["beta"]["b.c"] is b2
+    assert db2.manifest() == manifest
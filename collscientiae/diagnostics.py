@@ -0,0 +1,93 @@
+# -*- coding: utf8 -*-
+"""
+Validation failures of a build. By default, the first one stops the build.
+With `keep_going` (`build --keep-going`), all failures are collected as
+:class:`.Diagnostic` entries, the build continues until the consistency checks
+are done and then fails with one report of all of them, see :class:`.Diagnostics`.
+"""
+from __future__ import absolute_import, unicode_literals
+from collections import namedtuple
+from threading import Lock
+
+
+class Diagnostic(namedtuple("Diagnostic", ["file", "line", "kind", "message"])):
+
+    """
+    One validation failure: the source file and line (None, if unknown),
+    the kind of failure (e.g. "metadata" or "link") and the message.
+    """
+
+    __slots__ = ()
+
+    def __str__(self):
+        where = self.file or "-"
+        if self.line is not None:
+            where += ":%d" % self.line
+        return "%s: %s: %s" % (where, self.kind, self.message)
+
+
+class BuildError(Exception):
+
+    """
+    Raised at the end of a build with `keep_going`, if there were any diagnostics.
+    """
+
+    def __init__(self, diagnostics):
+        self.diagnostics = diagnostics
+        super(BuildError, self).__init__("%d errors:\n%s"
+                                         % (len(diagnostics), "\n".join(map(str, diagnostics))))
+
+
+def line_of(text, snippet):
+    """
+    The line number of the first occurrence of `snippet` in `text` or None.
+    """
+    if text is None:
+        return None
+    pos = text.find(snippet)
+    return None if pos < 0 else text.count("\n", 0, pos) + 1
+
+
+class Diagnostics(object):
+
+    """
+    Collects the validation failures, if `keep_going` is True,
+    otherwise :meth:`.error` raises the failure right away.
+    Recording is thread-safe and the report is sorted, hence it does not depend
+    on the order in which the failures happened.
+    """
+
+    def __init__(self, keep_going=False):
+        self.keep_going = keep_going
+        self.lock = Lock()
+        self.entries = []
+
+    def error(self, kind, message, file=None, line=None, exception=AssertionError):
+        """
+        Records a failure or raises it as `exception`, if the build stops at the first one.
+        """
+        if not self.keep_going:
+            raise exception(message)
+        with self.lock:
+            self.entries.append(Diagnostic(file, line, kind, message))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def sorted(self):
+        return sorted(set(self.entries), key=lambda d: (d.file or "", d.line or 0, d.kind, d.message))
+
+    def report(self, log):
+        """
+        Logs all failures and raises a :class:`.BuildError`, if there are any.
+        """
+        diagnostics = self.sorted()
+        if not diagnostics:
+            return
+        for d in diagnostics:
+            log.error(str(d))
+        log.error("%d errors" % len(diagnostics))
+        raise BuildError(diagnostics)
+
+    def to_json(self):
+        return [d._asdict() for d in self.sorted()]
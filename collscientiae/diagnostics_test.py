@@ -0,0 +1,34 @@
+# coding=utf-8
+from __future__ import absolute_import
+import logging
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+
+from .diagnostics import Diagnostics, BuildError, line_of
+
+FAILURES = [("link", "unknown ID 'b'", "a.md", 3),
+            ("metadata", "x not allowed", "a.md", 1),
+            ("link", "unknown ID 'c'", "b.md", None)]
+
+
+def test_stop_at_first():
+    with pytest.raises(ValueError):
+        Diagnostics().error("link", "invalid", exception=ValueError)
+
+
+def test_report_independent_of_order():
+    reports = []
+    for threads in [1, 3]:
+        diagnostics = Diagnostics(keep_going=True)
+        with ThreadPoolExecutor(threads) as pool:
+            list(pool.map(lambda f: diagnostics.error(*f), reversed(FAILURES * threads)))
+        with pytest.raises(BuildError) as ex:
+            diagnostics.report(logging.getLogger("TEST"))
+        reports.append(ex.value.diagnostics)
+    assert reports[0] == reports[1]
+    assert [(d.file, d.line) for d in reports[0]] == [("a.md", 1), ("a.md", 3), ("b.md", None)]
+
+
+def test_line_of():
+    assert line_of("title: A\n\nsee link[b]", "[b") == 3
+    assert line_of("title: A", "x") is None
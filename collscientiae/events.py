@@ -0,0 +1,77 @@
+# -*- coding: utf8 -*-
+"""
+Structured progress events of a build, written as JSON lines, e.g. ::
+
+    {"bytes": 0, "documents": 0, "elapsed": 0.012, "event": "phase", "pages": 0, "phase": "process"}
+    {"bytes": 0, "documents": 812, "elapsed": 1.013, "event": "progress", "pages": 0, "phase": "process"}
+
+Such a stream can be followed while the build is running, e.g. by a dashboard.
+"""
+from __future__ import absolute_import, unicode_literals
+import json
+from threading import Lock
+from time import time
+
+
+class EventStream(object):
+
+    """
+    Writes the events into the file-like `stream`.
+    Without a stream, nothing is recorded and all methods return immediately.
+
+    Each event has the seconds `elapsed` since the start, the current `phase`
+    and the counters so far: converted `documents`, written `pages` and their `bytes`.
+
+    :param interval: the counters are emitted as a "progress" event at most
+                     every `interval` seconds
+    """
+
+    def __init__(self, stream=None, interval=1.0):
+        self.stream = stream
+        self.interval = interval
+        self.lock = Lock()
+        self.start = self.last = time()
+        self.phase_name = None
+        self.counters = {"documents": 0, "pages": 0, "bytes": 0}
+
+    def emit(self, event, **data):
+        if self.stream is None:
+            return
+        with self.lock:
+            self._emit(event, data)
+
+    def _emit(self, event, data):
+        self.last = time()
+        data.update(self.counters)
+        data.update(event=event, phase=self.phase_name, elapsed=round(self.last - self.start, 3))
+        self.stream.write(json.dumps(data, sort_keys=True) + "\n")
+        self.stream.flush()
+
+    def phase(self, name, **data):
+        """
+        Starts the phase with the given `name`.
+        """
+        if self.stream is None:
+            return
+        with self.lock:
+            self.phase_name = name
+            self._emit("phase", data)
+
+    def count(self, documents=0, pages=0, bytes=0):
+        """
+        Adds to the counters, this is called from the writer threads, too.
+        """
+        if self.stream is None:
+            return
+        with self.lock:
+            self.counters["documents"] += documents
+            self.counters["pages"] += pages
+            self.counters["bytes"] += bytes
+            if time() - self.last >= self.interval:
+                self._emit("progress", {})
+
+    def done(self):
+        """
+        Emits the final counters.
+        """
+        self.emit("done")
@@ -0,0 +1,28 @@
+# coding=utf-8
+from __future__ import absolute_import
+import io
+import json
+
+from .events import EventStream
+
+
+def test_events():
+    stream = io.StringIO()
+    events = EventStream(stream, interval=0)
+    events.phase("process")
+    events.count(documents=2)
+    events.phase("documents", target="out")
+    events.count(pages=1, bytes=10)
+    events.done()
+    lines = [json.loads(_) for _ in stream.getvalue().splitlines()]
+    assert [_["event"] for _ in lines] == ["phase", "progress", "phase", "progress", "done"]
+    assert lines[2]["target"] == "out"
+    assert lines[-1]["phase"] == "documents"
+    assert (lines[-1]["documents"], lines[-1]["pages"], lines[-1]["bytes"]) == (2, 1, 10)
+
+
+def test_events_disabled():
+    events = EventStream()
+    events.phase("process")
+    events.count(documents=1)
+    assert events.counters["documents"] == 0
@@ -0,0 +1,190 @@
+# -*- coding: utf8 -*-
+"""
+Execution of the `python::` code blocks at build time, such that their output is
+shown right below the code, without waiting for a remote evaluation server.
+It is enabled by the `examples` entry of the main `config.yaml`, e.g. ::
+
+    examples:
+      timeout: 10      # seconds of CPU and wall time per block
+      memory: 256      # MiB of address space per block
+      processes: 4     # number of blocks, which are executed in parallel
+
+Each block runs in a fresh Python interpreter (``python -I``, i.e. without the user's
+site packages) in an empty temporary directory, with an empty environment and the limits
+above, in its own session, which is killed after the block. It cannot start processes.
+This only limits the resources and is no sandbox: the code can read and write files
+and access the network like the build itself, hence only build trusted sources.
+The results are cached on disk by the hash of the code, hence unchanged examples
+never run twice. Blocks, which fail or exceed a limit, show their error instead.
+"""
+from __future__ import absolute_import, unicode_literals
+import hashlib
+import json
+import os
+import signal
+import subprocess
+import sys
+from os.path import exists, dirname
+from .utils import ensure_dir
+
+# at most this many characters of the output are kept
+max_output = 10000
+
+
+def limit_resources(pid, timeout, memory):
+    """
+    Sets the limits of the child process `pid`, which is still waiting for its code on stdin.
+    This does not need a `preexec_fn`, which is unsafe in a process with threads.
+    Without :func:`resource.prlimit` (i.e. not on Linux), only the wall time is limited.
+    """
+    try:
+        import resource
+        prlimit = resource.prlimit
+    except (ImportError, AttributeError):
+        return
+    prlimit(pid, resource.RLIMIT_CPU, (timeout, timeout))
+    prlimit(pid, resource.RLIMIT_AS, (memory * 1024 * 1024, memory * 1024 * 1024))
+    prlimit(pid, resource.RLIMIT_CORE, (0, 0))
+    # no processes (and threads), not enforced for root, the session is killed anyway
+    prlimit(pid, resource.RLIMIT_NPROC, (0, 0))
+
+
+def kill(proc):
+    """
+    Kills the interpreter `proc` and all processes it started in its session.
+    """
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except OSError:
+        # the session is already empty
+        pass
+
+
+def execute(code, timeout=10, memory=256):
+    """
+    Executes the Python `code` in an interpreter with limited resources.
+
+    :return: a tuple of the captured output (stdout and stderr) and True, if it succeeded
+    """
+    output, ok, _ = _execute(code, timeout, memory)
+    return output, ok
+
+
+def _execute(code, timeout, memory):
+    """
+    Like :func:`.execute`, but the tuple has a third entry, which is True,
+    if the interpreter was killed, i.e. after a timeout or by a signal.
+    """
+    from tempfile import mkdtemp
+    from shutil import rmtree
+    cwd = mkdtemp(prefix="collscientiae-example-")
+    try:
+        proc = subprocess.Popen([sys.executable, "-I", "-"], cwd=cwd, env={},
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT, start_new_session=True)
+        try:
+            # the interpreter reads all of stdin before it runs the code
+            limit_resources(proc.pid, timeout, memory)
+        except Exception:
+            kill(proc)
+            proc.communicate()
+            raise
+        try:
+            # this also waits for processes in the background, which keep the output open
+            output, _ = proc.communicate(code.encode("utf8"), timeout=timeout)
+        except subprocess.TimeoutExpired:
+            kill(proc)
+            try:
+                proc.communicate(timeout=1)
+            except subprocess.TimeoutExpired:
+                # a process left the session and keeps the output open
+                proc.stdout.close()
+                proc.wait()
+            return "timeout after %d seconds" % timeout, False, True
+        kill(proc)
+    finally:
+        rmtree(cwd, ignore_errors=True)
+    output = output.decode("utf8", "replace")
+    if proc.returncode < 0:
+        if -proc.returncode == getattr(signal, "SIGXCPU", None):
+            # the CPU limit was hit before the wall time limit
+            return "timeout after %d seconds" % timeout, False, True
+        output += "\nterminated by signal %d" % -proc.returncode
+    if len(output) > max_output:
+        output = output[:max_output] + "\n..."
+    return output, proc.returncode == 0, proc.returncode < 0
+
+
+class ExampleRunner(object):
+
+    """
+    Executes code blocks with :func:`.execute` in a pool of `processes` workers and
+    keeps the results in a cache, which is read from and saved to the JSON file `cache_fn`.
+    Blocks, which were killed (e.g. after a timeout on a busy machine), are not cached.
+    """
+
+    def __init__(self, timeout=10, memory=256, processes=4, cache_fn=None):
+        self.timeout = timeout
+        self.memory = memory
+        self.cache_fn = cache_fn
+        # maps the hash of a block to its output and whether it succeeded
+        self.cache = {}
+        self.modified = False
+        self.processes = processes
+        # started by :meth:`.run` and stopped by :meth:`.close`
+        self.pool = None
+        self.blocks = 0
+        self.executed = 0
+        self.failed = 0
+        if cache_fn is not None and exists(cache_fn):
+            with open(cache_fn, "r") as f:
+                self.cache = json.load(f)
+
+    def key(self, code):
+        data = "%s %d %d %s" % (sys.version, self.timeout, self.memory, code)
+        return hashlib.sha1(data.encode("utf8")).hexdigest()
+
+    def run(self, codes):
+        """
+        Executes all the given code blocks in parallel, if they are not cached.
+
+        :return: a list of tuples of their output and whether they succeeded
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        if self.pool is None:
+            # the threads only wait for the interpreters, which do the work
+            self.pool = ThreadPoolExecutor(self.processes)
+        keys = [self.key(_) for _ in codes]
+        futures = dict((key, self.pool.submit(_execute, code, self.timeout, self.memory))
+                       for key, code in zip(keys, codes) if key not in self.cache)
+        killed = {}
+        for key, future in futures.items():
+            output, ok, was_killed = future.result()
+            if was_killed:
+                killed[key] = (output, ok)
+            else:
+                self.cache[key] = (output, ok)
+                self.modified = True
+            self.executed += 1
+        results = [tuple(killed[_] if _ in killed else self.cache[_]) for _ in keys]
+        self.blocks += len(results)
+        self.failed += sum(1 for _, ok in results if not ok)
+        return results
+
+    def save(self):
+        if self.cache_fn is None or not self.modified:
+            return
+        ensure_dir(dirname(self.cache_fn))
+        with open(self.cache_fn, "w") as f:
+            json.dump(self.cache, f)
+        self.modified = False
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def stats(self):
+        return {"blocks": self.blocks,
+                "executed": self.executed,
+                "failed": self.failed}
@@ -0,0 +1,45 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+from .examples import execute, ExampleRunner
+
+
+def test_execute():
+    assert execute("print(1 + 2)") == ("3\n", True)
+    output, ok = execute("import os\nprint(sorted(os.environ))\nraise ValueError('x')")
+    assert not ok and "ValueError: x" in output
+    output, ok = execute("while True: pass", timeout=1)
+    assert not ok and "timeout" in output
+    output, ok = execute("x = bytearray(512 * 1024 * 1024)", memory=64)
+    assert not ok and "MemoryError" in output
+
+
+def test_runner_cache(tmpdir):
+    cache_fn = str(tmpdir.join("examples.json"))
+    runner = ExampleRunner(cache_fn=cache_fn)
+    assert runner.run(["print('a')", "print('b')"]) == [("a\n", True), ("b\n", True)]
+    runner.save()
+    runner.close()
+
+    runner = ExampleRunner(cache_fn=cache_fn)
+    assert runner.run(["print('a')"]) == [("a\n", True)]
+    assert runner.stats() == {"blocks": 1, "executed": 0, "failed": 0}
+    runner.close()
+
+
+def test_runner_killed_not_cached(tmpdir):
+    cache_fn = str(tmpdir.join("examples.json"))
+    runner = ExampleRunner(timeout=1, cache_fn=cache_fn)
+    [(output, ok)] = runner.run(["while True: pass"])
+    assert not ok and "timeout" in output
+    assert runner.cache == {} and not runner.modified
+    runner.close()
+
+
+def test_execute_kills_background_processes():
+    from time import time
+    start = time()
+    code = "import subprocess, time\nsubprocess.Popen(['sleep', '30'])\ntime.sleep(30)"
+    output, ok = execute(code, timeout=1)
+    assert not ok and "timeout" in output
+    assert time() - start < 10
@@ -0,0 +1,92 @@
+# -*- coding: utf8 -*-
+"""
+Syntax highlighting of code blocks at build time with Pygments, instead of
+highlighting them in the browser. It is enabled by the `highlight` entry of the
+main `config.yaml`, e.g. ::
+
+    highlight:
+      style: default   # the Pygments style of the stylesheet
+
+The highlighted code keeps its `<code class="language-...">` element and gets the
+additional class `highlight`. Themes include the stylesheet for the tokens with
+``<style>{{ highlight_css }}</style>``.
+Each distinct (language, code) pair is highlighted only once and the results are cached
+on disk by its hash. Code in languages, which Pygments does not know, is left as it is.
+"""
+from __future__ import absolute_import, unicode_literals
+import hashlib
+import json
+from os.path import exists, dirname
+from .utils import ensure_dir
+
+
+def options(config):
+    return config if isinstance(config, dict) else {}
+
+
+def stylesheet(config):
+    """
+    The CSS for the tokens of the highlighted code or an empty string, if it is not enabled.
+    """
+    if not config:
+        return ""
+    from pygments.formatters import HtmlFormatter
+    style = options(config).get("style", "default")
+    return HtmlFormatter(style=style).get_style_defs("code.highlight")
+
+
+class Highlighter(object):
+
+    """
+    Highlights code and keeps the results in a cache,
+    which is read from and saved to the JSON file `cache_fn`.
+    """
+
+    def __init__(self, cache_fn=None):
+        import pygments
+        self.version = pygments.__version__
+        self.cache_fn = cache_fn
+        # maps the hash of the language and code to the html or None, if it is unknown
+        self.cache = {}
+        self.modified = False
+        self.blocks = 0
+        self.highlighted = 0
+        if cache_fn is not None and exists(cache_fn):
+            with open(cache_fn, "r") as f:
+                self.cache = json.load(f)
+
+    def key(self, lang, code):
+        data = "%s %s %s" % (self.version, lang, code)
+        return hashlib.sha1(data.encode("utf8")).hexdigest()
+
+    def highlight(self, lang, code):
+        """
+        Returns the html of the tokens of the code or None, if the language is unknown.
+        """
+        self.blocks += 1
+        key = self.key(lang, code)
+        if key not in self.cache:
+            from pygments import highlight
+            from pygments.lexers import get_lexer_by_name
+            from pygments.formatters import HtmlFormatter
+            from pygments.util import ClassNotFound
+            try:
+                lexer = get_lexer_by_name(lang, stripnl=False, ensurenl=False)
+                self.cache[key] = highlight(code, lexer, HtmlFormatter(nowrap=True))
+                self.highlighted += 1
+            except ClassNotFound:
+                self.cache[key] = None
+            self.modified = True
+        return self.cache[key]
+
+    def save(self):
+        if self.cache_fn is None or not self.modified:
+            return
+        ensure_dir(dirname(self.cache_fn))
+        with open(self.cache_fn, "w") as f:
+            json.dump(self.cache, f)
+        self.modified = False
+
+    def stats(self):
+        return {"blocks": self.blocks,
+                "highlighted": self.highlighted}
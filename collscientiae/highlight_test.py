@@ -0,0 +1,27 @@
+# coding=utf-8
+from __future__ import absolute_import
+import pytest
+
+pytest.importorskip("pygments")
+
+from .highlight import Highlighter, stylesheet
+
+
+def test_highlight_cache(tmpdir):
+    cache_fn = str(tmpdir.join("highlight.json"))
+    hl = Highlighter(cache_fn)
+    html = hl.highlight("python", "print(1)\n")
+    assert '<span class="nb">print</span>' in html
+    assert hl.highlight("python", "print(1)\n") == html
+    assert hl.highlight("no-such-language", "x") is None
+    assert hl.stats() == {"blocks": 3, "highlighted": 1}
+    hl.save()
+
+    hl = Highlighter(cache_fn)
+    assert hl.highlight("python", "print(1)\n") == html
+    assert hl.stats()["highlighted"] == 0
+
+
+def test_stylesheet():
+    assert stylesheet(None) == ""
+    assert "code.highlight .k" in stylesheet({"style": "default"})
@@ -0,0 +1,138 @@
+# -*- coding: utf8 -*-
+"""
+Optional optimization of the images in the modules' `img` directories, this needs Pillow.
+It is enabled by the `images` entry of the main `config.yaml`, e.g. ::
+
+    images:
+      quality: 85          # for JPEG images
+      widths: [480, 960]   # responsive variants
+
+Each PNG and JPEG image is recompressed, if this makes it smaller, and additionally
+resized to all `widths` smaller than the image, e.g. `img/plot.png` gets `img/plot-480w.png`.
+The images are processed in a process pool and the results are cached on disk
+by the hash of the source image, hence each image is only processed once across builds.
+Images, which Pillow cannot process, are used as they are and tried again in the next build.
+"""
+from __future__ import absolute_import, unicode_literals
+import hashlib
+import json
+import logging
+from os.path import join, exists, getsize, splitext
+from shutil import copyfile
+from .utils import ensure_dir
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = ImageOps = None
+
+formats = {".png": "PNG", ".jpg": "JPEG", ".jpeg": "JPEG"}
+
+
+def variant_fn(fn, width):
+    base, ext = splitext(fn)
+    return "%s-%dw%s" % (base, width, ext)
+
+
+def optimize(src_fn, cache_fn, widths, quality):
+    """
+    Writes the recompressed image to `cache_fn` and its resized variants next to it.
+    This runs in the process pool.
+
+    :return: the widths of the written variants
+    """
+    fmt = formats[splitext(cache_fn)[1].lower()]
+    options = {"optimize": True}
+    if fmt == "JPEG":
+        options.update(quality=quality, progressive=True)
+    img = Image.open(src_fn)
+    img.load()
+    # the pixels are rotated as the camera says, the color profile is kept
+    img = ImageOps.exif_transpose(img)
+    for name in ["icc_profile", "exif"]:
+        if img.info.get(name):
+            options[name] = img.info[name]
+    img.save(cache_fn, fmt, **options)
+    if getsize(cache_fn) >= getsize(src_fn):
+        copyfile(src_fn, cache_fn)
+    written = []
+    for width in sorted(widths):
+        if width >= img.width:
+            continue
+        height = max(1, int(round(img.height * width / float(img.width))))
+        img.resize((width, height), Image.LANCZOS).save(variant_fn(cache_fn, width), fmt, **options)
+        written.append(width)
+    return written
+
+
+class ImageOptimizer(object):
+
+    """
+    Optimizes images into the `cache_dir`, see :func:`.optimize`.
+
+    :param processes: size of the process pool, by default the number of CPUs
+    :param log: the logger for images, which cannot be optimized
+    """
+
+    def __init__(self, cache_dir, widths=(), quality=85, processes=None, log=None):
+        self.cache_dir = cache_dir
+        self.widths = list(widths)
+        self.quality = quality
+        self.processes = processes
+        self.log = log or logging.getLogger("collscientiae")
+        self.processed = 0
+        self.cached = 0
+        self.failed = 0
+
+    @staticmethod
+    def supported(fn):
+        return splitext(fn)[1].lower() in formats
+
+    def cache_fn(self, src_fn):
+        """
+        The cached file depends on the content of the image and the settings.
+        """
+        h = hashlib.sha1(json.dumps([self.widths, self.quality]).encode("utf-8"))
+        with open(src_fn, "rb") as f:
+            h.update(f.read())
+        return join(self.cache_dir, h.hexdigest() + splitext(src_fn)[1].lower())
+
+    def optimize(self, src_fns):
+        """
+        Returns for each source image the optimized file and its variants,
+        a list of (width, filename) pairs, where the width of the optimized file is None.
+        """
+        from concurrent.futures import ProcessPoolExecutor
+        ensure_dir(self.cache_dir)
+        cache_fns = [self.cache_fn(_) for _ in src_fns]
+        results = [None] * len(src_fns)
+        pending = []
+        for i, (src_fn, cache_fn) in enumerate(zip(src_fns, cache_fns)):
+            # the list of widths is written last, hence it marks a complete entry
+            if exists(cache_fn + ".json"):
+                with open(cache_fn + ".json", "r") as f:
+                    results[i] = json.load(f)
+                self.cached += 1
+            else:
+                pending.append(i)
+
+        if len(pending) > 0:
+            with ProcessPoolExecutor(self.processes) as pool:
+                futures = [(i, pool.submit(optimize, src_fns[i], cache_fns[i],
+                                           self.widths, self.quality)) for i in pending]
+                for i, future in futures:
+                    try:
+                        results[i] = future.result()
+                    except Exception as ex:
+                        # the original without variants and no marker, hence it is tried again
+                        self.log.warning("image '{}' is not optimized: {}".format(src_fns[i], ex))
+                        copyfile(src_fns[i], cache_fns[i])
+                        results[i] = []
+                        self.failed += 1
+                        continue
+                    with open(cache_fns[i] + ".json", "w") as f:
+                        json.dump(results[i], f)
+                    self.processed += 1
+
+        return [[(None, cache_fn)] + [(w, variant_fn(cache_fn, w)) for w in widths]
+                for cache_fn, widths in zip(cache_fns, results)]
@@ -0,0 +1,56 @@
+# coding=utf-8
+from __future__ import absolute_import
+from os.path import getsize
+import pytest
+
+from .images import ImageOptimizer, variant_fn
+
+
+def test_variant_fn():
+    assert variant_fn("img/plot.png", 480) == "img/plot-480w.png"
+
+
+def test_optimize_cached(tmpdir):
+    Image = pytest.importorskip("PIL.Image")
+    src_fn = str(tmpdir.join("plot.png"))
+    Image.new("RGB", (200, 100), (255, 0, 0)).save(src_fn, compress_level=0)
+    optimizer = ImageOptimizer(str(tmpdir.join("cache")), widths=[50, 400], processes=1)
+    [files] = optimizer.optimize([src_fn])
+    assert [w for w, _ in files] == [None, 50]
+    assert Image.open(files[1][1]).size == (50, 25)
+    assert getsize(files[0][1]) < getsize(src_fn)
+    assert optimizer.optimize([src_fn]) == [files]
+    assert (optimizer.processed, optimizer.cached) == (1, 1)
+
+
+def test_optimize_corrupt(tmpdir):
+    Image = pytest.importorskip("PIL.Image")
+    good_fn, bad_fn = str(tmpdir.join("good.png")), str(tmpdir.join("bad.png"))
+    Image.new("RGB", (200, 100), (255, 0, 0)).save(good_fn)
+    tmpdir.join("bad.png").write("not an image")
+    optimizer = ImageOptimizer(str(tmpdir.join("cache")), widths=[50], processes=1)
+    good, bad = optimizer.optimize([good_fn, bad_fn])
+    assert [w for w, _ in good] == [None, 50]
+    assert len(bad) == 1
+    with open(bad[0][1]) as f:
+        assert f.read() == "not an image"
+    assert (optimizer.processed, optimizer.failed) == (1, 1)
+    optimizer.optimize([good_fn, bad_fn])
+    assert (optimizer.cached, optimizer.failed) == (1, 2)
+
+
+def test_optimize_oriented(tmpdir):
+    Image = pytest.importorskip("PIL.Image")
+    src_fn = str(tmpdir.join("photo.jpg"))
+    exif = Image.Exif()
+    # rotated by 90 degrees, as phones write it
+    exif[0x0112] = 6
+    profile = b"\0" * 128
+    Image.new("RGB", (200, 100), (255, 0, 0)).save(src_fn, quality=100, exif=exif,
+                                                   icc_profile=profile)
+    optimizer = ImageOptimizer(str(tmpdir.join("cache")), widths=[50], processes=1)
+    [files] = optimizer.optimize([src_fn])
+    variant = Image.open(files[1][1])
+    assert variant.size == (50, 100)
+    assert variant.getexif().get(0x0112, 1) == 1
+    assert variant.info["icc_profile"] == profile
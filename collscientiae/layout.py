@@ -0,0 +1,77 @@
+# -*- coding: utf8 -*-
+"""
+Output layouts, i.e. where the pages of the documents of a module are written.
+The layout is selected by the `layout` entry of the main `config.yaml`:
+
+* `flat` (default): all pages of a module are in its directory,
+  e.g. `ns/a.b.c.html` and the index of `a.b` in `ns/a.b.index.html`.
+* `nested`: the dotted document IDs are mapped to directories,
+  e.g. `ns/a/b/c.html` and the index of `a.b` in `ns/a/b.index.html`.
+  This keeps directories small for modules with a huge number of documents.
+
+All paths are relative to the module's directory and without the `.html` extension.
+"""
+from __future__ import absolute_import, unicode_literals
+
+
+class FlatLayout(object):
+
+    name = "flat"
+
+    def path(self, docid):
+        """
+        The path of the page for the document ID, or the index, if it ends with ".index".
+        """
+        return docid
+
+    def depth(self, docid):
+        """
+        The number of directories of the path below the module's directory.
+        """
+        return 0
+
+    def level(self, docid):
+        """
+        The number of directories of the page's path below the target directory,
+        i.e. the `level` of the `prefix` filter.
+        """
+        return 1 + self.depth(docid)
+
+    def relative(self, docid, target):
+        """
+        The path of the page for `target`, relative to the page for `docid` in the same module.
+        """
+        return "../" * self.depth(docid) + self.path(target)
+
+    def link(self, docid, namespace, target):
+        """
+        The href from the page for `docid` to the page of the document `target` in `namespace`.
+        """
+        return "../" * self.level(docid) + "%s/%s.html" % (namespace, self.path(target))
+
+
+class NestedLayout(FlatLayout):
+
+    name = "nested"
+
+    def path(self, docid):
+        if docid.endswith(".index"):
+            return self.path(docid[:-len(".index")]) + ".index"
+        return docid.replace(".", "/")
+
+    def depth(self, docid):
+        if docid.endswith(".index"):
+            docid = docid[:-len(".index")]
+        return docid.count(".")
+
+
+layouts = dict((_.name, _) for _ in [FlatLayout, NestedLayout])
+
+
+def get_layout(name=None):
+    """
+    The layout with the given name, defaults to the flat layout.
+    """
+    if name not in layouts and name is not None:
+        raise ValueError("unknown layout '%s', must be one of %s" % (name, sorted(layouts)))
+    return layouts[name or FlatLayout.name]()
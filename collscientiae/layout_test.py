@@ -0,0 +1,29 @@
+# coding=utf-8
+from __future__ import absolute_import
+import pytest
+
+from .layout import get_layout
+from .models import Index
+
+
+def test_flat_layout():
+    layout = get_layout()
+    assert layout.path("a.b.c") == "a.b.c"
+    assert layout.level("a.b.c") == 1
+    assert layout.link("a.b", "ns", "x.y") == "../ns/x.y.html"
+    assert layout.relative("a.b", "a.index") == "a.index"
+
+
+def test_nested_layout():
+    layout = get_layout("nested")
+    assert layout.path("a.b.c") == "a/b/c"
+    assert layout.path("a.b.index") == "a/b.index"
+    assert layout.level("a.b.c") == 3
+    assert layout.level("a.b.index") == 2
+    assert layout.link("a.b", "ns", "x.y") == "../../ns/x/y.html"
+    assert layout.relative("a.b.c", "a.b.index") == "../../a/b.index"
+    entry = Index.Entry("C", "a.b.c", type="dir", prefix=layout.depth("a.b"),
+                        path=layout.path("a.b.c"))
+    assert entry.href == "../a/b/c.index"
+    with pytest.raises(ValueError):
+        get_layout("deep")
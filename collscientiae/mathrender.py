@@ -0,0 +1,127 @@
+# -*- coding: utf8 -*-
+"""
+Rendering of LaTeX math at build time, instead of typesetting it with MathJax in the browser.
+It is enabled by the `math` entry of the main `config.yaml`, e.g. ::
+
+    math:
+      backend: latex2mathml    # or "package.module:function"
+
+A backend is a function `render(tex, display)`, which returns the html for the LaTeX
+snippet `tex` (without its delimiters). `display` is True for `$$..$$` and `\\[..\\]`.
+Each distinct snippet is rendered only once and the results are cached on disk by
+its hash and the version of the backend's package. Snippets, which the backend fails to render, are left as they are,
+such that MathJax still typesets them in the browser.
+"""
+from __future__ import absolute_import, unicode_literals
+import hashlib
+import json
+import re
+from os.path import exists, dirname
+from .utils import ensure_dir
+
+
+# a control sequence, which latex2mathml did not know, e.g. a module's `latex_macros`
+_unresolved = re.compile(r"\\[A-Za-z]+")
+
+
+def latex2mathml_backend(tex, display):
+    """
+    LaTeX to MathML in pure Python, using the `latex2mathml` package.
+    It keeps unknown commands as text instead of failing, these are failures here.
+    """
+    from latex2mathml.converter import convert
+    html = convert(tex, display="block" if display else "inline")
+    m = _unresolved.search(html)
+    if m is not None:
+        raise ValueError("unknown command '%s'" % m.group())
+    return html
+
+
+backends = {"latex2mathml": latex2mathml_backend}
+# the package of each of the :data:`.backends`
+packages = {"latex2mathml": "latex2mathml"}
+
+
+def load_backend(name):
+    """
+    The backend function for a name in :data:`.backends` or a "package.module:function".
+    """
+    if name in backends:
+        return backends[name]
+    from importlib import import_module
+    module, _, function = name.partition(":")
+    return getattr(import_module(module), function)
+
+
+def backend_version(name):
+    """
+    The version of the package of the backend, e.g. "3.81.1" for latex2mathml,
+    or "" if it is unknown.
+    """
+    from importlib import import_module
+    package = packages.get(name) or name.partition(":")[0].split(".")[0]
+    try:
+        from importlib.metadata import version
+        return version(package)
+    except Exception:
+        return getattr(import_module(package), "__version__", "")
+
+
+class MathRenderer(object):
+
+    """
+    Renders math snippets with the given `backend` and keeps the results in
+    a cache, which is read from and saved to the JSON file `cache_fn`.
+    The cached results of another version of the backend's package are not used.
+    """
+
+    def __init__(self, backend, cache_fn=None):
+        self.name = backend
+        self.backend = load_backend(backend)
+        self.version = backend_version(backend)
+        self.cache_fn = cache_fn
+        # maps the hash of a snippet to its html or None, if it failed
+        self.cache = {}
+        self.modified = False
+        self.snippets = 0
+        self.rendered = 0
+        self.fallbacks = 0
+        if cache_fn is not None and exists(cache_fn):
+            with open(cache_fn, "r") as f:
+                self.cache = json.load(f)
+
+    def key(self, tex, display):
+        data = "%s %s %s %s" % (self.name, self.version, "display" if display else "inline", tex)
+        return hashlib.sha1(data.encode("utf8")).hexdigest()
+
+    def render(self, tex, display=False):
+        """
+        Returns the html for the snippet or None, if the backend failed to render it.
+        """
+        self.snippets += 1
+        key = self.key(tex, display)
+        if key not in self.cache:
+            try:
+                self.cache[key] = self.backend(tex, display)
+                self.rendered += 1
+            except Exception:
+                self.cache[key] = None
+            self.modified = True
+        html = self.cache[key]
+        if html is None:
+            self.fallbacks += 1
+        return html
+
+    def save(self):
+        if self.cache_fn is None or not self.modified:
+            return
+        ensure_dir(dirname(self.cache_fn))
+        with open(self.cache_fn, "w") as f:
+            json.dump(self.cache, f)
+        self.modified = False
+
+    def stats(self):
+        return {"backend": self.name,
+                "snippets": self.snippets,
+                "rendered": self.rendered,
+                "fallbacks": self.fallbacks}
@@ -0,0 +1,43 @@
+# coding=utf-8
+from __future__ import absolute_import
+import pytest
+
+from .mathrender import MathRenderer
+
+
+def upper(tex, display):
+    if "{" in tex:
+        raise ValueError(tex)
+    return "<m %s>%s</m>" % ("block" if display else "inline", tex.upper())
+
+
+def test_render_cached(tmpdir):
+    cache_fn = str(tmpdir.join("math", "cache.json"))
+    math = MathRenderer("collscientiae.mathrender_test:upper", cache_fn)
+    assert math.render("x^2") == "<m inline>X^2</m>"
+    assert math.render("x^2", display=True) == "<m block>X^2</m>"
+    assert math.render("x^2") == "<m inline>X^2</m>"
+    # failures are left for MathJax
+    assert math.render("\\frac{a}{") is None
+    assert math.stats()["rendered"] == 2
+    math.save()
+
+    math = MathRenderer("collscientiae.mathrender_test:upper", cache_fn)
+    assert math.render("x^2") == "<m inline>X^2</m>"
+    assert math.render("\\frac{a}{") is None
+    assert (math.rendered, math.fallbacks) == (0, 1)
+
+
+def test_cache_depends_on_version():
+    math = MathRenderer("collscientiae.mathrender_test:upper")
+    key = math.key("x", False)
+    math.version += ".1"
+    assert math.key("x", False) != key
+
+
+def test_latex2mathml_unknown_command():
+    pytest.importorskip("latex2mathml")
+    math = MathRenderer("latex2mathml")
+    assert "<mfrac>" in math.render("\\frac{a}{b}")
+    # e.g. a macro of the module, MathJax knows it
+    assert math.render("x \\in \\R") is None
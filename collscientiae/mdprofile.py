@@ -0,0 +1,150 @@
+# -*- coding: utf8 -*-
+"""
+Profiling of the Markdown conversion: the time spent in each inline pattern
+(matching its regex and handling the matches) and each block processor
+(testing and running it), per document and in total, see :class:`.MarkdownProfiler`.
+"""
+from __future__ import absolute_import, unicode_literals
+from collections import OrderedDict, defaultdict
+from time import perf_counter
+
+
+class TimedRegex(object):
+
+    """
+    Proxy for a compiled regex, which records the time of :meth:`match`.
+    """
+
+    def __init__(self, regex, record):
+        self.regex = regex
+        self.record = record
+
+    def match(self, *args, **kwargs):
+        start = perf_counter()
+        try:
+            return self.regex.match(*args, **kwargs)
+        finally:
+            self.record(perf_counter() - start)
+
+    def __getattr__(self, name):
+        return getattr(self.regex, name)
+
+
+class MarkdownProfiler(object):
+
+    """
+    Instruments all inline patterns and block processors of a :class:`markdown.Markdown`
+    instance and records the number of calls and the time of each of them,
+    for each document between :meth:`.begin` and :meth:`.end`.
+
+    :param top: number of the slowest documents, which are kept for each pattern
+    """
+
+    def __init__(self, top=5):
+        self.top = top
+        # for the current document: maps "kind:name" to [calls, matches, seconds]
+        self.current = defaultdict(lambda: [0, 0, 0.])
+        self.totals = defaultdict(lambda: [0, 0, 0.])
+        # maps "kind:name" to a list of (seconds, document) of the slowest documents
+        self.slowest = defaultdict(list)
+        self.documents = 0
+        self.time = 0.
+        self.started = None
+
+    def timed(self, name, func, matches=False):
+        stats = self.current
+
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                entry = stats[name]
+                entry[2] += perf_counter() - start
+                if matches:
+                    entry[1] += 1
+                else:
+                    entry[0] += 1
+        return wrapper
+
+    def recorder(self, name):
+        stats = self.current
+
+        def record(seconds):
+            entry = stats[name]
+            entry[0] += 1
+            entry[2] += seconds
+        return record
+
+    def instrument(self, md):
+        """
+        Wraps the inline patterns and block processors of `md` in place.
+        For a pattern, the calls are the regex matches and the matches are the
+        calls of `handleMatch`. For a block processor, the calls are the calls of `test`
+        and the matches are the calls of `run`.
+        """
+        for key in list(md.inlinePatterns.keys()):
+            pattern = md.inlinePatterns[key]
+            name = "pattern:" + key
+            pattern.compiled_re = TimedRegex(pattern.compiled_re, self.recorder(name))
+            pattern.handleMatch = self.timed(name, pattern.handleMatch, matches=True)
+        for key in list(md.parser.blockprocessors.keys()):
+            processor = md.parser.blockprocessors[key]
+            name = "block:" + key
+            processor.test = self.timed(name, processor.test)
+            processor.run = self.timed(name, processor.run, matches=True)
+
+    def begin(self):
+        self.current.clear()
+        self.started = perf_counter()
+
+    def end(self, document):
+        """
+        Adds the recorded calls of the converted `document` to the totals.
+        """
+        self.time += perf_counter() - self.started
+        self.documents += 1
+        name = "%s/%s" % (document.namespace, document.docid)
+        for key, (calls, matches, seconds) in self.current.items():
+            total = self.totals[key]
+            total[0] += calls
+            total[1] += matches
+            total[2] += seconds
+            slowest = self.slowest[key]
+            slowest.append((seconds, name))
+            slowest.sort(reverse=True)
+            del slowest[self.top:]
+        self.current.clear()
+
+    def stats(self):
+        """
+        The totals of all patterns and block processors, sorted by their time.
+        """
+        stats = []
+        for key, (calls, matches, seconds) in sorted(self.totals.items(),
+                                                     key=lambda _: -_[1][2]):
+            stats.append(OrderedDict([("name", key),
+                                      ("calls", calls),
+                                      ("matches", matches),
+                                      ("time", seconds),
+                                      ("slowest", [OrderedDict([("document", doc), ("time", t)])
+                                                   for t, doc in self.slowest[key]])]))
+        return stats
+
+    def report(self, log, top=10):
+        log.info("markdown profile: {} documents, {:.3f}s converting"
+                 .format(self.documents, self.time))
+        for entry in self.stats()[:top]:
+            slowest = entry["slowest"][0] if entry["slowest"] else {"document": "-", "time": 0.}
+            log.info("  {name:<24s} {time:8.3f}s {calls:9d} calls {matches:8d} matches"
+                     .format(**entry) +
+                     ", slowest {document} ({time:.3f}s)".format(**slowest))
+
+    def save(self, fn):
+        """
+        Writes the profile as JSON into the file `fn`.
+        """
+        import json
+        with open(fn, "w") as f:
+            json.dump({"documents": self.documents, "time": self.time, "stats": self.stats()},
+                      f, indent=1)
@@ -0,0 +1,22 @@
+# coding=utf-8
+from __future__ import absolute_import
+import markdown
+
+from .mdprofile import MarkdownProfiler
+from .models import Document
+
+
+def test_profile_patterns():
+    md = markdown.Markdown()
+    profiler = MarkdownProfiler(top=1)
+    profiler.instrument(md)
+    for docid, text in [("a", "*one* and *two*"), ("b", "plain\n\n    code")]:
+        profiler.begin()
+        html = md.reset().convert(text)
+        profiler.end(Document(docid=docid, md_raw=text, ns="alpha", src_fn=None))
+    assert "<em>two</em>" in html or "<code>code" in html
+    stats = dict((_["name"], _) for _ in profiler.stats())
+    assert stats["pattern:emphasis"]["matches"] == 2
+    assert stats["pattern:emphasis"]["slowest"][0]["document"] == "alpha/a"
+    assert stats["block:code"]["matches"] == 1
+    assert profiler.documents == 2
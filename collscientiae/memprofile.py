@@ -0,0 +1,112 @@
+# -*- coding: utf8 -*-
+"""
+Memory profiling of a build with :mod:`tracemalloc`, see :class:`.MemoryProfiler`.
+"""
+from __future__ import absolute_import, unicode_literals
+import sys
+import tracemalloc
+from collections import OrderedDict
+
+
+def tree_size(node):
+    """
+    Approximate size of a document tree in bytes, i.e. all its nodes and keys.
+    """
+    size = sys.getsizeof(node) + sys.getsizeof(node.__dict__)
+    for key, node2 in node.items():
+        size += sys.getsizeof(key) + tree_size(node2)
+    return size
+
+
+def table_size(table):
+    """
+    Approximate size of a link table or the hashtags in bytes:
+    the dictionary, its keys and the sets, but not the documents in them.
+    """
+    size = sys.getsizeof(table)
+    for key, docs in table.items():
+        size += sys.getsizeof(key) + sys.getsizeof(docs)
+    return size
+
+
+def holder_sizes(db):
+    """
+    Approximate sizes in bytes of the main data structures of the database.
+    """
+    sizes = OrderedDict((_, 0) for _ in ["md_raw", "output", "trees", "links", "hashtags"])
+    for module in db.modules.values():
+        sizes["trees"] += tree_size(module.tree)
+        for _, doc in module.items():
+            for attr in ["md_raw", "output"]:
+                value = getattr(doc, attr)
+                if value is not None:
+                    sizes[attr] += sys.getsizeof(value)
+    for table in [db.forwardlinks, db.backlinks, db.knowls]:
+        sizes["links"] += table_size(table)
+    sizes["hashtags"] = table_size(db.hashtags)
+    return sizes
+
+
+class MemoryProfiler(object):
+
+    """
+    Traces the memory allocations and takes a snapshot after each phase of
+    :meth:`.CollScientiae.render`. For each phase, it records the peak and the retained
+    memory and the sizes of the main holders of memory (see :func:`.holder_sizes`).
+
+    :param top: number of the top allocation sites, which are recorded for each phase
+    :param frames: number of frames of each traced allocation
+    """
+
+    def __init__(self, top=0, frames=1):
+        self.top = top
+        self.frames = frames
+        self.phases = []
+        self.previous = 0
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        self.previous = tracemalloc.get_traced_memory()[0]
+
+    def phase(self, name, db):
+        """
+        Records the phase `name`, which just finished.
+        """
+        current, peak = tracemalloc.get_traced_memory()
+        phase = OrderedDict([("phase", name),
+                             ("retained", current),
+                             ("delta", current - self.previous),
+                             ("peak", peak),
+                             ("holders", holder_sizes(db))])
+        if self.top > 0:
+            stats = tracemalloc.take_snapshot().statistics("lineno")
+            phase["top"] = [OrderedDict([("site", str(stat.traceback)),
+                                         ("size", stat.size),
+                                         ("count", stat.count)])
+                            for stat in stats[:self.top]]
+        self.phases.append(phase)
+        self.previous = current
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        return phase
+
+    def stop(self):
+        tracemalloc.stop()
+
+    def report(self, log):
+        mib = 1024. * 1024.
+        for phase in self.phases:
+            log.info("memory after {:<8s}: retained {:7.1f} MiB ({:+.1f}), peak {:7.1f} MiB"
+                     .format(phase["phase"], phase["retained"] / mib, phase["delta"] / mib,
+                             phase["peak"] / mib))
+            log.info("  " + ", ".join("{} {:.1f} MiB".format(k, v / mib)
+                                      for k, v in phase["holders"].items()))
+
+    def save(self, fn):
+        """
+        Writes all recorded phases as JSON into the file `fn`, e.g. as a CI artifact.
+        """
+        import json
+        with open(fn, "w") as f:
+            json.dump(self.phases, f, indent=1)
@@ -0,0 +1,36 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+from .memprofile import MemoryProfiler, holder_sizes
+
+
+def test_holder_sizes():
+    from .db_test import make_db, make_doc
+    db = make_db(["alpha"])
+    empty = holder_sizes(db)
+    doc = make_doc(db, "alpha", "a.b", "AB")
+    doc.md_raw = "x" * 10000
+    db.register_hashtag("tag", doc)
+    sizes = holder_sizes(db)
+    assert sizes["md_raw"] >= 10000
+    assert sizes["trees"] > empty["trees"]
+    assert sizes["hashtags"] > empty["hashtags"]
+
+
+def test_phases(tmpdir):
+    import json
+    from .db_test import make_db
+    db = make_db(["alpha"])
+    profiler = MemoryProfiler(top=2)
+    profiler.start()
+    try:
+        data = [bytearray(1000) for _ in range(1000)]
+        phase = profiler.phase("process", db)
+    finally:
+        profiler.stop()
+    assert phase["delta"] >= 1000 * 1000
+    assert len(phase["top"]) == 2
+    profiler.save(str(tmpdir.join("memory.json")))
+    with open(str(tmpdir.join("memory.json"))) as f:
+        assert json.load(f)[0]["phase"] == "process"
+    assert len(data) == 1000
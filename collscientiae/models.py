@@ -3,7 +3,7 @@ from collections import defaultdict
 import yaml
 import inspect
 import re
-from .utils import indexsort
+from .utils import indexsort, YAMLLoader
 from .db import DuplicateDocumentError
 
 namespace_pattern = re.compile(r"^[a-zA-Z][a-zA-Z0-9_]+$")
@@ -24,6 +24,9 @@ class YAMLObjectCallingInit(yaml.YAMLObject):
         This assumes that the classes do not implement their own `__setstate__`.
     """
 
+    # register the tags with the (safe) loader used in :func:`.utils.get_yaml`
+    yaml_loader = YAMLLoader
+
     @classmethod
     def from_yaml(cls, loader, node):
         # get expected fields and throw a proper exception if a field is missing
@@ -167,6 +170,10 @@ class Document(object):
         self.seealso = None
         # output contains html (or latex) after processing the content
         self.output = None
+        # the html from markdown, before the theme's macros are applied (optional)
+        self.md_output = None
+        # hash of the output and metadata, see :meth:`.ContentProcessor.document_hash`
+        self.hash = None
         self.authors = None
         self.tags = None
         self.group = "default"
@@ -190,8 +197,10 @@ class Document(object):
         self.output = output
         self.authors = authors
         self.copyright = copyright
-        from dateutil import parser
-        self.date = parser.parse(date) if date else None
+        self.date = None
+        if date:
+            from dateutil import parser
+            self.date = parser.parse(date)
         if sort:
             self.sort = float(sort)
 
@@ -239,16 +248,19 @@ class Index(object):
         * `description`: e.g. the subtitle of a document
         * `type`: directory, file or hashtag
         * `prefix`: prefixing the referenced link, usually 0 (?)
+        * `path`: the referenced page, if it is not at `docid` (see :mod:`.layout`)
         * `sort`: a floating point number, used in :func:`.utils.indexsort` to break
                   strict alphabetical sorting.
         """
 
-        __slots__ = ["title", "group", "docid", "description", "type", "prefix", "sort", "node"]
+        __slots__ = ["title", "group", "docid", "description", "type", "prefix", "sort", "node",
+                     "path"]
 
         types = ("dir", "file", "hashtag")
 
         def __init__(self, title, docid,
-                     group="default", description=None, type="file", sort=None, node=None, prefix=0):
+                     group="default", description=None, type="file", sort=None, node=None, prefix=0,
+                     path=None):
             assert type in Index.Entry.types
             self.title = title if len(title) > 0 else "[%s]" % docid
             self.group = group
@@ -258,11 +270,12 @@ class Index(object):
             self.sort = sort
             self.node = node
             self.prefix = prefix
+            self.path = path or docid
 
         @property
         def href(self):
             h = ''.join(["../"] * self.prefix)
-            h += self.docid
+            h += self.path
             if self.type == "dir":
                 h += ".index"
             return h
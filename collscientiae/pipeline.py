@@ -0,0 +1,164 @@
+# -*- coding: utf8 -*-
+"""
+Overlapping the file I/O with the processing:
+:class:`.ReadAhead` reads the source files ahead of their conversion and
+:class:`.PageWriter` writes the rendered pages behind the rendering.
+Both collect statistics about their queues, see their `stats()` methods.
+"""
+from __future__ import absolute_import, unicode_literals
+from collections import deque
+from threading import Thread, Lock
+from time import time
+
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+
+class ReadAhead(object):
+
+    """
+    Calls `read` for each path in background threads,
+    ahead of the consumer, but at most `depth` paths ahead.
+    If `depth` is 0, the paths are read synchronously.
+    """
+
+    def __init__(self, read, depth=32, threads=4):
+        self.read = read
+        self.depth = depth
+        self.threads = threads
+        self.files = 0
+        # number of files, which were already read when the consumer asked for the next one
+        self.ready_sum = 0
+        self.ready_max = 0
+        # time the consumer had to wait for a file to be read
+        self.stall_time = 0.0
+
+    def __call__(self, paths):
+        """
+        Yields the result of `read` for each path, in the same order.
+        """
+        if self.depth == 0:
+            for path in paths:
+                start = time()
+                data = self.read(path)
+                self.stall_time += time() - start
+                self.files += 1
+                yield data
+            return
+
+        from concurrent.futures import ThreadPoolExecutor
+        pending = deque()
+        with ThreadPoolExecutor(self.threads) as pool:
+            for path in paths:
+                pending.append(pool.submit(self.read, path))
+                if len(pending) >= self.depth:
+                    yield self._next(pending)
+            while pending:
+                yield self._next(pending)
+
+    def _next(self, pending):
+        future = pending.popleft()
+        ready = sum(1 for _ in pending if _.done()) + (1 if future.done() else 0)
+        self.ready_sum += ready
+        self.ready_max = max(self.ready_max, ready)
+        self.files += 1
+        if not future.done():
+            start = time()
+            future.result()
+            self.stall_time += time() - start
+        return future.result()
+
+    def stats(self):
+        return {"files": self.files,
+                "ready_mean": self.ready_sum / float(max(1, self.files)),
+                "ready_max": self.ready_max,
+                "stall_time": self.stall_time}
+
+
+class PageWriter(object):
+
+    """
+    Renders and writes pages in `threads` background threads:
+    the output of :meth:`jinja2.Template.generate` is streamed into the target file.
+    At most `depth` pages are queued, otherwise :meth:`.write` blocks.
+
+    :param written: if given, it is called with the size in bytes of each written page,
+                    from the writing thread
+    """
+
+    def __init__(self, threads=4, depth=64, written=None):
+        self.queue = Queue(depth)
+        self.written = written
+        self.lock = Lock()
+        self.errors = []
+        self.pages = 0
+        self.bytes = 0
+        self.depth_sum = 0
+        self.depth_max = 0
+        # time the producer was blocked, because the queue was full
+        self.stall_time = 0.0
+        # time the threads were waiting for pages
+        self.idle_time = 0.0
+        self.threads = [Thread(target=self._work) for _ in range(threads)]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def write(self, template, target_fn, data):
+        depth = self.queue.qsize()
+        self.depth_sum += depth
+        self.depth_max = max(self.depth_max, depth)
+        self.pages += 1
+        start = time()
+        self.queue.put((template, target_fn, data))
+        self.stall_time += time() - start
+
+    def _work(self):
+        while True:
+            start = time()
+            item = self.queue.get()
+            with self.lock:
+                self.idle_time += time() - start
+            try:
+                if item is None:
+                    return
+                self._write(*item)
+            except Exception as ex:
+                with self.lock:
+                    self.errors.append(ex)
+            finally:
+                self.queue.task_done()
+
+    def _write(self, template, target_fn, data):
+        size = 1
+        with open(target_fn, "wb") as output:
+            for chunk in template.generate(**data):
+                chunk = chunk.encode("utf-8")
+                size += len(chunk)
+                output.write(chunk)
+            output.write(b"\n")
+        with self.lock:
+            self.bytes += size
+        if self.written is not None:
+            self.written(size)
+
+    def close(self):
+        """
+        Waits until all pages are written and re-raises the first error.
+        """
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        if self.errors:
+            raise self.errors[0]
+
+    def stats(self):
+        return {"pages": self.pages,
+                "bytes": self.bytes,
+                "depth_mean": self.depth_sum / float(max(1, self.pages)),
+                "depth_max": self.depth_max,
+                "stall_time": self.stall_time,
+                "idle_time": self.idle_time}
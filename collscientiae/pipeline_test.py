@@ -0,0 +1,34 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+from .pipeline import ReadAhead, PageWriter
+
+
+def test_read_ahead_keeps_order():
+    for depth in [0, 1, 3, 100]:
+        ra = ReadAhead(lambda x: x * 2, depth=depth)
+        assert list(ra(range(20))) == [x * 2 for x in range(20)]
+        assert ra.stats()["files"] == 20
+
+
+def test_page_writer(tmpdir):
+    import jinja2 as j2
+    tmpl = j2.Template("{% for i in items %}<{{ i }}>{% endfor %}")
+    writer = PageWriter(threads=2, depth=2)
+    for i in range(10):
+        writer.write(tmpl, str(tmpdir.join("%d.html" % i)), {"items": range(i)})
+    writer.close()
+    assert tmpdir.join("3.html").read() == "<0><1><2>\n"
+    assert writer.stats()["pages"] == 10
+
+
+def test_page_writer_error(tmpdir):
+    import jinja2 as j2
+    writer = PageWriter(threads=1)
+    writer.write(j2.Template("{{ 1 / 0 }}"), str(tmpdir.join("x.html")), {})
+    try:
+        writer.close()
+    except ZeroDivisionError:
+        pass
+    else:
+        assert False, "error not raised"
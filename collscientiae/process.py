@@ -1,11 +1,15 @@
 # coding: utf8
 from __future__ import absolute_import, unicode_literals
 import hashlib
+import json
+from collections import OrderedDict
+from copy import deepcopy
 from logging import Logger
 import markdown
 import re
 from .models import Document
 from .db import CollScientiaeDB
+from .diagnostics import line_of
 
 document_id_pattern = re.compile(r"^[a-zA-Z][a-zA-Z0-9_.]+$")
 a_href_pattern = re.compile(r"<(a|A)[^>]+?href=")
@@ -17,6 +21,28 @@ class IgnorePattern(markdown.inlinepatterns.Pattern):
         return m.group(2)
 
 
+class MathPattern(IgnorePattern):
+
+    """
+    Math is passed through for MathJax, unless it is rendered at build time,
+    see :mod:`.mathrender`. `delimiter` is the length of the delimiters.
+    """
+
+    def __init__(self, pattern, cp, md, delimiter, display):
+        self.cp = cp
+        self.delimiter = delimiter
+        self.display = display
+        super(MathPattern, self).__init__(pattern, md)
+
+    def handleMatch(self, m):
+        math = m.group(2)
+        if self.cp.math is not None:
+            html = self.cp.math.render(math[self.delimiter:-self.delimiter], self.display)
+            if html is not None:
+                return self.markdown.htmlStash.store(html)
+        return math
+
+
 class HashTagPattern(markdown.inlinepatterns.Pattern):
 
     def __init__(self, pattern, cp):
@@ -28,7 +54,8 @@ class HashTagPattern(markdown.inlinepatterns.Pattern):
         a = etree.Element("a")
         ht = m.group(2).lower()
         self.cp.db.register_hashtag(ht, self.cp.document)
-        a.set('href', '../hashtag/{}.html'.format(ht))
+        level = self.cp.cs.layout.level(self.cp.document.docid)
+        a.set('href', '../' * level + 'hashtag/{}.html'.format(ht))
         idx = m.lastindex - 1
         a.text = '#' + m.group(idx)
         return a
@@ -51,9 +78,31 @@ class LinkedDocument(markdown.inlinepatterns.Pattern):
         super(LinkedDocument, self).__init__(pattern)
 
     def handleMatch(self, m):
+        """
+        Parses the ID of the linked document and returns True, if it is valid.
+        """
+        try:
+            self.parse(m.group(2))
+        except (AssertionError, ValueError) as ex:
+            self.cp.invalid(str(ex), m.group(2), kind="link", exception=type(ex))
+            return False
+        return True
+
+    @staticmethod
+    def invalid_element(m):
+        """
+        Shown instead of an invalid link, knowl or include.
+        """
+        from markdown.util import etree, AtomicString
+        span = etree.Element("span")
+        span.set("class", "invalid-link")
+        span.text = AtomicString(m.group(2))
+        return span
+
+    def parse(self, raw):
         from .models import namespace_pattern
 
-        self.tokens = m.group(2).split("|")
+        self.tokens = raw.split("|")
         raw_id = self.tokens[0].strip()
         id_split = raw_id.split("/")
         doc_id_tokens = id_split[-1].split()
@@ -80,7 +129,7 @@ class LinkedDocument(markdown.inlinepatterns.Pattern):
         assert namespace_pattern.match(self.target_ns)
 
     def get_link(self):
-        return self.target_ns + "/" + self.doc_id
+        return self.target_ns + "/" + self.cp.cs.layout.path(self.doc_id)
 
     def set_element_attributes(self, element):
 
@@ -100,7 +149,8 @@ class LinkedDocument(markdown.inlinepatterns.Pattern):
 class IncludePattern(LinkedDocument):
 
     def handleMatch(self, m):
-        LinkedDocument.handleMatch(self, m)
+        if not LinkedDocument.handleMatch(self, m):
+            return self.invalid_element(m)
         from markdown.util import etree
         link = self.get_link()
         div = etree.Element("div")
@@ -113,14 +163,14 @@ class IncludePattern(LinkedDocument):
 class LinkPattern(LinkedDocument):
 
     def handleMatch(self, m):
-        LinkedDocument.handleMatch(self, m)
+        if not LinkedDocument.handleMatch(self, m):
+            return self.invalid_element(m)
         from markdown.util import etree
 
-        link = self.get_link()
         self.cp.db.register_link(self.target_ns, self.doc_id, self.cp.document)
 
         a = etree.Element("a")
-        a.set("href", "../%s.html" % link)
+        a.set("href", self.cp.cs.layout.link(self.cp.document.docid, self.target_ns, self.doc_id))
         self.set_element_attributes(a)
         return a
 
@@ -128,7 +178,8 @@ class LinkPattern(LinkedDocument):
 class KnowlPattern(LinkedDocument):
 
     def handleMatch(self, m):
-        LinkedDocument.handleMatch(self, m)
+        if not LinkedDocument.handleMatch(self, m):
+            return self.invalid_element(m)
         from markdown.util import etree
 
         link = self.get_link()
@@ -227,6 +278,76 @@ class CollScientiaCodeBlockProcessor(markdown.blockprocessors.CodeBlockProcessor
     #     return markdown.blockprocessors.CodeBlockProcessor.run(self, parent, blocks)
 
 
+class ExampleTreeprocessor(markdown.treeprocessors.Treeprocessor):
+
+    """
+    Executes the `python::` code blocks of a document and appends their output,
+    see :mod:`.examples`.
+    """
+
+    def __init__(self, md, cp):
+        self.cp = cp
+        markdown.treeprocessors.Treeprocessor.__init__(self, md)
+
+    def run(self, root):
+        from markdown.util import etree, AtomicString
+        blocks = [div for div in root.iter("div") if div.get("mode") == "python"]
+        if not blocks:
+            return
+        results = self.cp.examples.run([div[0].text for div in blocks])
+        for div, (output, ok) in zip(blocks, results):
+            pre = etree.SubElement(div, "pre")
+            pre.set("class", "example-output" if ok else "example-output example-error")
+            pre.text = AtomicString(output)
+
+
+class HighlightTreeprocessor(markdown.treeprocessors.Treeprocessor):
+
+    """
+    Highlights the code blocks of :class:`.CollScientiaCodeBlockProcessor`,
+    see :mod:`.highlight`.
+    """
+
+    def __init__(self, md, cp):
+        self.cp = cp
+        markdown.treeprocessors.Treeprocessor.__init__(self, md)
+
+    def run(self, root):
+        for div in root.iter("div"):
+            if div.get("class") != "sagecell_init" or not len(div) or div[0].tag != "code":
+                continue
+            code = div[0]
+            lang = (code.get("class") or "").partition("language-")[2]
+            html = self.cp.highlighter.highlight(lang, code.text) if lang else None
+            if html is not None:
+                code.set("class", "language-%s highlight" % lang)
+                code.text = self.markdown.htmlStash.store(html)
+
+
+class RecordingDB(object):
+
+    """
+    Forwards the registrations of the inline patterns to the database
+    and records them, such that they can be replayed for a cached conversion.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.calls = []
+
+    def register_hashtag(self, hashtag, document):
+        self.calls.append(("register_hashtag", (hashtag,)))
+        self.db.register_hashtag(hashtag, document)
+
+    def register_knowl(self, ns, knowl_id, document):
+        self.calls.append(("register_knowl", (ns, knowl_id)))
+        self.db.register_knowl(ns, knowl_id, document)
+
+    def register_link(self, ns, link_id, document):
+        self.calls.append(("register_link", (ns, link_id)))
+        self.db.register_link(ns, link_id, document)
+
+
 class ContentProcessor(object):
 
     """
@@ -243,20 +364,36 @@ class ContentProcessor(object):
 
     required_keys = ["title"]
 
+    # inline patterns, which register something in the database, see :meth:`.scan`
+    scanned_patterns = ["hashtag", "hashtag2", "linktag", "knowltag"]
+
     def __init__(self, cs):
         self.cs = cs
         db = cs.db
         log = cs.log
-        self.doc_root_hash = hashlib.sha1()
-        # TODO update with documentation version and so on
-        # self.doc_root_hash.update()
         assert isinstance(db, CollScientiaeDB)
         self.db = db
         self.document = None
         assert isinstance(log, Logger)
         self.log = log
         self.j2env = cs.j2env
+        self.math = self.init_math()
+        self.examples = self.init_examples()
+        self.highlighter = self.init_highlighter()
         self.md = self.init_md()
+        # if True, the markdown output is kept for rendering it with other themes
+        self.keep_md_output = False
+        # if not None, maps keys of the sources (see :meth:`.FileSource.key`) to the output
+        # of markdown, metadata and registrations, e.g. shared by builds of several revisions
+        self.conversion_cache = None
+        # records the time of the markdown extensions, see :meth:`.profile_markdown`
+        self.profiler = None
+        # same as the inline patterns' regexes, but matching repeatedly and not only once
+        self.scan_patterns = []
+        for name in ContentProcessor.scanned_patterns:
+            pattern = self.md.inlinePatterns[name]
+            rex = re.compile(r"()%s()" % pattern.pattern, re.DOTALL | re.UNICODE)
+            self.scan_patterns.append((pattern, rex))
 
     def init_md(self):
         md = markdown.Markdown(
@@ -265,16 +402,17 @@ class ContentProcessor(object):
                         'markdown.extensions.sane_lists',
                         'markdown.extensions.meta',
                         #'markdown.extensions.smarty',
-                        #'markdown.extensions.codehilite'
+                        #'markdown.extensions.codehilite' (see :meth:`.init_highlighter`)
                         ])
 
         add = md.inlinePatterns.add
 
         # Prevent $..$, $$..$$, \(..\), \[..\] blocks from being processed by Markdown
-        add('mathjax$', IgnorePattern(r'(?<![\\\$])(\$[^\$].*?\$)'), '<escape')
-        add('mathjax$$', IgnorePattern(r'(?<![\\])(\$\$.+?\$\$)'), '<escape')
-        add('mathjax\\(', IgnorePattern(r'(\\\(.+?\\\))'), '<escape')
-        add('mathjax\\[', IgnorePattern(r'(\\\[.+?\\\])'), '<escape')
+        # (or render them at build time, see :meth:`.init_math`)
+        add('mathjax$', MathPattern(r'(?<![\\\$])(\$[^\$].*?\$)', self, md, 1, False), '<escape')
+        add('mathjax$$', MathPattern(r'(?<![\\])(\$\$.+?\$\$)', self, md, 2, True), '<escape')
+        add('mathjax\\(', MathPattern(r'(\\\(.+?\\\))', self, md, 2, False), '<escape')
+        add('mathjax\\[', MathPattern(r'(\\\[.+?\\\])', self, md, 2, True), '<escape')
 
         # double '' for ASCIIMath (double backtick `` is <code>)
         add('mathjax``', IgnorePattern(r'(?<![\\`])(``.+?``)'), '<escape')
@@ -299,28 +437,88 @@ class ContentProcessor(object):
 
         # codeblocks with plot:: or example:: prefixes
         md.parser.blockprocessors["code"] = CollScientiaCodeBlockProcessor(md.parser, self)
+
+        # execute python:: codeblocks at build time, see :meth:`.init_examples`
+        if self.examples is not None:
+            md.treeprocessors.add("examples", ExampleTreeprocessor(md, self), "_end")
+        # after the examples, because they need the code as text
+        if self.highlighter is not None:
+            md.treeprocessors.add("highlight", HighlightTreeprocessor(md, self), "_end")
         return md
 
-    def get_metadata(self):
-        meta = self.md.Meta.copy()
+    def profile_markdown(self, top=5):
+        """
+        Instruments the inline patterns and block processors for recording their time
+        while converting the documents, see :class:`.MarkdownProfiler`.
+        """
+        from .mdprofile import MarkdownProfiler
+        self.profiler = MarkdownProfiler(top)
+        self.profiler.instrument(self.md)
+        return self.profiler
+
+    def init_math(self):
+        """
+        The :class:`.MathRenderer` configured by the `math` entry of the config or None.
+        """
+        from os.path import join
+        config = self.cs.config.get("math")
+        if not config:
+            return None
+        from .mathrender import MathRenderer
+        backend = config["backend"]
+        cache_fn = join(self.cs.theme, ".cache", "math", backend.replace(":", "-") + ".json")
+        return MathRenderer(backend, cache_fn)
+
+    def init_examples(self):
+        """
+        The :class:`.ExampleRunner` configured by the `examples` entry of the config or None.
+        """
+        from os.path import join
+        config = self.cs.config.get("examples")
+        if not config:
+            return None
+        from .examples import ExampleRunner
+        if not isinstance(config, dict):
+            config = {}
+        cache_fn = join(self.cs.theme, ".cache", "examples.json")
+        return ExampleRunner(timeout=config.get("timeout", 10),
+                             memory=config.get("memory", 256),
+                             processes=config.get("processes", 4),
+                             cache_fn=cache_fn)
+
+    def init_highlighter(self):
+        """
+        The :class:`.Highlighter` if the `highlight` entry of the config is set or None.
+        """
+        from os.path import join
+        if not self.cs.config.get("highlight"):
+            return None
+        from .highlight import Highlighter
+        return Highlighter(join(self.cs.theme, ".cache", "highlight.json"))
+
+    def get_metadata(self, meta=None):
+        if meta is None:
+            meta = self.md.Meta.copy()
         assert isinstance(meta, dict)
 
         # only allowed keys
-        for key in meta:
-            assert key in ContentProcessor.allowed_keys, \
-                "{} not allowed".format(key)
+        for key in list(meta):
+            if key not in ContentProcessor.allowed_keys:
+                self.invalid("{} not allowed".format(key), key)
+                del meta[key]
 
         # required keys
         for key in ContentProcessor.required_keys:
-            assert key in meta, "Meta Key {} not set for {}".format(key, self.document.docid)
+            if key not in meta:
+                self.invalid("Meta Key {} not set for {}".format(key, self.document.docid))
+                meta[key] = [self.document.docid]
 
         if "type" in meta:
             mt = meta["type"]
-            assert len(mt) == 1
-            mt = mt[0]
-            assert mt in Document.allowed_types,\
-                "{} not an allowed type".format(mt)
-            meta["type"] = mt
+            if len(mt) != 1 or mt[0] not in Document.allowed_types:
+                self.invalid("{} not an allowed type".format(", ".join(mt)), "type")
+                mt = Document.allowed_types[:1]
+            meta["type"] = mt[0]
         else:
             meta["type"] = Document.allowed_types[0]
 
@@ -331,7 +529,7 @@ class ContentProcessor(object):
                     continue
                 elif key in ["authors", "seealso"]:
                     # filter empty ones
-                    meta[key] = filter(lambda x: len(x) > 0, meta[key])
+                    meta[key] = [x for x in meta[key] if len(x) > 0]
                 else:
                     # and join multilines
                     meta[key] = '\n'.join(meta[key])
@@ -339,40 +537,154 @@ class ContentProcessor(object):
         # fixup seealso
         if "seealso" in meta:
             for sa in meta["seealso"]:
-                if len(sa) == 0:
-                    meta["seealso"].remove(sa)
-                else:
-                    assert document_id_pattern.match(sa), "ID '%s' not valid" % sa
+                if not document_id_pattern.match(sa):
+                    self.invalid("ID '%s' not valid" % sa, sa)
+            meta["seealso"] = [sa for sa in meta["seealso"] if document_id_pattern.match(sa)]
         else:
             meta["seealso"] = []
 
         return meta
 
-    def get_root_hash(self):
-        rh = self.doc_root_hash.hexdigest()
-        self.log.info("root hash: %s" % rh)
-        return rh
+    def invalid(self, message, snippet=None, kind="metadata", exception=AssertionError):
+        """
+        Reports a validation failure of the current document, see :class:`.Diagnostics`.
 
-    def convert(self, document, target="html"):
+        :param snippet: text of the source, whose first occurrence gives the line number
         """
+        doc = self.document
+        line = line_of(doc.md_raw, snippet) if snippet else None
+        self.cs.diagnostics.error(kind, message, doc.src_fn, line, exception=exception)
 
-        :type document: Document
+    def read_metadata(self, document):
+        """
+        Only reads the metadata header of the given document, without converting it.
+        """
+        assert isinstance(document, Document)
+        self.document = document
+        self.md.preprocessors["meta"].run(document.md_raw.splitlines())
+        return self.get_metadata()
+
+    def scan(self, document):
+        """
+        Registers the hashtags, links and knowls of the given document in the database,
+        without converting it.
+        This is only an approximation (e.g. it also finds them inside code blocks),
+        :meth:`.convert` registers them exactly.
         """
         assert isinstance(document, Document)
         self.document = document
-        html = self.md.convert(document.md_raw)
+        for pattern, rex in self.scan_patterns:
+            for m in rex.finditer(document.md_raw):
+                try:
+                    pattern.handleMatch(m)
+                except (AssertionError, ValueError) as ex:
+                    self.log.debug("scan {}: {}".format(document, ex))
+
+    @staticmethod
+    def document_hash(html, meta):
+        """
+        The hash of one document, i.e. its html and metadata.
+        """
+        h = hashlib.sha1(html.encode("utf8"))
+        h.update(json.dumps(meta, sort_keys=True, default=str).encode("utf8"))
+        return h.hexdigest()
+
+    def get_root_hash(self, hashes=None):
+        """
+        A tree of hashes: the hash of each module is computed from the hashes of its documents
+        and the root hash from those of all modules.
+        It does not depend on the order in which the documents were processed.
+
+        :param hashes: maps documents to their hashes, defaults to their `hash` attribute.
+        :return: the root hash and a dictionary, mapping namespaces to module hashes.
+        """
+        hashes = hashes or {}
+        module_hashes = OrderedDict()
+        root_hash = hashlib.sha1()
+        for ns, module in self.db.modules.items():
+            module_hash = hashlib.sha1()
+            for docid in sorted(module.keys()):
+                doc = module[docid]
+                module_hash.update("{} {}\n".format(docid, hashes.get(doc, doc.hash)).encode("utf8"))
+            module_hashes[ns] = module_hash.hexdigest()
+            root_hash.update("{} {}\n".format(ns, module_hashes[ns]).encode("utf8"))
+        rh = root_hash.hexdigest()
+        self.log.info("root hash: %s" % rh)
+        return rh, module_hashes
+
+    def render_macros(self, document, html, j2env=None):
+        """
+        This is the theme dependent part of :meth:`.convert`:
+        the html from markdown is rendered by Jinja2, including the theme's `macros.html`.
+
+        :param j2env: the Jinja2 environment of the theme, defaults to the main one.
+        """
+        j2env = j2env or self.j2env
+        if not any(_ in html for _ in [j2env.block_start_string,
+                                       j2env.variable_start_string,
+                                       j2env.comment_start_string]):
+            # plain html, no need to compile it as a template
+            macros = j2env.get_template("macros.html").render(namespace=document.namespace)
+            html = '\n'.join([macros, html])
+            # like Jinja2, without keep_trailing_newline
+            return html[:-1] if html.endswith("\n") else html
+
         html = '\n'.join(
             ["""{% include "macros.html" %}""", html])
         try:
-            html = self.j2env.from_string(html).render(namespace=document.namespace)
+            # not in the bytecode cache, it would get an entry for each version of each document
+            return j2env.from_string(html).render(namespace=document.namespace)
         except Exception as e:
             print(html)
             raise e
-        meta = self.get_metadata()
 
-        self.doc_root_hash.update(html.encode("utf8"))
-        meta_frozen = [(k, tuple(v) if isinstance(v, list) else v)
-                       for k, v in meta.items()]
-        self.doc_root_hash.update(str(frozenset(meta_frozen)).encode("utf8"))
+    def convert(self, document, target="html"):
+        """
 
+        :type document: Document
+        """
+        assert isinstance(document, Document)
+        self.document = document
+        key = self.conversion_key(document)
+        if key is not None and key in self.conversion_cache:
+            md_output, meta, calls = self.conversion_cache[key]
+            meta = deepcopy(meta)
+            for name, args in calls:
+                getattr(self.db, name)(*(args + (document,)))
+        else:
+            db = self.db
+            self.db = RecordingDB(db)
+            try:
+                if self.profiler is not None:
+                    self.profiler.begin()
+                md_output = self.md.convert(document.md_raw)
+                if self.profiler is not None:
+                    self.profiler.end(document)
+                meta = self.get_metadata()
+            finally:
+                calls = self.db.calls
+                self.db = db
+            if key is not None:
+                self.conversion_cache[key] = (md_output, deepcopy(meta), calls)
+        if self.keep_md_output:
+            document.md_output = md_output
+        html = self.render_macros(document, md_output)
+        document.hash = self.document_hash(html, meta)
         return html, meta
+
+    def conversion_key(self, document):
+        """
+        The key of the document in the :attr:`conversion_cache` or None.
+        The conversion also depends on the namespace and ID of the document (its depth in
+        the output layout determines the relative links), the remapping of the modules,
+        the output layout and the configuration of the math, examples and highlighting.
+        """
+        if self.conversion_cache is None:
+            return None
+        source_key = self.cs.source.key(document.src_fn)
+        if source_key is None:
+            return None
+        config = dict((_, self.cs.config.get(_))
+                      for _ in ["remapping", "math", "examples", "highlight"])
+        return source_key, document.namespace, document.docid, self.cs.layout.name, \
+            json.dumps(config, sort_keys=True)
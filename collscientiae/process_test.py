@@ -1,5 +1,6 @@
 # coding=utf-8
 from __future__ import absolute_import
+import logging
 
 from .process import ContentProcessor
 
@@ -7,3 +8,44 @@ from .process import ContentProcessor
 def test_required_keys_valid():
     for key in ContentProcessor.required_keys:
         assert key in ContentProcessor.allowed_keys
+
+
+def test_root_hash_independent_of_order():
+    from .db_test import make_db, make_doc
+
+    class FakeProcessor(object):
+        log = logging.getLogger("TEST")
+
+    hashes = {}
+    for order in [["a", "b", "c"], ["c", "a", "b"]]:
+        p = FakeProcessor()
+        p.db = make_db(["alpha", "beta"])
+        for docid in order:
+            doc = make_doc(p.db, "alpha", docid, docid.upper())
+            doc.hash = ContentProcessor.document_hash("<p>%s</p>" % docid, {"title": docid})
+        doc = make_doc(p.db, "beta", "x", "X")
+        doc.hash = ContentProcessor.document_hash("", {})
+        hashes[tuple(order)] = ContentProcessor.get_root_hash(p)
+    root1, modules1 = hashes[("a", "b", "c")]
+    root2, modules2 = hashes[("c", "a", "b")]
+    assert root1 == root2
+    assert modules1 == modules2
+    assert list(modules1) == ["alpha", "beta"]
+
+
+def test_render_macros(tmpdir):
+    import jinja2 as j2
+    from .models import Document
+
+    class FakeProcessor(object):
+        pass
+
+    loader = j2.DictLoader({"macros.html": "<!-- {{ namespace }} -->\n"})
+    bcc = j2.FileSystemBytecodeCache(str(tmpdir))
+    j2env = j2.Environment(loader=loader, bytecode_cache=bcc)
+    doc = Document(docid="a", md_raw="", ns="alpha", src_fn=None)
+    for html in ["<p>plain</p>", "<p>x</p>\n", "<p>{{ 1 + 1 }}</p>"]:
+        expected = j2env.from_string('{% include "macros.html" %}\n' + html).render(namespace="alpha")
+        assert ContentProcessor.render_macros(FakeProcessor(), doc, html, j2env) == expected
+    # only macros.html is cached, not the documents
+    assert len(tmpdir.listdir()) == 1
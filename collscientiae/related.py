@@ -0,0 +1,166 @@
+# -*- coding: utf8 -*-
+"""
+Related documents by the cosine similarity of their TF-IDF vectors, this needs NumPy.
+It is enabled by the `related` entry of the main `config.yaml`, e.g. ::
+
+    related:
+      top: 5        # number of related documents
+      terms: 1024   # size of the vocabulary, i.e. the most frequent terms
+      block: 512    # number of documents per block of the similarity matrix
+
+The related documents are passed to `document.html` as `related`, next to `seealso`
+(which they do not repeat). The similarity matrix is computed in blocks of rows,
+hence its memory is bounded by `block` times the number of documents.
+The terms of each document are cached by its content hash, hence only changed documents
+are counted again, and the related documents (the IDF weights and the similarities, which
+depend on all documents) are only computed again, if any document changed.
+There is one cache for each source directory and revision.
+"""
+from __future__ import absolute_import, unicode_literals
+import hashlib
+import json
+import re
+from collections import Counter
+from math import log
+from os.path import exists, dirname
+from .utils import ensure_dir
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+token_pattern = re.compile(r"[^\W\d_]{2,}", re.UNICODE)
+
+# terms in the title and the tags count this many times
+title_weight = 3
+
+
+def count_terms(document):
+    """
+    Counts the terms of the document's text, title and tags.
+    """
+    counts = Counter(_.lower() for _ in token_pattern.findall(document.md_raw or ""))
+    tags = document.tags or ""
+    if isinstance(tags, (list, tuple)):
+        tags = " ".join(tags)
+    for text in [document.title or "", tags]:
+        for term in token_pattern.findall(text):
+            counts[term.lower()] += title_weight
+    return dict(counts)
+
+
+class RelatedDocuments(object):
+
+    """
+    Finds the `top` related documents of each document.
+
+    :param cache_fn: JSON file for caching the terms and the results
+    """
+
+    def __init__(self, top=5, terms=1024, block=512, cache_fn=None):
+        self.top = top
+        self.terms = terms
+        self.block = block
+        self.cache_fn = cache_fn
+        self.cache = {"terms": {}, "key": None, "related": {}}
+        if cache_fn is not None and exists(cache_fn):
+            with open(cache_fn, "r") as f:
+                self.cache = json.load(f)
+        self.counted = 0
+
+    @staticmethod
+    def name(doc):
+        return "%s/%s" % (doc.namespace, doc.docid)
+
+    def count_terms(self, doc):
+        if doc.hash not in self.cache["terms"]:
+            self.cache["terms"][doc.hash] = count_terms(doc)
+            self.counted += 1
+        return self.cache["terms"][doc.hash]
+
+    def corpus_key(self, documents):
+        h = hashlib.sha1(json.dumps([self.top, self.terms]).encode("utf8"))
+        for doc in sorted(documents, key=self.name):
+            h.update(("%s %s\n" % (self.name(doc), doc.hash)).encode("utf8"))
+        return h.hexdigest()
+
+    def find(self, documents):
+        """
+        Returns a dictionary, mapping each document to the list of its related documents.
+        """
+        key = self.corpus_key(documents)
+        if key != self.cache["key"]:
+            counts = [self.count_terms(doc) for doc in documents]
+            skip = [set(doc.seealso or []) | set([doc.docid]) for doc in documents]
+            indices, scores = self.neighbours(self.matrix(counts),
+                                              self.top + max([len(_) for _ in skip] or [0]))
+            related = {}
+            for doc, idx, score, s in zip(documents, indices, scores, skip):
+                names = [self.name(documents[j]) for j, sc in zip(idx, score)
+                         if sc > 0 and not (documents[j].namespace == doc.namespace
+                                            and documents[j].docid in s)]
+                related[self.name(doc)] = names[:self.top]
+            hashes = set(doc.hash for doc in documents)
+            self.cache = {"key": key,
+                          "related": related,
+                          "terms": dict((h, c) for h, c in self.cache["terms"].items()
+                                        if h in hashes)}
+            self.save()
+
+        by_name = dict((self.name(doc), doc) for doc in documents)
+        return dict((doc, [by_name[_] for _ in self.cache["related"].get(self.name(doc), [])])
+                    for doc in documents)
+
+    def matrix(self, counts):
+        """
+        The TF-IDF matrix with one normalized row per document, restricted to the vocabulary
+        of the most frequent terms, which occur in more than one document.
+        Terms in more than half of the documents are ignored (for at least 10 documents).
+        """
+        n = len(counts)
+        df = Counter(term for c in counts for term in c)
+        max_df = n / 2. if n >= 10 else n
+        vocabulary = [t for t, d in df.most_common() if 1 < d <= max_df][:self.terms]
+        columns = dict((t, i) for i, t in enumerate(vocabulary))
+        idf = np.array([log(float(n) / df[t]) + 1. for t in vocabulary], dtype=np.float32)
+        matrix = np.zeros((n, len(vocabulary)), dtype=np.float32)
+        for i, c in enumerate(counts):
+            terms = [(columns[t], 1. + log(k)) for t, k in c.items() if t in columns]
+            if terms:
+                cols, tf = zip(*terms)
+                matrix[i, list(cols)] = tf
+        matrix *= idf
+        norms = np.linalg.norm(matrix, axis=1)
+        norms[norms == 0] = 1.
+        return matrix / norms[:, np.newaxis]
+
+    def neighbours(self, matrix, k):
+        """
+        The indices and similarities of the `k` most similar rows of each row,
+        computed in blocks of rows.
+        """
+        n = matrix.shape[0]
+        k = min(k, n - 1)
+        indices = np.zeros((n, max(k, 0)), dtype=np.int64)
+        scores = np.zeros((n, max(k, 0)), dtype=np.float32)
+        if k <= 0:
+            return indices, scores
+        for start in range(0, n, self.block):
+            end = min(n, start + self.block)
+            sim = matrix[start:end].dot(matrix.T)
+            # a document is not related to itself
+            sim[np.arange(end - start), np.arange(start, end)] = -1.
+            idx = np.argpartition(-sim, k - 1, axis=1)[:, :k]
+            sc = np.take_along_axis(sim, idx, axis=1)
+            order = np.argsort(-sc, axis=1, kind="stable")
+            indices[start:end] = np.take_along_axis(idx, order, axis=1)
+            scores[start:end] = np.take_along_axis(sc, order, axis=1)
+        return indices, scores
+
+    def save(self):
+        if self.cache_fn is None:
+            return
+        ensure_dir(dirname(self.cache_fn))
+        with open(self.cache_fn, "w") as f:
+            json.dump(self.cache, f)
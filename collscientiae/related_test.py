@@ -0,0 +1,43 @@
+# coding=utf-8
+from __future__ import absolute_import
+import pytest
+
+from .related import RelatedDocuments, count_terms
+
+
+def make_docs(texts):
+    from .db_test import make_db, make_doc
+    db = make_db(["alpha"])
+    docs = []
+    for i, text in enumerate(texts):
+        doc = make_doc(db, "alpha", "d%d" % i, "Doc")
+        doc.md_raw = text
+        doc.title = ""
+        doc.hash = "h%d-%s" % (i, text)
+        docs.append(doc)
+    return docs
+
+
+def test_count_terms():
+    [doc] = make_docs(["Apples and apples, 42 pears"])
+    doc.title = "Doc"
+    doc.tags = "fruit"
+    assert count_terms(doc) == {"apples": 2, "and": 1, "pears": 1, "doc": 3, "fruit": 3}
+
+
+def test_related(tmpdir):
+    pytest.importorskip("numpy")
+    docs = make_docs(["apple banana cherry", "apple banana", "cherry plum",
+                      "plum cherry grape", "zebra lion"])
+    docs[0].seealso = ["d1"]
+    finder = RelatedDocuments(top=2, block=2, cache_fn=str(tmpdir.join("related.json")))
+    related = finder.find(docs)
+    # d1 is already in seealso
+    assert [d.docid for d in related[docs[0]]] == ["d2", "d3"]
+    assert [d.docid for d in related[docs[1]]] == ["d0"]
+    assert related[docs[4]] == []
+    assert finder.counted == 5
+
+    finder = RelatedDocuments(top=2, block=2, cache_fn=str(tmpdir.join("related.json")))
+    assert finder.find(docs) == related
+    assert finder.counted == 0
@@ -1,48 +1,185 @@
 # -*- coding: utf8 -*-
 from __future__ import absolute_import
-from os.path import normpath, join, relpath, splitext, exists
-from os import makedirs, walk, link
+import hashlib
+import json
+import logging
+from os.path import normpath, join, relpath, splitext, exists, dirname, getsize, sep
+from collections import OrderedDict, defaultdict
+from os import makedirs
 from .models import DocumentationModule, Index
 from .utils import mytitle
 from .models import Document
+from .pipeline import PageWriter
+from .assets import AssetBundler
+from .sources import FileSource
+
+
+def document_key(doc):
+    return doc.namespace, doc.docid
+
+
+class ThemedDocument(object):
+
+    """
+    Proxy for a document, but with the output for another theme.
+    See :meth:`.CollScientiae.variant`.
+    """
+
+    def __init__(self, document, output):
+        self._document = document
+        self.output = output
+
+    def __getattr__(self, name):
+        return getattr(self._document, name)
 
 
 class OutputRenderer(object):
 
+    # number of threads and queued pages for writing, see :class:`.PageWriter`.
+    # 0 threads disables writing in the background.
+    writer_threads = 4
+    writer_depth = 64
+
+    # if True and the `links` entry of the config is set, long lists of links are
+    # written into JSON files, see :meth:`.document_links`
+    externalize_links = True
+
     def __init__(self, collscientiae):
         self.log = collscientiae.log
         self.cs = collscientiae
+        self.writer = None
+        self.bundler = AssetBundler(join(self.cs.theme, ".cache", "assets"))
+        # maps the files of the externalized links to their content
+        self.link_shards = defaultdict(dict)
 
-    def copy_static_files(self):
+    def copy_static_files(self, namespaces=None):
         """
         This copies static files into the output file tree.
+        Additionally, the CSS and JS files of each `static` directory are bundled,
+        see :mod:`.assets`, and their names are set in the `assets` global.
+        The images of the modules are optimized, if this is configured, see :mod:`.images`.
         """
         self.log.info("copying static files")
+        self.cs.events.phase("static", target=self.cs.targ)
+        debug = self.log.isEnabledFor(logging.DEBUG)
         ignored_static_files = [".scss", ".sass", ".css.map"]
+        assets = {}
+        optimizer = self.image_optimizer()
+        # (module, source file, target file) of the images to optimize
+        images = []
 
-        def copy(src_dir, mod_dir):
+        def copy(source, src_dir, mod_dir, write=True):
             for dir in ["static", "img"]:
                 static_dir = normpath(join(src_dir, mod_dir, dir))
                 target_dir = normpath(join(self.cs.targ, mod_dir, dir))
-                makedirs(target_dir)
-                for path, _, filenames in walk(static_dir):
+                if write:
+                    self.make_dirs(target_dir)
+                files = []
+                for path, _, filenames in source.walk(static_dir):
                     relative = relpath(path, static_dir)
                     targetpath = normpath(join(target_dir, relative))
-                    if not exists(targetpath):
-                        makedirs(targetpath)
+                    if write:
+                        self.make_dirs(targetpath)
                     for fn in filenames:
                         if fn.startswith("_") or any(fn.endswith(_) for _ in ignored_static_files):
                             continue
+                        files.append((path, fn))
+                        if not write:
+                            continue
                         srcfn = join(path, fn)
                         targetfn = join(targetpath, fn)
-                        self.log.debug("link %s -> %s" % (join(relative, fn), targetfn))
-                        link(srcfn, targetfn)
+                        if dir == "img" and mod_dir != "." and optimizer is not None \
+                                and source.on_disk and optimizer.supported(fn):
+                            images.append((mod_dir, srcfn, targetfn))
+                            continue
+                        if debug:
+                            self.log.debug("link %s -> %s", join(relative, fn), targetfn)
+                        self.copy_file(srcfn, targetfn)
+
+                if dir != "static":
+                    continue
+                url = dir if mod_dir == "." else mod_dir + "/" + dir
+                for name, hashed_name, cache_fn in self.bundler.bundle(static_dir, files,
+                                                                       source.read):
+                    assets[url + "/" + name] = url + "/" + hashed_name
+                    if write:
+                        self.copy_file(cache_fn, join(target_dir, hashed_name))
 
         # static files from "theme" directory
-        copy(self.cs.tmpl_dir, ".")
-        # static files from each module into each module's subdirectory
+        copy(FileSource(), self.cs.tmpl_dir, ".")
+        # static files from each module into each module's subdirectory,
+        # the bundles of the other modules are only needed for their names
         for mod_dir in self.cs.config["modules"]:
-            copy(self.cs.src, mod_dir)
+            copy(self.cs.source, self.cs.src, mod_dir, namespaces is None or mod_dir in namespaces)
+        self.cs.j2env.globals["assets"] = assets
+        if len(images) > 0:
+            self.optimize_images(optimizer, images)
+        self.log.info("bundled assets: {} built, {} cached".format(self.bundler.built,
+                                                                  self.bundler.cached))
+
+    def image_optimizer(self):
+        """
+        The :class:`.ImageOptimizer` configured by the `images` entry of the config or None.
+        """
+        config = self.cs.config.get("images")
+        if not config:
+            return None
+        from .images import Image, ImageOptimizer
+        if Image is None:
+            self.log.warning("images are not optimized, because Pillow is not installed")
+            return None
+        return ImageOptimizer(join(self.cs.theme, ".cache", "images"), log=self.log, **config)
+
+    def optimize_images(self, optimizer, images):
+        """
+        Puts the optimized images and their variants into the output file tree.
+        The urls of the variants are set in the `images` global, mapping the url
+        of an image to a list of (width, url) pairs, e.g. for a `srcset` attribute.
+        """
+        from .images import variant_fn
+        self.log.info("optimizing %d images" % len(images))
+        results = optimizer.optimize([src_fn for _, src_fn, _ in images])
+        saved = OrderedDict()
+        variants = {}
+        for (mod_dir, src_fn, target_fn), files in zip(images, results):
+            for width, fn in files:
+                self.copy_file(fn, target_fn if width is None else variant_fn(target_fn, width))
+            saved[mod_dir] = saved.get(mod_dir, 0) + getsize(src_fn) - getsize(files[0][1])
+            url = relpath(target_fn, self.cs.targ).replace(sep, "/")
+            variants[url] = [(width, variant_fn(url, width)) for width, _ in files[1:]]
+        self.cs.j2env.globals["images"] = variants
+        self.log.info("images: {} processed, {} cached, {} failed"
+                      .format(optimizer.processed, optimizer.cached, optimizer.failed))
+        for mod_dir, size in saved.items():
+            self.log.info("images of '{}': {} bytes saved".format(mod_dir, size))
+
+    def make_dirs(self, path):
+        """
+        Creates the directory `path` in the output tree, if it does not exist.
+        """
+        if not exists(path):
+            makedirs(path)
+
+    def copy_file(self, src_fn, target_fn):
+        """
+        Puts the source file `src_fn` into the output tree.
+        """
+        self.cs.source.copy(src_fn, target_fn)
+
+    def write_data(self, target_fn, data):
+        """
+        Writes the bytes `data` into the output tree.
+        """
+        self.make_dirs(dirname(target_fn))
+        with open(target_fn, "wb") as output:
+            output.write(data)
+
+    def render_page(self, template_fn, **data):
+        """
+        Renders the template with the given data and returns the html.
+        """
+        tmpl = self.cs.j2env.get_template(template_fn)
+        return tmpl.render(**data)
 
     def render_template(self, template_fn, target_fn, **data):
         """
@@ -53,11 +190,15 @@ class OutputRenderer(object):
         :param data:
         :return:
         """
-        tmpl = self.cs.j2env.get_template(template_fn)
-        html = tmpl.render(**data)
+        self.make_dirs(dirname(target_fn))
+        if self.writer is not None:
+            self.writer.write(self.cs.j2env.get_template(template_fn), target_fn, data)
+            return
+        html = self.render_page(template_fn, **data).encode("utf-8")
         with open(target_fn, "wb") as output:
-            output.write(html.encode("utf-8"))
+            output.write(html)
             output.write(b"\n")
+        self.cs.events.count(pages=1, bytes=len(html) + 1)
 
     def render_index(self, index, directory, target_fn,
                      module=None, namespace=None, breadcrumb=None, level=1):
@@ -74,8 +215,6 @@ class OutputRenderer(object):
         :return: None
         """
         assert isinstance(index, Index)
-        if not exists(directory):
-            makedirs(directory)
         index_fn = join(directory, target_fn + ".html")
         self.render_template("index.html",
                              index_fn,
@@ -87,26 +226,23 @@ class OutputRenderer(object):
                              level=level,
                              index=index)
 
-    def render_document_index(self, module, doc_id, cur_node, prev=None):
+    def document_index(self, module, doc_id, cur_node):
         """
-        This creates all the indices. In particular, the :class:`.Index` holds
-        all the information for creating the index, but some special care must be taken,
-        which type of entry it is.
+        The :class:`.Index` of the node `cur_node` of the module's tree. In particular,
+        some special care must be taken, which type of entry it is.
 
         :type module: DocumentationModule
         :param module:
-        :param doc_id:
+        :param doc_id: the ID of the node or None for the root
         :param cur_node:
-        :param prev:
-        :return:
+        :rtype: Index
         """
-        self.log.debug("  I %s/%s -> %s" % (module.name, doc_id, cur_node.keys()))
         assert isinstance(cur_node, DocumentationModule.Node)
         assert all(_.sort is not None for _ in cur_node.values())
         assert isinstance(module, DocumentationModule)
-        first = this = None
-        ns = module.namespace
-        doc_dir = join(self.cs.targ, ns.lower())
+        layout = self.cs.layout
+        # entries are relative to the directory of this index
+        prefix = 0 if doc_id is None else layout.depth(doc_id)
         idx = Index(mytitle(module.namespace))
         for key, node in cur_node.items():
 
@@ -124,7 +260,9 @@ class OutputRenderer(object):
                                    type="file",
                                    description=doc.subtitle,
                                    node=node,
-                                   sort=doc.sort)
+                                   sort=doc.sort,
+                                   prefix=prefix,
+                                   path=layout.path(docid))
 
             if len(node) > 0:
                 # we have a "dir" directory
@@ -133,9 +271,18 @@ class OutputRenderer(object):
                                    type="dir",
                                    description=None,
                                    node=node,
-                                   sort=node.sort or 0.0)
+                                   sort=node.sort or 0.0,
+                                   prefix=prefix,
+                                   path=layout.path(docid))
+        return idx
 
-        # this is separate from above in order to obey the "sort" ordering
+    @staticmethod
+    def link_index(module, idx):
+        """
+        Sets the prev/next pointers of the documents in the index.
+        """
+        first = this = prev = None
+        # this is separate from building the index in order to obey the "sort" ordering
         # when settng the prev/next pointers
         for entry in idx:
             docid = entry.docid
@@ -156,6 +303,18 @@ class OutputRenderer(object):
             first.prev = this
             this.next = first
 
+    def render_document_index(self, module, doc_id, cur_node):
+        """
+        This creates all the indices, see :meth:`.document_index`.
+        The prev/next pointers are set by :meth:`.link_documents`.
+        """
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug("  I %s/%s -> %s", module.name, doc_id, list(cur_node.keys()))
+        ns = module.namespace
+        layout = self.cs.layout
+        doc_dir = join(self.cs.targ, ns.lower())
+        idx = self.document_index(module, doc_id, cur_node)
+
         if doc_id is None:
             # This is the "root" case
             fn = "index"
@@ -167,15 +326,22 @@ class OutputRenderer(object):
         else:
             # in this case, we have a doc_id and create a "virtual" docid.index document
             fn = doc_id + ".index"
-            bc = module.mk_breadcrumb(ns, doc_id)
+            bc = self.breadcrumb(fn, module.mk_breadcrumb(ns, doc_id))
             idx.title = " - ".join(mytitle(_[0]) for _ in reversed(bc)) + " - " + idx.title
 
             self.render_index(idx,
                               doc_dir,
-                              target_fn=fn,
+                              target_fn=layout.path(fn),
                               module=module,
                               namespace=ns,
-                              breadcrumb=bc)
+                              breadcrumb=bc,
+                              level=layout.level(fn))
+
+    def breadcrumb(self, docid, bc):
+        """
+        Makes the IDs of the breadcrumb relative to the page of `docid`, see :mod:`.layout`.
+        """
+        return [(title, self.cs.layout.relative(docid, _)) for title, _ in bc]
 
     def main_index(self):
         index_fn = join(self.cs.targ, "index.html")
@@ -187,18 +353,15 @@ class OutputRenderer(object):
                              # modules are ordered like in the config file, OrderedDict!
                              modules=self.cs.db.modules.values())
 
-    def document_indices(self):
+    def walk_indices(self, func, namespaces=None):
         """
-        This iterates through all documents and sets the .prev and .next pointers
-        inside the :func:`.render_document_index` method.
+        Calls `func(module, doc_id, node)` for the root (`doc_id` is None) and
+        then for each inner node of the document tree of each module.
         """
 
-        self.log.info("writing document index files")
-
-        def walk(m, node, parents, depth=0, prev=None):
+        def walk(m, node, parents, depth=0):
             """
             simple recursive walker, going through the nodes in the document tree.
-            the main purpose is to call the :func:`.render_document_index`.
             """
             assert isinstance(m, DocumentationModule)
             # print "  " * depth, "+", key, "INDEX" if len(node) > 0 else "LEAF"
@@ -206,57 +369,149 @@ class OutputRenderer(object):
             for key, node2 in sorted(node.items()):
                 p = parents[:]
                 p.append(key)
-                walk(m, node2, p, depth=depth + 1, prev=prev)
+                walk(m, node2, p, depth=depth + 1)
 
             if len(parents) > 0:
                 doc_id = ".".join(parents)
                 # self.log.debug("    %s" % doc_id)
-                self.render_document_index(m, doc_id, node, prev=prev)
+                func(m, doc_id, node)
 
         # this ordering is important for the prev/next chaining of documents (!)
         for ns in self.cs.config["modules"]:
+            if namespaces is not None and ns not in namespaces:
+                continue
             module = self.cs.db.modules[ns]
             assert isinstance(module, DocumentationModule)
-            self.render_document_index(module, None, module.tree)
+            func(module, None, module.tree)
             walk(module, module.tree, [])
 
-    def documents(self):
+    def link_documents(self, namespaces=None):
+        """
+        This iterates through all documents and sets the .prev and .next pointers.
+        It must be called before rendering, and only once for all variants, because they
+        share the documents and are rendered concurrently, see :meth:`.CollScientiae.render`.
+        """
+        self.walk_indices(lambda m, doc_id, node:
+                          self.link_index(m, self.document_index(m, doc_id, node)),
+                          namespaces)
+
+    def document_indices(self, namespaces=None):
+        """
+        This iterates through all documents and renders the indices,
+        see :func:`.render_document_index`.
+        """
+
+        self.log.info("writing document index files")
+        self.cs.events.phase("indices", target=self.cs.targ)
+        self.walk_indices(self.render_document_index, namespaces)
+
+    def documents(self, namespaces=None):
         """
         Writes all the individual documents.
         """
         self.log.info("writing document templates")
+        self.cs.events.phase("documents", target=self.cs.targ)
+        self.link_shards.clear()
         for ns, module in self.cs.db.modules.items():
+            if namespaces is not None and ns not in namespaces:
+                continue
             assert isinstance(module, DocumentationModule)
-            doc_dir = join(self.cs.targ, ns.lower())
-            # makedirs(doc_dir)
-
             for key, doc in module.items():
-                assert isinstance(doc, Document)
-                out_fn = join(doc_dir, doc.docid + ".html")
-                out_src_fn = join(doc_dir, doc.docid + ".txt")
-                link(doc.src_fn, out_src_fn)
-                backlinks = self.cs.db.backlinks[(module.namespace, key)]
-                forwardlinks = self.cs.db.forwardlinks[doc]
-                self.log.debug("  + %s" % out_fn)
-                try:
-                    seealso = [module[_] for _ in doc.seealso]
-                except AssertionError as ex:
-                    raise Exception("Error while processing 'seealso' in '{}/{}': '{}'"
-                                    .format(ns, key, ex.message))
-                bc = module.mk_breadcrumb(key, doc.docid, doc.title)
-                title = " - ".join(mytitle(_[0]) for _ in reversed(bc))
-                title += " - " + mytitle(ns)
-                self.render_template("document.html",
-                                     out_fn,
-                                     namespace=ns,
-                                     breadcrumb=bc,
-                                     title=title,
-                                     doc=doc,
-                                     seealso=seealso,
-                                     backlinks=backlinks,
-                                     forwardlinks=forwardlinks,
-                                     module=module,
-                                     level=1)
+                self.document(module, key, doc)
+        for fn, links in sorted(self.link_shards.items()):
+            data = json.dumps(links, sort_keys=True, separators=(",", ":"))
+            self.write_data(join(self.cs.targ, fn), data.encode("utf-8"))
+        if self.link_shards:
+            self.log.info("externalized the links of {} documents into {} files"
+                          .format(sum(len(_) for _ in self.link_shards.values()),
+                                  len(self.link_shards)))
+
+    def document_links(self, doc, backlinks, forwardlinks):
+        """
+        The data of the links of the document for `document.html`.
+
+        If the `links` entry of the config is set, e.g. ::
+
+            links:
+              inline: 10    # number of links in the page
+              shards: 64    # number of JSON files per module
+
+        and the document has more than `inline` backlinks or forwardlinks, only the first
+        `inline` ones are passed to the template. All of them are written into the JSON file
+        `links_json` (relative to the target directory, for the `prefix` filter), which
+        maps the document IDs of its module to their "backlinks" and "forwardlinks".
+        `backlinks_count` and `forwardlinks_count` are always the total numbers.
+        """
+        data = {"backlinks": backlinks,
+                "forwardlinks": forwardlinks,
+                "backlinks_count": len(backlinks),
+                "forwardlinks_count": len(forwardlinks),
+                "links_json": None}
+        config = self.cs.config.get("links")
+        if not config or not self.externalize_links:
+            return data
+        config = config if isinstance(config, dict) else {}
+        inline = config.get("inline", 10)
+        if len(backlinks) <= inline and len(forwardlinks) <= inline:
+            return data
+        shard = int(hashlib.sha1(doc.docid.encode("utf-8")).hexdigest(), 16) \
+            % config.get("shards", 64)
+        fn = "%s/_links/%d.json" % (doc.namespace.lower(), shard)
+        self.link_shards[fn][doc.docid] = {"backlinks": [self.link_item(_) for _ in backlinks],
+                                           "forwardlinks": [self.link_item(_) for _ in forwardlinks]}
+        data.update(backlinks=backlinks[:inline],
+                    forwardlinks=forwardlinks[:inline],
+                    links_json=fn)
+        return data
+
+    def link_item(self, doc):
+        return {"namespace": doc.namespace,
+                "docid": doc.docid,
+                "title": doc.title,
+                "href": "%s/%s.html" % (doc.namespace.lower(), self.cs.layout.path(doc.docid))}
+
+    def document(self, module, key, doc):
+        """
+        Writes the given document of the module.
+        """
+        assert isinstance(doc, Document)
+        ns = module.namespace
+        layout = self.cs.layout
+        doc_dir = join(self.cs.targ, ns.lower())
+        out_fn = join(doc_dir, layout.path(doc.docid) + ".html")
+        out_src_fn = join(doc_dir, layout.path(doc.docid) + ".txt")
+        self.make_dirs(dirname(out_src_fn))
+        self.copy_file(doc.src_fn, out_src_fn)
+        # sorted, because the order of the sets changes with each run
+        links = self.document_links(
+            doc,
+            sorted(self.cs.db.backlinks[(module.namespace, key)], key=document_key),
+            sorted(self.cs.db.forwardlinks[doc], key=document_key))
+        related = self.cs.related.get(doc, [])
+        self.log.debug("  + %s", out_fn)
+        if self.cs.outputs is not None:
+            doc = ThemedDocument(doc, self.cs.outputs[doc])
+        try:
+            seealso = [module[_] for _ in doc.seealso]
+        except AssertionError as ex:
+            raise Exception("Error while processing 'seealso' in '{}/{}': '{}'"
+                            .format(ns, key, ex))
+        bc = self.breadcrumb(doc.docid, module.mk_breadcrumb(key, doc.docid, doc.title))
+        title = " - ".join(mytitle(_[0]) for _ in reversed(bc))
+        title += " - " + mytitle(ns)
+        if self.cs.reproducible:
+            links["creation_date"] = self.cs.document_date(doc)
+        self.render_template("document.html",
+                             out_fn,
+                             namespace=ns,
+                             breadcrumb=bc,
+                             title=title,
+                             doc=doc,
+                             seealso=seealso,
+                             related=related,
+                             module=module,
+                             level=layout.level(doc.docid),
+                             **links)
 
     def hashtags(self):
         """
@@ -264,6 +519,7 @@ class OutputRenderer(object):
 
         """
         self.log.info("Hashtags")
+        self.cs.events.phase("hashtags", target=self.cs.targ)
         hashtag_dir = join(self.cs.targ, "hashtag")
         hashtags = sorted(self.cs.db.hashtags.items(),
                           key=lambda _: _[0])
@@ -278,30 +534,52 @@ class OutputRenderer(object):
                           target_fn="index")
 
         for hashtag, docs in hashtags:
-            # out_fn = join(hashtag_dir, hashtag + ".html")
-            self.log.debug("  # " + hashtag)
-            bc = [(hashtag.title(), hashtag)]
-            idx = Index("Hashtag #" + hashtag)
-            for d in docs:
-                idx += Index.Entry(d.title,
-                                   d.namespace + "/" + d.docid,
-                                   group=d.namespace,
-                                   description=d.subtitle,
-                                   prefix=1)
-            self.render_index(idx,
-                              hashtag_dir,
-                              target_fn=hashtag,
-                              namespace="hashtag",
-                              breadcrumb=bc)
+            self.hashtag(hashtag, docs)
 
-    def output(self):
+    def hashtag(self, hashtag, docs):
+        """
+        Render the page for one hashtag, listing all its documents.
+        """
+        hashtag_dir = join(self.cs.targ, "hashtag")
+        # out_fn = join(hashtag_dir, hashtag + ".html")
+        self.log.debug("  # %s", hashtag)
+        bc = [(hashtag.title(), hashtag)]
+        idx = Index("Hashtag #" + hashtag)
+        for d in sorted(docs, key=document_key):
+            idx += Index.Entry(d.title,
+                               d.namespace + "/" + d.docid,
+                               group=d.namespace,
+                               description=d.subtitle,
+                               prefix=1,
+                               path=d.namespace + "/" + self.cs.layout.path(d.docid))
+        self.render_index(idx,
+                          hashtag_dir,
+                          target_fn=hashtag,
+                          namespace="hashtag",
+                          breadcrumb=bc)
+
+    def output(self, namespaces=None):
         """
         The main method of this part, the ordering is not important except for creating
         directories (and assuming their existence later).
+
+        :param namespaces: if given, only the documents of these modules are rendered.
         """
         self.log.info("rendering into %s" % self.cs.targ)
-        self.copy_static_files()
-        self.main_index()
-        self.document_indices()
-        self.documents()
-        self.hashtags()
+        if self.writer_threads > 0:
+            events = self.cs.events
+            self.writer = PageWriter(self.writer_threads, self.writer_depth,
+                                     written=lambda size: events.count(pages=1, bytes=size))
+        try:
+            self.copy_static_files(namespaces)
+            self.main_index()
+            self.document_indices(namespaces)
+            self.documents(namespaces)
+            self.hashtags()
+        finally:
+            if self.writer is not None:
+                self.writer.close()
+                self.log.info("wrote {pages} pages ({bytes} bytes): queue depth {depth_mean:.1f} "
+                              "on average, max. {depth_max}, stalled {stall_time:.3f}s, "
+                              "writers idle {idle_time:.3f}s".format(**self.writer.stats()))
+                self.writer = None
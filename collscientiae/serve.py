@@ -0,0 +1,392 @@
+# -*- coding: utf8 -*-
+"""
+A local development server, rendering pages only when they are requested.
+
+Only the index of all documents (modules, metadata, trees, links and hashtags)
+is built upfront, without converting any document.
+Documents are converted on demand and all rendered pages are kept in a size-bounded
+LRU cache, which is invalidated when the source files change.
+New documents are picked up while serving, but removed or renamed ones and changes
+of the configuration need a restart. Images are served as they are, without optimizing them.
+"""
+from __future__ import absolute_import, unicode_literals
+from collections import OrderedDict
+from os.path import join, normpath, relpath, sep, exists, isfile, getmtime
+from threading import Lock, Thread
+from time import time, sleep
+from .models import Document
+from .render import OutputRenderer
+from .utils import get_markdown
+
+
+class PageCache(object):
+
+    """
+    LRU cache for rendered pages, bounded by the total size of the pages in bytes.
+    Each page is stored along with the set of source files it depends on.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        # maps url to (data, dependencies), the most recently used is last
+        self._pages = OrderedDict()
+
+    def __contains__(self, url):
+        return url in self._pages
+
+    def __len__(self):
+        return len(self._pages)
+
+    def get(self, url):
+        if url not in self._pages:
+            return None
+        entry = self._pages.pop(url)
+        self._pages[url] = entry
+        return entry[0]
+
+    def dependencies(self, url):
+        return self._pages[url][1] if url in self._pages else set()
+
+    def put(self, url, data, dependencies):
+        """
+        Stores the page and returns the urls of the evicted pages.
+        """
+        self.remove(url)
+        self._pages[url] = (data, dependencies)
+        self.size += len(data)
+        evicted = []
+        while self.size > self.max_bytes and len(self._pages) > 1:
+            old_url = next(iter(self._pages))
+            self.remove(old_url)
+            evicted.append(old_url)
+        return evicted
+
+    def remove(self, url):
+        if url in self._pages:
+            data, _ = self._pages.pop(url)
+            self.size -= len(data)
+
+    def clear(self):
+        self._pages.clear()
+        self.size = 0
+
+    def invalidate(self, src_fn):
+        """
+        Removes all pages, which depend on the given source file.
+        """
+        urls = [url for url, (_, deps) in self._pages.items() if src_fn in deps]
+        for url in urls:
+            self.remove(url)
+        return urls
+
+
+class ServeRenderer(OutputRenderer):
+
+    """
+    Instead of writing the pages, this only records the template and data for each url.
+    The links are not externalized, since they change while serving.
+    """
+
+    externalize_links = False
+
+    def __init__(self, collscientiae):
+        super(ServeRenderer, self).__init__(collscientiae)
+        # maps url to (template_fn, data)
+        self.pages = {}
+        # maps url to a source file
+        self.files = {}
+
+    def url(self, target_fn):
+        return relpath(target_fn, self.cs.targ).replace(sep, "/")
+
+    def make_dirs(self, path):
+        pass
+
+    def copy_file(self, src_fn, target_fn):
+        self.files[self.url(target_fn)] = src_fn
+
+    def render_template(self, template_fn, target_fn, **data):
+        self.pages[self.url(target_fn)] = (template_fn, data)
+
+    def image_optimizer(self):
+        # optimizing all images would delay the first page
+        return None
+
+    def document(self, module, key, doc):
+        try:
+            super(ServeRenderer, self).document(module, key, doc)
+        except Exception as ex:
+            self.log.warning("{}: {}".format(doc, ex))
+
+
+class DevServer(object):
+
+    """
+    Serves the documentation of the given :class:`.CollScientiae` instance via HTTP.
+    Its target directory is never written to.
+
+    :param cache_size: maximum size of all cached pages in bytes
+    :param poll_interval: seconds between checking all source files for changes,
+                          requested pages are always checked.
+    """
+
+    def __init__(self, cs, cache_size=64 * 1024 * 1024, poll_interval=2.0):
+        self.cs = cs
+        self.log = cs.log
+        self.db = cs.db
+        self.processor = cs.processor
+        self.renderer = cs.renderer = ServeRenderer(cs)
+        self.cache = PageCache(cache_size)
+        self.poll_interval = poll_interval
+        # maps source filenames to their document and the mtime when they were read
+        self.sources = {}
+        self.lock = Lock()
+
+    def index(self):
+        """
+        Builds the index of all documents, without converting them.
+        """
+        start = time()
+        self.log.info("indexing '%s'" % self.cs.src)
+        for module, filepath, docid, md_raw in self.cs.get_documents():
+            self.add(module, filepath, docid, md_raw)
+        self.db.resolve_forwardlinks(strict=False)
+        self.cs.read_node_config()
+        # records the static files and sets the names of the bundled assets
+        self.renderer.copy_static_files()
+        # documents are not converted, hence the hashes only change with each start
+        self.cs.j2env.globals["doc_root_hash"] = "%x" % int(start)
+        self.cs.j2env.globals["module_hashes"] = dict((ns, "%x" % int(start)) for ns in self.db.modules)
+        self.layout()
+        self.log.info("indexed %d documents in %.3fs" % (len(self.sources), time() - start))
+
+    def add(self, module, filepath, docid, md_raw):
+        """
+        Registers the document of the source file, without converting it.
+        """
+        doc = Document(docid=docid, md_raw=md_raw, ns=module.namespace, src_fn=filepath)
+        doc.update(output=None, **self.processor.read_metadata(doc))
+        self.db.register(doc)
+        self.processor.scan(doc)
+        self.sources[filepath] = [getmtime(filepath), doc]
+        return doc
+
+    def layout(self):
+        """
+        Sets the prev/next pointers of all documents and records the data for all pages.
+        """
+        for module in self.db.modules.values():
+            for _, doc in module.items():
+                doc.prev = doc.next = None
+        self.renderer.link_documents()
+        self.renderer.pages.clear()
+        self.renderer.main_index()
+        self.renderer.document_indices()
+        self.renderer.documents()
+        self.renderer.hashtags()
+
+    def doc_url(self, doc):
+        return "%s/%s.html" % (doc.namespace.lower(), self.cs.layout.path(doc.docid))
+
+    def convert(self, doc):
+        self.db.unregister_links(doc)
+        html, meta = self.processor.convert(doc)
+        doc.update(output=html, **meta)
+        self.db.resolve_forwardlinks([doc], strict=False)
+
+    def dependencies(self, data):
+        """
+        All source files of the documents, which show up in the data of a page.
+        """
+        docs = set()
+        if data.get("doc") is not None:
+            docs.add(data["doc"])
+        for key in ["seealso", "backlinks", "forwardlinks"]:
+            docs.update(data.get(key) or [])
+        module = data.get("module")
+        index = data.get("index")
+        if index is not None:
+            for entry in index.entries:
+                if entry.type != "file":
+                    continue
+                ns, _, docid = entry.docid.rpartition("/")
+                m = self.db.modules.get(ns) if ns else module
+                if m is not None and docid in m:
+                    docs.add(m[docid])
+        return set(d.src_fn for d in docs)
+
+    def linked_pages(self, doc):
+        """
+        Urls of all pages, which show the links or hashtags of the given document.
+        """
+        urls = set(self.doc_url(d) for d in self.db.forwardlinks.get(doc, []))
+        for hashtag, docs in self.db.hashtags.items():
+            if doc in docs:
+                urls.add("hashtag/%s.html" % hashtag)
+        return urls
+
+    def reload(self, src_fn):
+        """
+        Reads the changed source file again and invalidates all affected pages.
+        """
+        self.log.info("changed: %s" % src_fn)
+        entry = self.sources[src_fn]
+        entry[0] = getmtime(src_fn)
+        doc = entry[1]
+        hashtags = set(self.db.hashtags)
+        affected = self.linked_pages(doc)
+        self.db.unregister_links(doc)
+        doc.md_raw = get_markdown(src_fn)
+        doc.update(output=None, **self.processor.read_metadata(doc))
+        self.processor.scan(doc)
+        self.db.resolve_forwardlinks([doc], strict=False)
+        affected |= self.linked_pages(doc)
+        if hashtags != set(self.db.hashtags):
+            affected.add("hashtag/index.html")
+        self.layout()
+        for url in affected:
+            self.cache.remove(url)
+        self.cache.invalidate(src_fn)
+
+    def check(self, src_fns):
+        for src_fn in src_fns:
+            if src_fn in self.sources and exists(src_fn) \
+                    and getmtime(src_fn) != self.sources[src_fn][0]:
+                self.reload(src_fn)
+
+    def check_new(self):
+        """
+        Registers the documents of new source files. They might be the targets of links
+        of other documents, hence all links are scanned again and all documents are
+        converted again, when they are requested.
+        """
+        new = False
+        for module in list(self.db.modules.values()):
+            for filepath, docid in self.cs.module_files(module.path):
+                if filepath not in self.sources:
+                    self.log.info("new: %s" % filepath)
+                    self.add(module, filepath, docid, get_markdown(filepath))
+                    new = True
+        if not new:
+            return
+        docs = [doc for _, doc in self.sources.values()]
+        for doc in docs:
+            self.db.unregister_links(doc)
+            doc.output = None
+            self.processor.scan(doc)
+        self.db.resolve_forwardlinks(docs, strict=False)
+        self.layout()
+        self.cache.clear()
+
+    def poll(self):
+        while True:
+            sleep(self.poll_interval)
+            with self.lock:
+                self.check(list(self.sources))
+                self.check_new()
+
+    def static_file(self, url):
+        """
+        Maps the url of a static file or image to its source file.
+        """
+        if url in self.renderer.files:
+            return self.renderer.files[url]
+        parts = url.split("/")
+        if parts[0] in ["static", "img"]:
+            base = self.cs.tmpl_dir
+        elif len(parts) > 2 and parts[1] in ["static", "img"] \
+                and parts[0] in self.cs.config["modules"]:
+            base = self.cs.src
+        else:
+            return None
+        fn = normpath(join(base, *parts))
+        if fn.startswith(base + sep) and isfile(fn):
+            return fn
+
+    def get(self, url):
+        """
+        Returns the content of the given url as bytes or None, if it does not exist.
+        """
+        with self.lock:
+            self.check(self.cache.dependencies(url))
+            page = self.cache.get(url)
+            if page is not None:
+                return page
+            if url in self.renderer.pages:
+                template_fn, data = self.renderer.pages[url]
+                doc = data.get("doc")
+                if doc is not None:
+                    if doc.output is None:
+                        self.convert(doc)
+                    # the links might have changed, hence recording the data again
+                    self.renderer.document(data["module"], doc.docid, doc)
+                    template_fn, data = self.renderer.pages[url]
+                page = self.renderer.render_page(template_fn, **data).encode("utf-8")
+                for evicted in self.cache.put(url, page, self.dependencies(data)):
+                    evicted_data = self.renderer.pages.get(evicted, (None, {}))[1]
+                    if evicted_data.get("doc") is not None:
+                        evicted_data["doc"].output = None
+                return page
+        fn = self.static_file(url)
+        if fn is not None:
+            with open(fn, "rb") as f:
+                return f.read()
+
+    def serve(self, host="localhost", port=8000):
+        try:
+            from http.server import HTTPServer, BaseHTTPRequestHandler
+            from urllib.parse import urlparse, unquote
+        except ImportError:
+            from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+            from urlparse import urlparse
+            from urllib import unquote
+        from mimetypes import guess_type
+        from traceback import format_exc
+        devserver = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                url = unquote(urlparse(self.path).path).lstrip("/")
+                if url == "" or url.endswith("/"):
+                    url += "index.html"
+                try:
+                    data = devserver.get(url)
+                    status = 404 if data is None else 200
+                    if data is None:
+                        data = b"not found"
+                except Exception:
+                    status, data = 500, format_exc().encode("utf-8")
+                    devserver.log.error(format_exc())
+                ctype = guess_type(url)[0] if status == 200 else "text/plain"
+                self.send_response(status)
+                self.send_header("Content-Type", ctype or "application/octet-stream")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                devserver.log.debug(format, *args)
+
+        self.index()
+        poller = Thread(target=self.poll)
+        poller.daemon = True
+        poller.start()
+        httpd = HTTPServer((host, port), Handler)
+        self.log.info("serving on http://%s:%d/" % (host, port))
+        httpd.serve_forever()
+
+
+if __name__ == "__main__":
+    import sys
+    from tempfile import gettempdir
+    from .collscientiae import CollScientiae
+
+    assert 3 <= len(sys.argv) <= 4, \
+        "Need two arguments, the source and the theme directory, " \
+        "and optionally the port number."
+    # the target directory is never written to
+    cs = CollScientiae(sys.argv[1], sys.argv[2], join(gettempdir(), "collscientiae-serve"))
+    port = int(sys.argv[3]) if len(sys.argv) == 4 else 8000
+    DevServer(cs).serve(port=port)
@@ -0,0 +1,61 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+from .serve import PageCache
+
+
+def test_page_cache_lru():
+    cache = PageCache(max_bytes=10)
+    assert cache.put("a", b"1234", {"a.md"}) == []
+    assert cache.put("b", b"1234", {"b.md"}) == []
+    assert cache.get("a") == b"1234"
+    # "b" is the least recently used one
+    assert cache.put("c", b"1234", {"c.md"}) == ["b"]
+    assert "b" not in cache
+    assert cache.size == 8
+
+
+def test_page_cache_invalidate():
+    cache = PageCache()
+    cache.put("a", b"x", {"a.md", "b.md"})
+    cache.put("b", b"x", {"b.md"})
+    cache.put("c", b"x", {"c.md"})
+    assert sorted(cache.invalidate("b.md")) == ["a", "b"]
+    assert len(cache) == 1
+    assert cache.dependencies("c") == {"c.md"}
+
+
+def test_dev_server(tmpdir):
+    import logging
+    import os
+    from .collscientiae import CollScientiae
+    from .collscientiae_test import SOURCES, THEME, write_files
+    from .serve import DevServer
+    src, theme = tmpdir.join("src"), tmpdir.join("theme")
+    write_files(src, SOURCES)
+    write_files(theme, THEME)
+    cs = CollScientiae(str(src), str(theme), str(tmpdir.join("out")), log_level=logging.WARNING)
+    server = DevServer(cs)
+    converted = []
+    convert = server.convert
+    server.convert = lambda doc: converted.append(doc.docid) or convert(doc)
+    server.index()
+    # images are not optimized before serving
+    assert server.renderer.image_optimizer() is None
+
+    assert b"see" in server.get("alpha/aa.html")
+    assert converted == ["aa"]
+    # "bb" shows its backlink "aa", hence it depends on it
+    assert b"aa" in server.get("beta/bb.html")
+    assert converted == ["aa", "bb"]
+
+    src.join("alpha/aa.md").write("title: A\n\nchanged\n")
+    os.utime(str(src.join("alpha/aa.md")), (2000000000, 2000000000))
+    assert b"changed" in server.get("alpha/aa.html")
+    assert converted == ["aa", "bb", "aa"]
+    assert "beta/bb.html" not in server.cache
+
+    src.join("alpha/ee.md").write("title: E\n\nsee link[beta/bb]\n")
+    server.check_new()
+    assert b"see" in server.get("alpha/ee.html")
+    assert b"ee" in server.get("beta/bb.html")
@@ -0,0 +1,180 @@
+# -*- coding: utf8 -*-
+"""
+Access to the source tree: :class:`.FileSource` reads it from the file system and
+:class:`.GitSource` reads a revision of it straight from a git repository's object store,
+without checking it out.
+All paths are absolute paths below the source directory, also for :class:`.GitSource`.
+"""
+from __future__ import absolute_import, unicode_literals
+import subprocess
+from os.path import join, normpath, dirname, basename, sep
+from threading import Lock
+from .utils import get_yaml, get_markdown
+
+
+class FileSource(object):
+
+    """
+    The source tree in the file system.
+    """
+
+    # if False, the files only exist in memory and not on disk
+    on_disk = True
+
+    def exists(self, path):
+        from os.path import exists
+        return exists(path)
+
+    def walk(self, path):
+        from os import walk
+        return walk(path)
+
+    def read(self, path):
+        return get_markdown(path)
+
+    def read_bytes(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def yaml(self, path):
+        return get_yaml(path)
+
+    def copy(self, path, target_fn):
+        """
+        Puts the file `path` at `target_fn` into the output tree.
+        """
+        from os import link
+        link(path, target_fn)
+
+    def key(self, path):
+        """
+        A key, which only changes if the content of the file changes, or None if there is none.
+        """
+        return None
+
+    def time(self, path):
+        """
+        The time of the file in seconds since the epoch, i.e. its modification time.
+        """
+        from os.path import getmtime
+        return int(getmtime(path))
+
+    def close(self):
+        pass
+
+
+class GitSource(FileSource):
+
+    """
+    The source tree `path` at the given `revision` of the git repository it belongs to.
+    Files outside of `path` are read from the file system, e.g. those of the theme.
+    """
+
+    on_disk = False
+
+    def __init__(self, path, revision):
+        self.path = path
+        self.revision = revision
+        # maps paths to blob hashes and directories to their subdirectories and files
+        self.blobs = {}
+        self.dirs = {path: (set(), [])}
+        self.lock = Lock()
+        self.cat_file = None
+        self.commit_time = None
+        listing = self.git("ls-tree", "-r", "-z", revision)
+        for entry in listing.split(b"\0"):
+            if not entry:
+                continue
+            info, fn = entry.split(b"\t", 1)
+            mode, kind, blob = info.decode("ascii").split()
+            if kind != "blob":
+                continue
+            fn = normpath(join(path, fn.decode("utf8")))
+            self.blobs[fn] = blob
+            self.add_dir(dirname(fn))
+            self.dirs[dirname(fn)][1].append(basename(fn))
+
+    def add_dir(self, path):
+        if path in self.dirs:
+            return
+        self.dirs[path] = (set(), [])
+        parent = dirname(path)
+        self.add_dir(parent)
+        self.dirs[parent][0].add(basename(path))
+
+    def git(self, *args):
+        return subprocess.check_output(("git",) + args, cwd=self.path)
+
+    def exists(self, path):
+        return path in self.blobs or path in self.dirs or \
+            (not path.startswith(self.path + sep) and FileSource.exists(self, path))
+
+    def walk(self, path):
+        if path not in self.dirs:
+            if not path.startswith(self.path + sep):
+                for _ in FileSource.walk(self, path):
+                    yield _
+            return
+        subdirs, files = self.dirs[path]
+        subdirs = sorted(subdirs)
+        yield path, subdirs, sorted(files)
+        for subdir in subdirs:
+            for _ in self.walk(join(path, subdir)):
+                yield _
+
+    def blob(self, path):
+        """
+        Reads the content of the file `path` as bytes from the object store.
+        """
+        with self.lock:
+            if self.cat_file is None:
+                self.cat_file = subprocess.Popen(["git", "cat-file", "--batch"], cwd=self.path,
+                                                 stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            self.cat_file.stdin.write(self.blobs[path].encode("ascii") + b"\n")
+            self.cat_file.stdin.flush()
+            header = self.cat_file.stdout.readline().split()
+            data = self.cat_file.stdout.read(int(header[2]))
+            self.cat_file.stdout.read(1)
+            return data
+
+    def read(self, path):
+        if path not in self.blobs:
+            return FileSource.read(self, path)
+        return self.blob(path).decode("utf8")
+
+    def read_bytes(self, path):
+        if path not in self.blobs:
+            return FileSource.read_bytes(self, path)
+        return self.blob(path)
+
+    def yaml(self, path):
+        if path not in self.blobs:
+            return FileSource.yaml(self, path)
+        import yaml
+        from .utils import YAMLLoader
+        return yaml.load(self.read(path), Loader=YAMLLoader)
+
+    def copy(self, path, target_fn):
+        if path not in self.blobs:
+            return FileSource.copy(self, path, target_fn)
+        with open(target_fn, "wb") as f:
+            f.write(self.blob(path))
+
+    def key(self, path):
+        return self.blobs.get(path)
+
+    def time(self, path):
+        """
+        The commit time of the revision.
+        """
+        if path not in self.blobs:
+            return FileSource.time(self, path)
+        if self.commit_time is None:
+            self.commit_time = int(self.git("show", "-s", "--format=%ct", self.revision))
+        return self.commit_time
+
+    def close(self):
+        if self.cat_file is not None:
+            self.cat_file.stdin.close()
+            self.cat_file.wait()
+            self.cat_file = None
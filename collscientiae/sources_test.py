@@ -0,0 +1,42 @@
+# coding=utf-8
+from __future__ import absolute_import
+import subprocess
+import pytest
+
+from .sources import GitSource
+
+
+def git(cwd, *args):
+    subprocess.check_call(("git", "-c", "user.name=test", "-c", "user.email=test@test") + args,
+                          cwd=cwd, stdout=subprocess.PIPE)
+
+
+def test_git_source(tmpdir):
+    try:
+        git(str(tmpdir), "init", "-q")
+    except OSError:
+        pytest.skip("git is not available")
+    src = tmpdir.mkdir("src")
+    src.join("config.yaml").write("title: Test\n")
+    src.mkdir("mod").mkdir("sub").join("doc.md").write("v1")
+    git(str(tmpdir), "add", "-A")
+    git(str(tmpdir), "commit", "-q", "-m", "v1")
+    src.join("mod", "sub", "doc.md").write("v2")
+    src.join("mod", "new.md").write("new")
+
+    source = GitSource(str(src), "HEAD")
+    try:
+        path = str(src.join("mod", "sub", "doc.md"))
+        assert source.read(path) == "v1"
+        assert source.yaml(str(src.join("config.yaml"))) == {"title": "Test"}
+        assert source.exists(str(src.join("mod", "sub")))
+        assert not source.exists(str(src.join("mod", "new.md")))
+        walk = list(source.walk(str(src.join("mod"))))
+        assert walk == [(str(src.join("mod")), ["sub"], []),
+                        (str(src.join("mod", "sub")), [], ["doc.md"])]
+        assert len(source.key(path)) == 40
+        target = tmpdir.join("doc.txt")
+        source.copy(path, str(target))
+        assert target.read() == "v1"
+    finally:
+        source.close()
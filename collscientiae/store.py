@@ -0,0 +1,284 @@
+# -*- coding: utf8 -*-
+"""
+Persists the processed :class:`.CollScientiaeDB` in an SQLite database.
+
+The database can be queried directly, e.g. ::
+
+    SELECT src_ns, src_docid FROM backlinks WHERE ns = 'alpha' AND docid = 'intro'
+
+and :meth:`.SQLiteStore.load` rebuilds the :class:`.CollScientiaeDB` from it,
+where documents are only read when they are accessed.
+"""
+from __future__ import absolute_import, unicode_literals
+import json
+import sqlite3
+from collections import OrderedDict
+from .db import CollScientiaeDB
+from .models import Document, DocumentationModule
+
+SCHEMA = """
+CREATE TABLE info (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE modules (ns TEXT PRIMARY KEY, position INTEGER, path TEXT, config TEXT);
+CREATE TABLE nodes (ns TEXT, path TEXT, config TEXT, PRIMARY KEY (ns, path));
+CREATE TABLE documents (
+    ns TEXT, docid TEXT, src_fn TEXT, type TEXT, title TEXT, subtitle TEXT,
+    abstract TEXT, authors TEXT, copyright TEXT, tags TEXT, grp TEXT, sort REAL,
+    date TEXT, seealso TEXT, md_raw TEXT, output TEXT, hash TEXT,
+    PRIMARY KEY (ns, docid));
+CREATE TABLE links (src_ns TEXT, src_docid TEXT, ns TEXT, docid TEXT);
+CREATE INDEX links_src ON links (src_ns, src_docid);
+CREATE INDEX links_target ON links (ns, docid);
+CREATE TABLE knowls (src_ns TEXT, src_docid TEXT, ns TEXT, docid TEXT);
+CREATE INDEX knowls_target ON knowls (ns, docid);
+CREATE TABLE hashtags (hashtag TEXT, ns TEXT, docid TEXT);
+CREATE INDEX hashtags_hashtag ON hashtags (hashtag);
+CREATE VIEW backlinks AS
+    SELECT * FROM links WHERE NOT (src_ns = ns AND src_docid = docid);
+"""
+
+document_columns = ["src_fn", "type", "title", "subtitle", "abstract", "authors", "copyright",
+                    "tags", "grp", "sort", "date", "seealso", "md_raw", "output", "hash"]
+
+
+class LazyDocuments(object):
+
+    """
+    Replaces the dictionary of documents in a :class:`.DocumentationModule`,
+    the documents are read from the store when they are accessed.
+    """
+
+    def __init__(self, store, ns, docids):
+        self.store = store
+        self.ns = ns
+        self.docids = OrderedDict((docid, None) for docid in docids)
+
+    def __contains__(self, docid):
+        return docid in self.docids
+
+    def __getitem__(self, docid):
+        return self.store.document(self.ns, docid)
+
+    def __setitem__(self, docid, document):
+        self.docids[docid] = None
+        self.store.documents[(self.ns, docid)] = document
+
+    def __len__(self):
+        return len(self.docids)
+
+    def __iter__(self):
+        return iter(self.docids)
+
+    def keys(self):
+        return list(self.docids)
+
+    def items(self):
+        return [(docid, self[docid]) for docid in self.docids]
+
+
+class LazyTable(object):
+
+    """
+    Read-only replacement for the link tables of :class:`.CollScientiaeDB`,
+    mapping a key to the set of documents. The sets are read when they are accessed.
+
+    :param key_columns: the columns of the key
+    :param doc_keys: if True, the keys are documents (instead of strings or tuples)
+    """
+
+    def __init__(self, store, table, key_columns, value_columns, doc_keys=False):
+        self.store = store
+        self.doc_keys = doc_keys
+        self.keys_sql = "SELECT DISTINCT {} FROM {}".format(", ".join(key_columns), table)
+        self.values_sql = "SELECT {} FROM {} WHERE {}".format(
+            ", ".join(value_columns), table, " AND ".join("%s = ?" % _ for _ in key_columns))
+        self._sets = {}
+
+    def params(self, key):
+        if self.doc_keys:
+            return key.namespace, key.docid
+        return key if isinstance(key, tuple) else (key,)
+
+    def key(self, row):
+        if self.doc_keys:
+            return self.store.document(*row)
+        return tuple(row) if len(row) > 1 else row[0]
+
+    def __getitem__(self, key):
+        if key not in self._sets:
+            rows = self.store.conn.execute(self.values_sql, self.params(key))
+            self._sets[key] = set(self.store.document(ns, docid) for ns, docid in rows)
+        return self._sets[key]
+
+    def get(self, key, default=None):
+        docs = self[key]
+        return docs if len(docs) > 0 else default
+
+    def __contains__(self, key):
+        return len(self[key]) > 0
+
+    def keys(self):
+        return [self.key(row) for row in self.store.conn.execute(self.keys_sql)]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+
+class SQLiteStore(object):
+
+    """
+    Writes and reads the processed state of a :class:`.CollScientiaeDB` to and from
+    the SQLite database file `fn`.
+    """
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.conn = None
+        # all documents read so far, mapping (ns, docid) to the document
+        self.documents = {}
+
+    def save(self, db, **info):
+        """
+        Writes the database, after all documents are processed and the
+        forwardlinks are resolved. Any existing file is replaced.
+
+        :param info: additional key/value pairs, stored in the "info" table
+        """
+        from os import remove
+        from os.path import exists
+        assert isinstance(db, CollScientiaeDB)
+        db.log.info("saving db to '%s'" % self.fn)
+        if exists(self.fn):
+            remove(self.fn)
+        conn = sqlite3.connect(self.fn)
+        conn.executescript(SCHEMA)
+        conn.executemany("INSERT INTO info VALUES (?, ?)", info.items())
+
+        for pos, (ns, module) in enumerate(db.modules.items()):
+            config = dict((k, v) for k, v in module.__dict__.items()
+                          if k not in ["path", "namespace", "tree", "_documents"])
+            conn.execute("INSERT INTO modules VALUES (?, ?, ?, ?)",
+                         (ns, pos, module.path, json.dumps(config, default=str)))
+            conn.executemany("INSERT INTO nodes VALUES (?, ?, ?)",
+                             ((ns, path, json.dumps(node.__dict__, default=str))
+                              for path, node in self.walk(module.tree)))
+            conn.executemany("INSERT INTO documents VALUES (%s)" % ", ".join(["?"] * 17),
+                             (self.document_row(doc) for _, doc in module.items()))
+
+        conn.executemany("INSERT INTO links VALUES (?, ?, ?, ?)",
+                         ((doc.namespace, doc.docid, target.namespace, target.docid)
+                          for doc, targets in db.forwardlinks.items() for target in targets))
+        conn.executemany("INSERT INTO knowls VALUES (?, ?, ?, ?)",
+                         ((doc.namespace, doc.docid, ns, docid)
+                          for (ns, docid), docs in db.knowls.items() for doc in docs))
+        conn.executemany("INSERT INTO hashtags VALUES (?, ?, ?)",
+                         ((hashtag, doc.namespace, doc.docid)
+                          for hashtag, docs in db.hashtags.items() for doc in docs))
+        conn.commit()
+        conn.close()
+
+    @staticmethod
+    def walk(node, parents=()):
+        """
+        Yields the dotted path and node for all nodes below the given one.
+        """
+        for key, node2 in node.items():
+            path = parents + (key,)
+            yield ".".join(path), node2
+            for _ in SQLiteStore.walk(node2, path):
+                yield _
+
+    @staticmethod
+    def document_row(doc):
+        return (doc.namespace, doc.docid, doc.src_fn, doc.type, doc.title, doc.subtitle,
+                doc.abstract, json.dumps(doc.authors), doc.copyright, json.dumps(doc.tags),
+                doc.group, doc.sort, doc.date.isoformat() if doc.date else None,
+                json.dumps(doc.seealso), doc.md_raw, doc.output, doc.hash)
+
+    def document(self, ns, docid):
+        """
+        Reads the document from the database, once.
+        """
+        key = (ns, docid)
+        if key not in self.documents:
+            sql = "SELECT %s FROM documents WHERE ns = ? AND docid = ?" % ", ".join(document_columns)
+            row = self.conn.execute(sql, key).fetchone()
+            assert row is not None, "Document '%s/%s' does not exist" % key
+            row = dict(zip(document_columns, row))
+            doc = Document(docid=docid, md_raw=row["md_raw"], ns=ns, src_fn=row["src_fn"])
+            doc.update(row["output"],
+                       title=row["title"],
+                       authors=json.loads(row["authors"]),
+                       subtitle=row["subtitle"],
+                       abstract=row["abstract"],
+                       tags=json.loads(row["tags"]),
+                       type=row["type"],
+                       group=row["grp"],
+                       date=row["date"],
+                       seealso=json.loads(row["seealso"]),
+                       copyright=row["copyright"],
+                       sort=row["sort"])
+            doc.hash = row["hash"]
+            self.documents[key] = doc
+        return self.documents[key]
+
+    def load(self, collscientiae):
+        """
+        Rebuilds a :class:`.CollScientiaeDB` from the database.
+        Only modules and document trees are read immediately,
+        documents and link tables are read when they are accessed.
+        """
+        collscientiae.log.info("loading db from '%s'" % self.fn)
+        # the documents are rendered in another thread than the loading one
+        self.conn = sqlite3.connect(self.fn, check_same_thread=False)
+        db = CollScientiaeDB(collscientiae)
+        modules = self.conn.execute("SELECT ns, path, config FROM modules ORDER BY position")
+        for ns, path, config in modules.fetchall():
+            module = DocumentationModule(path, **json.loads(config))
+            docids = [_ for (_,) in self.conn.execute(
+                "SELECT docid FROM documents WHERE ns = ? ORDER BY rowid", (ns,))]
+            module._documents = LazyDocuments(self, ns, docids)
+            for docid in docids:
+                node = module.tree
+                for level in docid.split("."):
+                    node = node[level]
+            for path, config in self.conn.execute("SELECT path, config FROM nodes WHERE ns = ?", (ns,)):
+                node = module.tree
+                for level in path.split("."):
+                    node = node[level]
+                node.update(json.loads(config))
+            db.register_module(module)
+
+        db.backlinks = LazyTable(self, "backlinks", ["ns", "docid"], ["src_ns", "src_docid"])
+        db.knowls = LazyTable(self, "knowls", ["ns", "docid"], ["src_ns", "src_docid"])
+        db.forwardlinks = LazyTable(self, "links", ["src_ns", "src_docid"], ["ns", "docid"],
+                                    doc_keys=True)
+        db.hashtags = LazyTable(self, "hashtags", ["hashtag"], ["ns", "docid"])
+        return db
+
+    def info(self):
+        return dict(self.conn.execute("SELECT key, value FROM info"))
+
+    @staticmethod
+    def read_info(fn):
+        """
+        The "info" table of the database file `fn`, empty if it does not exist or is invalid.
+        """
+        from os.path import exists
+        if not exists(fn):
+            return {}
+        conn = sqlite3.connect(fn)
+        try:
+            return dict(conn.execute("SELECT key, value FROM info"))
+        except sqlite3.Error:
+            return {}
+        finally:
+            conn.close()
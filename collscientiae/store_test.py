@@ -0,0 +1,30 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+from .db_test import FakeCollScientiae, make_db, make_doc
+from .store import SQLiteStore
+
+
+def test_store_roundtrip(tmpdir):
+    db = make_db(["alpha", "beta"])
+    a = make_doc(db, "alpha", "a", "A")
+    make_doc(db, "beta", "b.c", "BC")
+    db.register_knowl("beta", "b.c", a)
+    db.register_hashtag("tag", a)
+    db.resolve_forwardlinks()
+    fn = str(tmpdir.join("db.sqlite"))
+    SQLiteStore(fn).save(db, doc_root_hash="abc")
+
+    store = SQLiteStore(fn)
+    db2 = store.load(FakeCollScientiae())
+    assert store.info() == {"doc_root_hash": "abc"}
+    assert list(db2.modules) == ["alpha", "beta"]
+    assert "b" in db2.modules["beta"].tree
+    # nothing is read yet
+    assert store.documents == {}
+    assert [d.title for d in db2.backlinks[("beta", "b.c")]] == ["A"]
+    a2 = db2.modules["alpha"]["a"]
+    assert [d.docid for d in db2.forwardlinks[a2]] == ["b.c"]
+    assert db2.hashtags["tag"] == {a2}
+    assert list(db2.knowls.keys()) == [("beta", "b.c")]
+    assert db2.backlinks[("alpha", "a")] == set()
@@ -26,12 +26,25 @@ def indexsort(idx):
     return idx
 
 
-def get_creation_date():
+def ensure_dir(path):
+    """
+    Creates the directory, if it does not exist yet, and returns its path.
+    """
+    from os import makedirs
+    from os.path import isdir
+    if not isdir(path):
+        makedirs(path)
+    return path
+
+
+def get_creation_date(timestamp=None):
     """
     This must be UTC and ISO format, e.g. 2014-10-19T19:19:04
+
+    :param timestamp: seconds since the epoch, defaults to now
     """
     from datetime import datetime as dt
-    now = dt.utcnow()
+    now = dt.utcnow() if timestamp is None else dt.utcfromtimestamp(timestamp)
     now = now.replace(microsecond=0)
     return dt.isoformat(now)
 
@@ -70,6 +83,9 @@ class ColoredFormatter(logging.Formatter):
         msg = msg.replace("$RESET", ColoredFormatter.RESET_SEQ).replace(
             "$BOLD", ColoredFormatter.BOLD_SEQ)
         logging.Formatter.__init__(self, fmt=msg)
+        # colorized level name and color of the message for each level, computed only once
+        self.levels = dict((name, (self.colorize(name, col, True), ColoredFormatter.COLOR_SEQ % (30 + col)))
+                           for name, col in ColoredFormatter.COLORS.items())
 
     @staticmethod
     def colorize(string, color, bold=False):
@@ -80,43 +96,97 @@ class ColoredFormatter(logging.Formatter):
         return string
 
     def format(self, record):
+        """
+        Formats the record without modifying it, such that other handlers are not affected.
+        """
+        message = record.getMessage()
         levelname = record.levelname
-        if levelname in ColoredFormatter.COLORS:
-            col = ColoredFormatter.COLORS[levelname]
-            record.name = self.colorize(record.name, col, True)
-            record.lineno = self.colorize(record.lineno, col, True)
-            record.levelname = self.colorize(levelname, col, True)
-            record.msg = self.colorize(record.msg, col)
-        return logging.Formatter.format(self, record)
+        if levelname in self.levels:
+            levelname, color = self.levels[levelname]
+            message = "%-20s" % (color + message + ColoredFormatter.RESET_SEQ)
+        line = self._fmt % {"elapsed": record.elapsed, "where": record.where,
+                            "levelname": levelname, "message": message}
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
 
 
 def create_logger(level=logging.DEBUG):
+    """
+    The logger of this package. Its filter and handler are only added once,
+    even if this is called for every :class:`.CollScientiae` instance.
+    """
     logger = logging.getLogger("collscientiae")
-    logger.addFilter(CollScientiaLoggingFilter())
     logger.setLevel(level)
-    logger_sh = logging.StreamHandler()
-    logger_sh.setLevel(level)
-    logger_sh.setFormatter(ColoredFormatter())
-    logger.addHandler(logger_sh)
+    if not any(isinstance(_, CollScientiaLoggingFilter) for _ in logger.filters):
+        logger.addFilter(CollScientiaLoggingFilter())
+    for handler in logger.handlers:
+        if isinstance(handler.formatter, ColoredFormatter):
+            handler.setLevel(level)
+            break
+    else:
+        logger_sh = logging.StreamHandler()
+        logger_sh.setLevel(level)
+        logger_sh.setFormatter(ColoredFormatter())
+        logger.addHandler(logger_sh)
     return logger
 
 
+try:
+    from yaml import CSafeLoader as YAMLLoader
+except ImportError:
+    from yaml import SafeLoader as YAMLLoader
+
+# maps (path, all) to (mtime, size, parsed data), see :func:`get_yaml`
+_yaml_cache = {}
+# accumulated statistics about config parsing, see :func:`yaml_stats`
+_yaml_stats = {"files": 0, "hits": 0, "time": 0.0}
+
+
+def yaml_stats():
+    """
+    Statistics about all calls of :func:`get_yaml` so far:
+    number of parsed `files`, cache `hits` and the total `time` in seconds.
+    """
+    return dict(_yaml_stats)
+
+
 def get_yamls(path):
     return get_yaml(path, all=True)
 
 
 def get_yaml(path, all=False):
+    """
+    Safely loads the YAML file at `path`, using the libyaml based loader if available.
+    Results are cached per path and only parsed again if the file's mtime or size changed.
+    Each call returns a fresh copy, so callers are free to modify it.
+
+    :param all: if True, all documents in the stream are returned as a list
+    """
     import yaml
-    # import codecs
-    # stream = codecs.open(path, "r", "utf8")
-    stream = open(path, "r")
-    if all:
-        return yaml.load_all(stream)
+    from os import stat
+    from copy import deepcopy
+    start = time()
+    st = stat(path)
+    key = (path, all)
+    cached = _yaml_cache.get(key)
+    if cached is not None and cached[:2] == (st.st_mtime, st.st_size):
+        _yaml_stats["hits"] += 1
+        data = cached[2]
     else:
-        return yaml.load(stream)
+        with open(path, "rb") as stream:
+            if all:
+                data = list(yaml.load_all(stream, Loader=YAMLLoader))
+            else:
+                data = yaml.load(stream, Loader=YAMLLoader)
+        _yaml_cache[key] = (st.st_mtime, st.st_size, data)
+        _yaml_stats["files"] += 1
+    data = deepcopy(data)
+    _yaml_stats["time"] += time() - start
+    return data
 
 
 def get_markdown(path):
     import codecs
-    stream = codecs.open(path, "r", "utf8")
-    return stream.read()
+    with codecs.open(path, "r", "utf8") as stream:
+        return stream.read()
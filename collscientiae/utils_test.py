@@ -0,0 +1,36 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+from .utils import get_yaml, get_yamls, yaml_stats
+
+
+def test_get_yaml_cached(tmpdir):
+    fn = tmpdir.join("config.yaml")
+    fn.write("name: test\nlist: [1, 2]\n")
+    c1 = get_yaml(str(fn))
+    assert c1 == {"name": "test", "list": [1, 2]}
+    hits = yaml_stats()["hits"]
+    # modifying the result must not leak into the cache
+    c1["list"].append(3)
+    assert get_yaml(str(fn)) == {"name": "test", "list": [1, 2]}
+    assert yaml_stats()["hits"] == hits + 1
+
+
+def test_get_yaml_modified(tmpdir):
+    fn = tmpdir.join("config.yaml")
+    fn.write("a: 1\n")
+    assert get_yaml(str(fn)) == {"a": 1}
+    fn.write("a: 22\n")
+    assert get_yaml(str(fn)) == {"a": 22}
+
+
+def test_get_yamls(tmpdir):
+    fn = tmpdir.join("multi.yaml")
+    fn.write("a: 1\n---\nb: 2\n")
+    assert get_yamls(str(fn)) == [{"a": 1}, {"b": 2}]
+
+
+def test_create_logger_once():
+    from .utils import create_logger
+    handlers = len(create_logger().handlers)
+    assert len(create_logger().handlers) == handlers
@@ -1,4 +1,4 @@
-from distutils.core import setup
+from setuptools import setup
 from collscientiae import __version__
 r"""
 CollScientiae -- Collection of Knowledge
@@ -9,7 +9,9 @@ setup(
     name='collscientiae',
     version=__version__,
     packages=['collscientiae'],
-    test_suite='nose.collector',
+    entry_points={
+        'console_scripts': ['collscientiae = collscientiae.cli:main'],
+    },
     url='',
     license='LICENSE.txt',
     author='Harald Schilly',
@@ -18,6 +20,14 @@ setup(
     'an advanced system for building modularized documentations',
     long_description=__doc__,
     install_requires=open("requirements.txt").readlines(),
+    extras_require={
+        'images': ['Pillow'],
+        'math': ['latex2mathml'],
+        'related': ['numpy'],
+        'highlight': ['Pygments'],
+        'assets': ['rjsmin'],
+        'test': ['pytest', 'pytest-cov'],
+    },
     classifiers=[
         'License :: OSI Approved :: BSD License',
         'Operating System :: OS Independent',